@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 the Pockets team, see AUTHORS.
+# Licensed under the BSD License, see LICENSE for details.
+
+"""
+Benchmarks :func:`pockets.collections.groupify` across worker processes.
+
+Prints the wall clock time of serial `groupify` followed by the time and
+speedup of `groupify(..., executor=N)` for each number of worker processes
+from 1 up to the number of CPUs::
+
+    $ pip install -e .
+    $ python benchmarks/groupify_parallel.py --items 2000000
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import multiprocessing
+import random
+import time
+
+from pockets.collections import groupify
+
+
+def region(row):
+    return row[0]
+
+
+def product(row):
+    return row[1]
+
+
+def amount(row):
+    return row[2]
+
+
+def make_rows(count, seed=0):
+    rng = random.Random(seed)
+    return [
+        (rng.randrange(50), rng.randrange(1000), rng.random())
+        for _ in range(count)
+    ]
+
+
+def timed(func, *args, **kwargs):
+    start = time.time()
+    func(*args, **kwargs)
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=1000000)
+    parser.add_argument("--agg", default=None)
+    parser.add_argument(
+        "--max-workers", type=int, default=multiprocessing.cpu_count()
+    )
+    args = parser.parse_args()
+
+    rows = make_rows(args.items)
+    keys = [region, product]
+    serial = timed(groupify, rows, keys, amount, args.agg)
+    print("serial      {0:8.3f}s".format(serial))
+    for workers in range(1, args.max_workers + 1):
+        elapsed = timed(
+            groupify, rows, keys, amount, args.agg, executor=workers
+        )
+        print(
+            "{0:2d} workers  {1:8.3f}s  {2:5.2f}x".format(
+                workers, elapsed, serial / elapsed
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
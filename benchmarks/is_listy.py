@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2018 the Pockets team, see AUTHORS.
+# Licensed under the BSD License, see LICENSE for details.
+
+"""
+Benchmarks :func:`pockets.collections.is_listy` and its callers.
+
+Prints the time per call, in nanoseconds, of `is_listy`, `is_mappy`,
+`listify`, and `mappify` for a few common types, or "-" where a type is
+rejected::
+
+    $ pip install -e .
+    $ python benchmarks/is_listy.py
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import timeit
+from collections import OrderedDict, deque
+
+from pockets.collections import is_listy, is_mappy, listify, mappify
+
+
+VALUES = OrderedDict(
+    [
+        ("list", [1, 2]),
+        ("tuple", (1, 2)),
+        ("set", {1, 2}),
+        ("deque", deque([1, 2])),
+        ("dict", {1: 2}),
+        ("OrderedDict", OrderedDict([(1, 2)])),
+        ("str", "ab"),
+        ("int", 1),
+        ("None", None),
+    ]
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--number", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    funcs = [is_listy, is_mappy, listify, mappify]
+    print(
+        "{0:12}".format("")
+        + "".join("{0:>10}".format(f.__name__) for f in funcs)
+    )
+    for name, value in VALUES.items():
+        row = []
+        for func in funcs:
+            try:
+                func(value)
+            except TypeError:
+                row.append(None)
+                continue
+            best = min(
+                timeit.repeat(
+                    lambda: func(value),
+                    number=args.number,
+                    repeat=args.repeat,
+                )
+            )
+            row.append(best / args.number * 1e9)
+        print(
+            "{0:12}".format(name)
+            + "".join(
+                "{0:>10}".format("-") if ns is None else "{0:10.0f}".format(ns)
+                for ns in row
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -6,35 +6,120 @@
 
 from __future__ import absolute_import, print_function
 
+import functools
+import heapq
+import math
+import operator
+import os
+import sys
+import tempfile
+import threading
+import time
+from abc import ABCMeta
+from array import array
 from collections import defaultdict
 from inspect import isclass
+from itertools import chain, count, groupby, islice, repeat
 
 try:
-    from collections.abc import Iterable, Mapping, Sized
+    from collections.abc import (
+        Iterable,
+        Mapping,
+        MutableMapping,
+        Sequence,
+        Sized,
+    )
 except ImportError:
-    from collections import Iterable, Mapping, Sized
+    from collections import (
+        Iterable,
+        Mapping,
+        MutableMapping,
+        Sequence,
+        Sized,
+    )
 try:
     from collections import OrderedDict
 except ImportError:
     OrderedDict = dict
 
 import six
+from six.moves import cPickle as pickle
+from six.moves import map, range
+
+
+# As of Python 3.7 plain dicts preserve insertion order, and they are much
+# smaller than OrderedDicts.
+_ordereddict = dict if sys.version_info >= (3, 7) else OrderedDict
+
+# The array typecode of 64-bit ints, which Python 2 arrays lack
+try:
+    array("q")
+    _INDEX_TYPECODE = "q"
+except ValueError:  # pragma: no cover
+    _INDEX_TYPECODE = "l"
+
+# Changes whenever a class is registered with any ABC, which may change the
+# result of isinstance checks against ABCs, e.g. `Sized` or `Mapping`
+try:
+    from abc import get_cache_token as _abc_cache_token
+except ImportError:  # pragma: no cover
+
+    def _abc_cache_token():
+        return ABCMeta._abc_invalidation_counter
 
 
 __all__ = [
+    "GroupAccumulator",
+    "ItemIndex",
+    "asynckeydefaultdict",
+    "batchkeydefaultdict",
+    "boundedkeydefaultdict",
+    "chunkify",
+    "concurrentkeydefaultdict",
+    "deepmerge",
+    "flatten",
+    "freeze",
+    "frozendict",
+    "frozenlist",
     "groupify",
+    "groupify_columns",
+    "igroupify",
+    "indexify",
     "keydefaultdict",
+    "keygetter",
+    "lazylist",
     "is_listy",
+    "iuniquify",
     "listify",
+    "listview",
     "is_mappy",
     "mappify",
     "nesteddefaultdict",
+    "nestedview",
+    "paddedview",
+    "pathtree",
+    "persistentkeydefaultdict",
+    "persistentmap",
     "readable_join",
+    "register_listy",
+    "register_mappy",
+    "sliceview",
+    "thaw",
+    "unflatten",
     "uniquify",
 ]
 
 
-def groupify(items, keys, val_key=None):
+def groupify(
+    items,
+    keys,
+    val_key=None,
+    agg=None,
+    executor=None,
+    chunksize=None,
+    flat=False,
+    indices=False,
+):
     """
     Groups a list of items into nested OrderedDicts based on the given keys.
 
@@ -150,283 +235,4054 @@ def groupify(items, keys, val_key=None):
         "Reset database"
       ]
     }
+    >>>
+    >>> ex(groupify(reminders, ['when', 'where'], agg='count'))
+    {
+      "Fri": {
+        "Home": 1,
+        "Work": 1
+      },
+      "Sat": {
+        "Home": 2
+      },
+      "Sun": {
+        "Home": 1,
+        "Work": 1
+      }
+    }
 
     Args:
         items (list): The list of items to arrange in groups.
         keys (str|callable|list): The key or keys that should be used to group
             `items`. If multiple keys are given, then each will correspond to
-            an additional level of nesting in the order they are given.
+            an additional level of nesting in the order they are given. Each
+            key may be anything accepted by `keygetter`, so dict items,
+            dotted paths, and composite keys are supported:
+
+            >>> records = [
+            ...   {'id': 1, 'owner': {'name': 'Rob', 'zip': '94610'}},
+            ...   {'id': 2, 'owner': {'name': 'Ivan', 'zip': '94610'}},
+            ...   {'id': 3, 'owner': {'name': 'Rob', 'zip': '10001'}}]
+            >>>
+            >>> ex(groupify(records, 'owner.zip', 'id'))
+            {
+              "10001": [
+                3
+              ],
+              "94610": [
+                1,
+                2
+              ]
+            }
+
         val_key (str|callable): A key or callable used to generate the leaf
             values in the nested OrderedDicts. If `val_key` is `None`, then
             the item itself is used. Defaults to `None`.
+        agg (str|callable): If given, the leaf values of each group are
+            folded into a single value as they are grouped, and no leaf lists
+            are built. May be one of the built-in reducers "count", "sum",
+            "min", "max", "mean", "first", or "last", or a binary function
+            that combines the value accumulated so far with the next leaf
+            value, like the function passed to `functools.reduce`:
+
+            >>> ex(groupify(reminders, 'when', 'what', agg='last'))
+            {
+              "Fri": "Feed Ivan",
+              "Sat": "Play Zelda",
+              "Sun": "Reset database"
+            }
+            >>> ex(groupify(reminders, 'when', 'what',
+            ...             agg=lambda x, y: x + ' & ' + y))
+            {
+              "Fri": "Eat cereal & Feed Ivan",
+              "Sat": "Sleep in & Play Zelda",
+              "Sun": "Sleep in & Reset database"
+            }
+
+            When `executor` is given, the values accumulated for each chunk
+            are combined with the same function, so it must be associative,
+            like ``+`` and unlike ``-``. Defaults to `None`.
+        executor (concurrent.futures.Executor|int): If given, `items` are
+            split into chunks which are grouped in parallel by `executor`,
+            and the groups of each chunk are then merged in order. The
+            result is the same as grouping `items` serially: groups keep the
+            order in which they are first seen, and items keep their order
+            within each group. This only holds for a custom `agg` if it is
+            associative, see above. If `executor` is an int, a
+            `ProcessPoolExecutor` with that many worker processes is used
+            for the duration of the call. Defaults to `None`.
+
+            Note:
+                To use a `ProcessPoolExecutor`, `items`, `keys`, `val_key`,
+                `agg`, and the resulting groups must all be picklable, so
+                callables must be defined at module level, not as lambdas.
+
+        chunksize (int): The number of items in each chunk when `executor`
+            is given. Defaults to splitting `items` into four chunks per
+            worker process, or into chunks of 10000 items if the number of
+            `items` is unknown.
+        flat (bool): If True, return a single insertion-ordered dict keyed by
+            a tuple of the values of every key, instead of nesting one level
+            per key. This avoids allocating an OrderedDict for every
+            intermediate group. Use `nestedview` to access the flat groups
+            as if they were nested:
+
+            >>> groups = groupify(reminders, ['when', 'where'], 'what',
+            ...                   flat=True)
+            >>> groups[('Sat', 'Home')]
+            ['Sleep in', 'Play Zelda']
+            >>> nestedview(groups)['Sat']['Home']
+            ['Sleep in', 'Play Zelda']
+
+            Defaults to False.
+        indices (bool): If True, group the positions of `items` rather than
+            the items themselves, and store the positions of each group in a
+            compact `array.array` of 64-bit ints instead of a list. Each
+            position takes 8 bytes, and `items` are not kept alive by the
+            groups. The positions can be used to index `items`, or the
+            columns of a table, later on:
+
+            >>> groups = groupify(reminders, 'when', indices=True)
+            >>> groups['Sat']
+            array('q', [2, 3])
+            >>> [reminders[i].what for i in groups['Sat']]
+            ['Sleep in', 'Play Zelda']
+
+            An array can be wrapped by NumPy without copying it, using
+            ``numpy.frombuffer(groups['Sat'], dtype=numpy.int64)``. If `agg`
+            is given, the positions are reduced instead of being stored.
+            Defaults to False.
 
     Returns:
-        OrderedDict: Nested OrderedDicts with `items` grouped by `keys`.
+        OrderedDict: Nested OrderedDicts with `items` grouped by `keys`, or a
+        dict keyed by tuples if `flat` is True.
+
+    Raises:
+        ValueError: If `agg` is not a built-in reducer or a callable, or if
+            both `indices` and `val_key` are given.
 
     """  # noqa: E501
 
+    keys = listify(keys)
     if not keys:
         return items
-    keys = listify(keys)
-    last_key = keys[-1]
-    is_callable = callable(val_key)
-    groupified = OrderedDict()
-    for item in items:
-        current = groupified
-        for key in keys:
-            attr = key(item) if callable(key) else getattr(item, key)
-            if attr not in current:
-                current[attr] = [] if key is last_key else OrderedDict()
-            current = current[attr]
-        if val_key:
-            value = val_key(item) if is_callable else getattr(item, val_key)
-        else:
-            value = item
-        current.append(value)
+    if indices and val_key not in (None, ""):
+        raise ValueError(
+            "Unable to groupify indices with val_key {0!r}".format(val_key),
+            val_key,
+        )
+    reducer = _reducer(agg)
+    if executor is None:
+        groupified = _groupify_chunk(
+            items, keys, val_key, agg, flat, 0 if indices else None
+        )
+    else:
+        groupified = _groupify_parallel(
+            items, keys, val_key, agg, flat, indices, executor, chunksize
+        )
+    if reducer and reducer.final:
+        _finalize_groups(groupified, 1 if flat else len(keys), reducer.final)
     return groupified
 
 
-class keydefaultdict(defaultdict):
-    """
-    A defaultdict that passes the missed key to the factory function.
+def _groupify_parallel(
+    items, keys, val_key, agg, flat, indices, executor, chunksize
+):
+    """Group chunks of `items` with `executor` and merge the results."""
+    if isinstance(executor, six.integer_types):
+        from concurrent.futures import ProcessPoolExecutor
 
-    >>> def echo_factory(missing_key):
-    ...     return missing_key
-    ...
-    >>> d = keydefaultdict(echo_factory)
-    >>> d['Hello World']
-    'Hello World'
-    >>> d['Hello World'] = 'Goodbye'
-    >>> d['Hello World']
-    'Goodbye'
+        with ProcessPoolExecutor(max_workers=executor) as pool:
+            return _groupify_parallel(
+                items, keys, val_key, agg, flat, indices, pool, chunksize
+            )
 
-    """
+    if not chunksize:
+        if isinstance(items, Sized):
+            workers = getattr(executor, "_max_workers", None) or 1
+            chunksize = max(1, -(-len(items) // (4 * workers)))
+        else:
+            chunksize = 10000
+    chunks = iter(lambda it=iter(items): list(islice(it, chunksize)), [])
 
-    def __missing__(self, key):
-        if self.default_factory is None:
-            raise KeyError(key)
+    reducer = _reducer(agg)
+    depth = 1 if flat else len(keys)
+    groupified = None
+    shards = executor.map(
+        _groupify_chunk,
+        chunks,
+        repeat(keys),
+        repeat(val_key),
+        repeat(agg),
+        repeat(flat),
+        count(0, chunksize) if indices else repeat(None),
+    )
+    for shard in shards:
+        if groupified is None:
+            groupified = shard
         else:
-            ret = self[key] = self.default_factory(key)
-            return ret
+            _merge_groups(groupified, shard, depth, reducer)
+    if groupified is None:
+        return _ordereddict() if flat else OrderedDict()
+    return groupified
 
 
-def is_listy(x):
+def _groupify_chunk(items, keys, val_key, agg, flat, start=None):
     """
-    Return True if `x` is "listy", i.e. a list-like object.
+    Group one chunk of items, see `groupify`.
 
-    "Listy" is defined as a sized iterable which is neither a map nor a string:
+    If `start` is not `None`, the positions of the items are grouped instead
+    of their values, counting up from `start`.
+    """
+    reducer = _reducer(agg)
+    new_leaf = None
+    if start is not None:
+        # next(counter, item) never returns the default `item`, because the
+        # counter never runs out, so this is a C-level callable that ignores
+        # its argument and returns start, start + 1, start + 2, ...
+        val_key = functools.partial(next, count(start))
+        if not reducer:
+            new_leaf = functools.partial(array, _INDEX_TYPECODE)
+    return _groupify_into(
+        _ordereddict() if flat else OrderedDict(),
+        items,
+        _groupify_getters(keys, val_key, flat),
+        reducer,
+        new_leaf,
+    )
 
-    >>> is_listy(['a', 'b'])
-    True
-    >>> is_listy(set())
-    True
-    >>> is_listy(iter(['a', 'b']))
-    False
-    >>> is_listy({'a': 'b'})
-    False
-    >>> is_listy('a regular string')
-    False
 
-    Note:
-        Iterables and generators fail the "listy" test because they
-        are not sized.
+def _groupify_into(groupified, items, getters, reducer=None, new_leaf=None):
+    """
+    Group `items` into the nested OrderedDicts of `groupified`.
 
-    Args:
-        x (any value): The object to test.
+    Leaf values are reduced by `reducer` if it is given. Otherwise they are
+    stored in lists, or in containers created by calling `new_leaf` with a
+    list of the first value.
+    """
+    if reducer:
+        init, step = reducer.init, reducer.step
+    item_type = None
+    for item in items:
+        if type(item) is not item_type:
+            item_type = type(item)
+            parent_getters, get_key, get_value = getters[item_type]
+        current = groupified
+        for getter in parent_getters:
+            attr = getter(item)
+            if attr not in current:
+                current[attr] = OrderedDict()
+            current = current[attr]
+        attr = get_key(item)
+        if reducer:
+            if attr in current:
+                current[attr] = step(current[attr], get_value(item))
+            else:
+                current[attr] = init(get_value(item))
+        elif attr in current:
+            current[attr].append(get_value(item))
+        elif new_leaf:
+            current[attr] = new_leaf([get_value(item)])
+        else:
+            current[attr] = [get_value(item)]
+    return groupified
 
-    Returns:
-        bool: True if `x` is "listy", False otherwise.
 
+def _groupify_getters(keys, val_key, flat=False):
     """
-    return (
-        isinstance(x, Sized)
-        and isinstance(x, Iterable)
-        and not isinstance(x, (Mapping, type(b"")))
-        and not isinstance(x, six.string_types)
-    )
+    Return a map from item types to the getters used by `_groupify_into`.
 
-
-def listify(x, minlen=0, default=None, cls=None):
+    Each item type maps to a tuple of the getters of every key but the last,
+    the getter of the last key, and the getter of `val_key`, all compiled
+    specifically for that type of item. If `flat` is True, there is a single
+    getter for a tuple of every key.
     """
-    Return a listified version of `x`.
 
-    If `x` is a non-string iterable, it is wrapped in a list; otherwise
-    a list is returned with `x` as its only element. If `x` is `None`, an
-    empty list is returned.
+    def compile_getters(item_type):
+        get_value = _keygetter(None if val_key == "" else val_key, item_type)
+        if flat:
+            get_key = _keygetter(list(keys), item_type)
+            return (), get_key, get_value
+        getters = [_keygetter(key, item_type) for key in keys]
+        return getters[:-1], getters[-1], get_value
 
-    >>> listify('a regular string')
-    ['a regular string']
-    >>> listify(tuple(['a', 'b', 'c']))
-    ['a', 'b', 'c']
-    >>> listify({'a': 'A'})
-    [{'a': 'A'}]
-    >>> listify(None)
-    []
+    return keydefaultdict(compile_getters)
 
-    Note:
-        Not guaranteed to return a copy of `x`. If `x` is already a list and
-        `cls` is not specified, then `x` itself is returned.
 
-    Args:
-        x (any value): Value to listify.
+def _merge_groups(groupified, other, depth, reducer=None):
+    """Merge nested `other` groups, `depth` levels deep, into `groupified`."""
+    for key, value in other.items():
+        if depth > 1:
+            if key not in groupified:
+                groupified[key] = OrderedDict()
+            _merge_groups(groupified[key], value, depth - 1, reducer)
+        elif reducer:
+            if key in groupified:
+                value = reducer.combine(groupified[key], value)
+            groupified[key] = value
+        elif key in groupified:
+            groupified[key].extend(value)
+        else:
+            groupified[key] = value[:]
+    return groupified
 
-        minlen (int): Minimum length of the returned list. If the returned
-            list would be shorter than `minlen` it is padded with values from
-            `default`. Defaults to 0.
 
-            >>> listify([], minlen=0)
-            []
-            >>> listify([], minlen=1)
-            [None]
-            >>> listify('item', minlen=3)
-            ['item', None, None]
+def _finalize_groups(groupified, depth, final):
+    """Replace the leaf values of `groupified` with `final(leaf)`."""
+    for key, value in groupified.items():
+        if depth > 1:
+            _finalize_groups(value, depth - 1, final)
+        else:
+            groupified[key] = final(value)
+    return groupified
 
-        default (any value): Value that should be used to pad the list if it
-            would be shorter than `minlen`:
 
-            >>> listify([], minlen=1, default='PADDING')
-            ['PADDING']
-            >>> listify('item', minlen=3, default='PADDING')
-            ['item', 'PADDING', 'PADDING']
+class _Reducer(object):
+    """
+    Folds the leaf values of a group into a single value.
 
-        cls (class or callable): Instead of wrapping `x` in a list, wrap it
-            in an instance of `cls`. `cls` should accept an iterable object
-            as its single parameter when called:
+    Attributes:
+        init (callable): Converts the first value of a group into the
+            initial accumulated value.
+        step (callable): Folds the next value of a group into the value
+            accumulated so far.
+        combine (callable): Combines two accumulated values of the same
+            group, e.g. when merging groups.
+        final (callable): Converts an accumulated value into the result. If
+            `None`, the accumulated value is the result.
 
-            >>> from collections import deque
-            >>> listify(['a', 'b', 'c'], cls=deque)
-            deque(['a', 'b', 'c'])
+    """
 
-    Returns:
-        list or `cls`: A listified version of `x`.
+    __slots__ = ("init", "step", "combine", "final")
 
-    """
-    if x is None:
-        x = []
-    elif not isinstance(x, list):
-        x = list(x) if is_listy(x) else [x]
+    def __init__(self, init, step, combine=None, final=None):
+        self.init = init
+        self.step = step
+        self.combine = combine or step
+        self.final = final
 
-    if minlen and len(x) < minlen:
-        x.extend([default for i in range(minlen - len(x))])
 
-    if cls and not (isclass(cls) and issubclass(type(x), cls)):
-        x = cls(x)
+def _identity(x):
     return x
 
 
-def is_mappy(x):
+_REDUCERS = {
+    "count": _Reducer(lambda v: 1, lambda a, v: a + 1, operator.add),
+    "sum": _Reducer(_identity, operator.add),
+    "min": _Reducer(_identity, min),
+    "max": _Reducer(_identity, max),
+    "mean": _Reducer(
+        lambda v: (v, 1),
+        lambda a, v: (a[0] + v, a[1] + 1),
+        lambda a, b: (a[0] + b[0], a[1] + b[1]),
+        lambda a: operator.truediv(a[0], a[1]),
+    ),
+    "first": _Reducer(_identity, lambda a, v: a),
+    "last": _Reducer(_identity, lambda a, v: v),
+}
+
+
+def _reducer(agg):
+    """Return the `_Reducer` for `agg`, or `None` if `agg` is `None`."""
+    if agg is None or isinstance(agg, _Reducer):
+        return agg
+    if isinstance(agg, six.string_types) and agg in _REDUCERS:
+        return _REDUCERS[agg]
+    if callable(agg):
+        return _Reducer(_identity, agg)
+    raise ValueError(
+        "Unknown reducer {0!r}, expected a callable or one of: {1}".format(
+            agg, ", ".join(sorted(_REDUCERS))
+        ),
+        agg,
+    )
+
+
+class GroupAccumulator(object):
     """
-    Return True if `x` is "mappy", i.e. a map-like object.
+    Incrementally groups items into nested OrderedDicts, just like `groupify`.
 
-    "Mappy" is defined as any instance of `collections.Mapping`:
+    Items can be added one at a time or in batches, and the groups are
+    updated in place rather than rebuilt from scratch:
 
-    >>> is_mappy({'a': 'b'})
-    True
-    >>> from collections import defaultdict
-    >>> is_mappy(defaultdict(list))
-    True
-    >>> is_mappy('a regular string')
-    False
-    >>> is_mappy(['a', 'b'])
-    False
-    >>> is_listy(iter({'a': 'b'}))
-    False
+    >>> from json import dumps
+    >>> from collections import namedtuple
+    >>>
+    >>> Reminder = namedtuple('Reminder', ['when', 'where', 'what'])
+    >>>
+    >>> groups = GroupAccumulator(['when', 'where'], 'what')
+    >>> groups.add(Reminder('Fri', 'Home', 'Eat cereal'))
+    >>> groups.extend([
+    ...   Reminder('Fri', 'Work', 'Feed Ivan'),
+    ...   Reminder('Sat', 'Home', 'Sleep in')])
+    >>> print(dumps(groups.snapshot()))
+    {"Fri": {"Home": ["Eat cereal"], "Work": ["Feed Ivan"]}, "Sat": {...}}
 
-    Note:
-        Iterables and generators fail the "mappy" test.
+    Accumulators built from separate batches can be merged, e.g. as the
+    reduce step of a map/reduce job:
+
+    >>> more_groups = GroupAccumulator(['when', 'where'], 'what')
+    >>> more_groups.add(Reminder('Sat', 'Home', 'Play Zelda'))
+    >>> print(dumps(groups.merge(more_groups).snapshot()['Sat']))
+    {"Home": ["Sleep in", "Play Zelda"]}
 
     Args:
-        x (any value): The object to test.
+        keys (str|callable|list): The key or keys that should be used to group
+            items, see `groupify`.
+        val_key (str|callable): A key or callable used to generate the leaf
+            values, see `groupify`. Defaults to `None`.
+        items (iterable): Initial items to add to the groups. Defaults to
+            `None`.
+        agg (str|callable): A reducer used to fold the leaf values of each
+            group into a single value, see `groupify`. A custom `agg` must
+            be associative for `merge` to give the same result as adding
+            every item to one accumulator. Defaults to `None`.
 
-    Returns:
-        bool: True if `x` is "mappy", False otherwise.
+    Raises:
+        ValueError: If no `keys` are given, or if `agg` is not a built-in
+            reducer or a callable.
 
     """
-    return isinstance(x, Mapping)
 
+    def __init__(self, keys, val_key=None, items=None, agg=None):
+        self.keys = listify(keys)
+        if not self.keys:
+            raise ValueError("Unable to group items without keys", keys)
+        self.val_key = val_key
+        self.agg = agg
+        self._getters = _groupify_getters(self.keys, val_key)
+        self._reducer = _reducer(agg)
+        self._groups = OrderedDict()
+        if items is not None:
+            self.extend(items)
 
-def mappify(x, default=True, cls=None):
-    """
-    Return a mappified version of `x`.
+    def add(self, item):
+        """
+        Add a single item to the groups.
 
-    If `x` is a string, it becomes the only key of the returned dict. If `x`
-    is a non-string iterable, the elements of `x` become keys in the returned
-    dict. The values of the returned dict are set to `default`. If `x` is
-    `None`, an empty dict is returned.
+        Args:
+            item (any value): The item to add.
 
-    If `x` is a map, it is returned directly.
+        """
+        _groupify_into(self._groups, [item], self._getters, self._reducer)
 
-    >>> mappify('a regular string')
-    {'a regular string': True}
-    >>> mappify(['a'])
-    {'a': True}
-    >>> mappify({'a': 'A'})
-    {'a': 'A'}
-    >>> mappify(None)
-    {}
+    def extend(self, items):
+        """
+        Add a batch of items to the groups.
 
-    Note:
-        Not guaranteed to return a copy of `x`. If `x` is already a map and
-        `cls` is not specified, then `x` itself is returned.
+        Args:
+            items (iterable): The items to add.
 
-    Args:
-        x (str, map, or iterable): Value to mappify.
+        """
+        _groupify_into(self._groups, items, self._getters, self._reducer)
 
-        default (any value): Value used to fill out missing values of the
-            returned dict.
+    def merge(self, other):
+        """
+        Merge the groups of another accumulator into this one.
 
-        cls (class or callable): Instead of wrapping `x` in a dict, wrap it
-            in an instance of `cls`. `cls` should accept a map object as
-            its single parameter when called:
+        Groups first seen in `other` are ordered after the groups of this
+        accumulator, and the items of `other` are appended to any group the
+        two accumulators have in common. If the accumulators use a reducer,
+        the values of any group they have in common are combined instead,
+        by calling a custom `agg` with the value of this accumulator and the
+        value of `other`, so it must be associative. `other` is left
+        unchanged.
 
-            >>> from collections import defaultdict
-            >>> mappify('a', cls=lambda x: defaultdict(None, x))
-            defaultdict(None, {'a': True})
+        Args:
+            other (GroupAccumulator): An accumulator with the same number of
+                `keys` as this one.
 
-    Returns:
-        dict or `cls`: A mappified version of `x`.
+        Returns:
+            GroupAccumulator: This accumulator, so calls can be chained or
+            passed to `functools.reduce`.
 
-    Raises:
-        TypeError: If `x` is not a map, iterable, or string.
+        Raises:
+            ValueError: If `other` has a different number of `keys`, or a
+                different `agg`.
 
-    """
-    if x is None:
-        x = {}
-    elif not isinstance(x, Mapping):
-        if isinstance(x, six.string_types):
-            x = {x: default}
-        elif isinstance(x, Iterable):
-            # If cls is specified, attempt to preserve the order of x, in
-            # case cls is also a class that preserves order.
-            arg = [(v, default) for v in x]
-            x = OrderedDict(arg) if cls else dict(arg)
-        else:
-            raise TypeError(
-                "Unable to mappify non-mappy {0}".format(type(x)), x
+        """
+        if len(self.keys) != len(other.keys):
+            raise ValueError(
+                "Unable to merge groups nested {0} levels deep with groups "
+                "nested {1} levels deep".format(
+                    len(self.keys), len(other.keys)
+                ),
+                other,
             )
+        if self.agg != other.agg:
+            raise ValueError(
+                "Unable to merge groups reduced by {0!r} with groups reduced "
+                "by {1!r}".format(self.agg, other.agg),
+                other,
+            )
+        _merge_groups(
+            self._groups, other._groups, len(self.keys), self._reducer
+        )
+        return self
 
-    if cls and not (isclass(cls) and issubclass(type(x), cls)):
-        x = cls(x)
-    return x
+    def snapshot(self):
+        """
+        Return a copy of the groups, in the same shape `groupify` returns.
 
+        Returns:
+            OrderedDict: Nested OrderedDicts with all items added so far,
+            independent of any items added afterwards.
 
-def nesteddefaultdict():
+        """
+        depth = len(self.keys)
+        groups = _merge_groups(
+            OrderedDict(), self._groups, depth, self._reducer
+        )
+        if self._reducer and self._reducer.final:
+            _finalize_groups(groups, depth, self._reducer.final)
+        return groups
+
+
+class ItemIndex(object):
     """
-    A defaultdict that returns nested defaultdicts as the default value.
+    Indexes items by several keys at once, for fast lookups by any of them.
 
-    Each defaultdict returned as the default value will also return nested
-    defaultdicts, and so on.
+    Builds one hash index per key, so items can be looked up by the value of
+    any key, or by the values of several keys at once, without grouping them
+    again for each key. Items can be added and removed without rebuilding
+    the indexes:
 
-    >>> nested = nesteddefaultdict()
-    >>> nested_child = nested['New Key 1']
-    >>> nested_child
-    defaultdict(...)
-    >>> nested_grandchild = nested_child['New Key 2']
-    >>> nested_grandchild
-    defaultdict(...)
+    >>> from collections import namedtuple
+    >>>
+    >>> Reminder = namedtuple('Reminder', ['when', 'where', 'what'])
+    >>>
+    >>> index = ItemIndex(['when', 'where'], [
+    ...   Reminder('Fri', 'Home', 'Eat cereal'),
+    ...   Reminder('Fri', 'Work', 'Feed Ivan'),
+    ...   Reminder('Sat', 'Home', 'Sleep in')])
+    >>> [r.what for r in index.lookup('where', 'Home')]
+    ['Eat cereal', 'Sleep in']
+    >>> [r.what for r in index.query({'when': 'Fri', 'where': 'Home'})]
+    ['Eat cereal']
 
-    """
-    return defaultdict(nesteddefaultdict)
+    Items are returned in the order they were added. Items do not need to
+    be hashable, but the values of their keys do.
+
+    Args:
+        keys (str|callable|list): The key or keys to index items by, see
+            `groupify`. Each key is also its name in `lookup` and `query`.
+        items (iterable): Initial items to add. Defaults to `None`.
+
+    Raises:
+        ValueError: If no `keys` are given.
+
+    """
+
+    def __init__(self, keys, items=None):
+        self.keys = listify(keys)
+        if not self.keys:
+            raise ValueError("Unable to index items without keys", keys)
+        self._names = dict(
+            (self._name(key), i) for i, key in enumerate(self.keys)
+        )
+        self._getters = keydefaultdict(
+            lambda item_type: [_keygetter(k, item_type) for k in self.keys]
+        )
+        self._indexes = [{} for _ in self.keys]
+        self._items = _ordereddict()
+        self._ids = count()
+        if items is not None:
+            self.extend(items)
+
+    @staticmethod
+    def _name(key):
+        return tuple(key) if isinstance(key, list) else key
+
+    def _index(self, name):
+        """Return the index of the key called `name`."""
+        try:
+            return self._indexes[self._names[self._name(name)]]
+        except (KeyError, TypeError):
+            six.raise_from(
+                KeyError("Unknown key {0!r}".format(name), name), None
+            )
+
+    def add(self, item):
+        """
+        Add a single item to the indexes.
+
+        Args:
+            item (any value): The item to add.
+
+        Raises:
+            TypeError: If any of the key values of `item` is unhashable, in
+                which case none of the indexes are changed.
+
+        """
+        values = [get_key(item) for get_key in self._getters[type(item)]]
+        # Check every value before changing any index, so that an unhashable
+        # value can't leave `item` in some indexes but not others.
+        for value in values:
+            hash(value)
+        item_id = next(self._ids)
+        for index, value in zip(self._indexes, values):
+            if value in index:
+                index[value][item_id] = None
+            else:
+                index[value] = _ordereddict([(item_id, None)])
+        self._items[item_id] = item
+
+    def extend(self, items):
+        """
+        Add a batch of items to the indexes.
+
+        Args:
+            items (iterable): The items to add.
+
+        """
+        for item in items:
+            self.add(item)
+
+    def remove(self, item):
+        """
+        Remove the first occurrence of `item` from the indexes.
+
+        Args:
+            item (any value): The item to remove, or one equal to it.
+
+        Raises:
+            ValueError: If `item` is not in the indexes.
+
+        """
+        values = [get_key(item) for get_key in self._getters[type(item)]]
+        for item_id in self._indexes[0].get(values[0], ()):
+            candidate = self._items[item_id]
+            if candidate is item or candidate == item:
+                break
+        else:
+            raise ValueError("{0!r} is not indexed".format(item), item)
+        for index, value in zip(self._indexes, values):
+            ids = index[value]
+            del ids[item_id]
+            if not ids:
+                del index[value]
+        del self._items[item_id]
+
+    def lookup(self, name, value):
+        """
+        Return the items whose key called `name` has the value `value`.
+
+        Args:
+            name: One of the `keys` of the index.
+            value (any value): The value to look up.
+
+        Returns:
+            list: The matching items, in the order they were added.
+
+        Raises:
+            KeyError: If `name` is not one of the `keys`.
+
+        """
+        ids = self._index(name).get(value, ())
+        return [self._items[item_id] for item_id in ids]
+
+    def query(self, criteria):
+        """
+        Return the items matching every value in `criteria`.
+
+        Only the ids of the items with the rarest of the values are checked
+        against the other indexes, so a query takes time proportional to the
+        number of those items.
+
+        Args:
+            criteria (Mapping): The values to look up, keyed by the names of
+                `keys`.
+
+        Returns:
+            list: The matching items, in the order they were added.
+
+        Raises:
+            KeyError: If a name in `criteria` is not one of the `keys`.
+
+        """
+        if not criteria:
+            return list(self._items.values())
+        matches = [
+            self._index(name).get(value, {})
+            for name, value in criteria.items()
+        ]
+        matches.sort(key=len)
+        rarest, others = matches[0], matches[1:]
+        return [
+            self._items[item_id]
+            for item_id in rarest
+            if all(item_id in ids for ids in others)
+        ]
+
+    def values(self, name):
+        """
+        Return the distinct values of the key called `name`.
+
+        Raises:
+            KeyError: If `name` is not one of the `keys`.
+
+        """
+        return list(self._index(name))
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items.values())
+
+
+def indexify(items, keys):
+    """
+    Index items by several keys at once, for fast lookups by any of them.
+
+    >>> index = indexify([{'a': 1, 'b': 'x'}, {'a': 2, 'b': 'x'}], ['a', 'b'])
+    >>> index.lookup('b', 'x')
+    [{'a': 1, 'b': 'x'}, {'a': 2, 'b': 'x'}]
+    >>> index.query({'a': 2, 'b': 'x'})
+    [{'a': 2, 'b': 'x'}]
+
+    Args:
+        items (iterable): The items to index.
+        keys (str|callable|list): The key or keys to index items by, see
+            `groupify`.
+
+    Returns:
+        ItemIndex: The indexed items.
+
+    Raises:
+        ValueError: If no `keys` are given.
+
+    """
+    return ItemIndex(keys, items)
+
+
+def igroupify(
+    items,
+    keys,
+    val_key=None,
+    buffersize=100000,
+    tempdir=None,
+    presorted=False,
+    validate=False,
+):
+    """
+    Groups items from an iterable of any size, using bounded memory.
+
+    Unlike `groupify`, which holds every group in memory at once,
+    `igroupify` consumes `items` in chunks of `buffersize` items. Each chunk
+    is grouped in memory, sorted by group key, and spilled as a run to a
+    temporary file. The runs are then merged to yield each group in turn as
+    a `(group_key, values)` pair:
+
+    >>> from collections import namedtuple
+    >>> Reminder = namedtuple('Reminder', ['when', 'where', 'what'])
+    >>> reminders = [
+    ...   Reminder('Sun', 'Home', 'Sleep in'),
+    ...   Reminder('Fri', 'Home', 'Eat cereal'),
+    ...   Reminder('Sat', 'Home', 'Sleep in'),
+    ...   Reminder('Fri', 'Work', 'Feed Ivan'),
+    ...   Reminder('Sat', 'Home', 'Play Zelda')]
+    >>>
+    >>> for when, whats in igroupify(reminders, 'when', 'what', buffersize=2):
+    ...   print(when, list(whats))
+    Fri ['Eat cereal', 'Feed Ivan']
+    Sat ['Sleep in', 'Play Zelda']
+    Sun ['Sleep in']
+
+    Group keys are yielded in sorted order, and the values of each group are
+    in the same order as `items`. If multiple keys are given, each group key
+    is a tuple:
+
+    >>> for group, whats in igroupify(reminders, ['when', 'where'], 'what'):
+    ...   print(group, list(whats))
+    ('Fri', 'Home') ['Eat cereal']
+    ('Fri', 'Work') ['Feed Ivan']
+    ('Sat', 'Home') ['Sleep in', 'Play Zelda']
+    ('Sun', 'Home') ['Sleep in']
+
+    Note:
+        Just like with `itertools.groupby`, the values iterator of a group
+        is shared with `igroupify` itself, so it is no longer usable once
+        the next group is requested.
+
+    Note:
+        Group keys must be orderable and picklable, and values must be
+        picklable, since they are sorted and written to temporary files.
+
+    Args:
+        items (iterable): The items to arrange in groups.
+        keys (str|callable|list): The key or keys that should be used to group
+            `items`, see `groupify`.
+        val_key (str|callable): A key or callable used to generate the values
+            of each group, see `groupify`. Defaults to `None`.
+        buffersize (int): The maximum number of items grouped in memory
+            before they are spilled to a temporary file. Defaults to 100000.
+        tempdir (str): The directory in which temporary files are created.
+            Defaults to the platform's default temporary directory.
+        presorted (bool): If True, `items` must already be sorted by `keys`,
+            e.g. rows from a database query with a matching ORDER BY clause.
+            Each group is then yielded as soon as the next group starts,
+            without buffering, sorting, or spilling any items. Group keys
+            need not be orderable or picklable, and groups are yielded in
+            the order of `items`:
+
+            >>> for when, whats in igroupify(reminders[1:], 'when', 'what',
+            ...                              presorted=True):
+            ...   print(when, list(whats))
+            Fri ['Eat cereal']
+            Sat ['Sleep in']
+            Fri ['Feed Ivan']
+            Sat ['Play Zelda']
+
+            Defaults to False.
+        validate (bool): If True and `presorted` is True, raise ValueError
+            as soon as a group key is not greater than the group key before
+            it, which means `items` were not sorted. Leave False if `items`
+            are sorted in an order other than Python's, such as a database
+            collation. Defaults to False.
+
+            >>> groups = igroupify(reminders[1:], 'when', presorted=True,
+            ...                    validate=True)
+            >>> [when for when, _ in groups]
+            Traceback (most recent call last):
+              ...
+            ValueError: Items are not sorted by keys: 'Fri' after 'Sat'
+
+    Returns:
+        iterator: An iterator that yields a `(group_key, values)` pair for
+        each group, where `values` is an iterator over the values of the
+        group.
+
+    Raises:
+        ValueError: If no `keys` are given, or `buffersize` is less than 1.
+
+    """
+    keys = listify(keys)
+    if not keys:
+        raise ValueError("Unable to groupify items without keys", keys)
+    if buffersize < 1:
+        raise ValueError("buffersize must be at least 1", buffersize)
+    getters = _groupify_getters(keys, val_key, flat=len(keys) > 1)
+    if presorted:
+        return _igroupify_presorted(items, getters, validate)
+    return _igroupify_spilled(items, getters, buffersize, tempdir)
+
+
+def _igroupify_presorted(items, getters, validate):
+    """Yield each group of `items`, which are already sorted by group key."""
+
+    def get_key(item):
+        return getters[type(item)][1](item)
+
+    def get_values(group):
+        for item in group:
+            yield getters[type(item)][2](item)
+
+    previous = _missing = object()
+    for key, group in groupby(items, get_key):
+        if validate and previous is not _missing and not previous < key:
+            raise ValueError(
+                "Items are not sorted by keys: {0!r} after {1!r}".format(
+                    key, previous
+                ),
+                key,
+                previous,
+            )
+        previous = key
+        yield key, get_values(group)
+
+
+def _igroupify_spilled(items, getters, buffersize, tempdir):
+    """Yield each group of `items`, spilling sorted runs to temp files."""
+    items = iter(items)
+    # Runs are merged in tiers, like a balanced k-way merge sort: once a
+    # tier holds _IGROUPIFY_MAX_RUNS runs, they are merged into one run in
+    # the next tier, so each item is only rewritten once per tier. Older
+    # items are always in higher tiers.
+    tiers = []
+    try:
+        while True:
+            groups = _groupify_into(
+                _ordereddict(), islice(items, buffersize), getters
+            )
+            if sum(len(values) for values in groups.values()) < buffersize:
+                break
+            run = _write_run(_sorted_groups(groups), tempdir)
+            _add_run(tiers, run, tempdir)
+            groups = None
+
+        runs = [run for runs in reversed(tiers) for run in runs]
+        streams = [_read_run(run, i) for i, run in enumerate(runs)]
+        if groups:
+            streams.append(
+                (key, len(runs), values)
+                for key, values in _sorted_groups(groups)
+            )
+        merged = heapq.merge(*streams)
+        for key, records in groupby(merged, operator.itemgetter(0)):
+            yield key, chain.from_iterable(r[2] for r in records)
+    finally:
+        for runs in tiers:
+            for run in runs:
+                run.close()
+
+
+# The number of runs igroupify merges at once, which limits its open files
+# to fewer than this many per tier of runs
+_IGROUPIFY_MAX_RUNS = 64
+
+# The number of groups pickled together when writing a run
+_RUN_BLOCKSIZE = 1024
+
+
+def _add_run(tiers, run, tempdir):
+    """Add a new `run` to the first of `tiers`, merging any full tiers."""
+    for runs in tiers:
+        runs.append(run)
+        if len(runs) < _IGROUPIFY_MAX_RUNS:
+            return
+        full = runs[:]
+        del runs[:]
+        try:
+            run = _write_run(_merge_runs(full), tempdir)
+        finally:
+            for full_run in full:
+                full_run.close()
+    tiers.append([run])
+
+
+def _sorted_groups(groups):
+    """Return the `(key, values)` pairs of `groups` sorted by key."""
+    return sorted(groups.items(), key=operator.itemgetter(0))
+
+
+def _merge_runs(runs):
+    """Merge sorted `runs` into a single sorted stream of groups."""
+    merged = heapq.merge(*[_read_run(run, i) for i, run in enumerate(runs)])
+    return ((key, values) for key, _, values in merged)
+
+
+def _write_run(groups, tempdir):
+    """Write sorted `(key, values)` pairs to a new temporary file."""
+    run = tempfile.TemporaryFile(dir=tempdir)
+    try:
+        # Pickling groups in blocks is much faster than one at a time
+        groups = iter(groups)
+        block = list(islice(groups, _RUN_BLOCKSIZE))
+        while block:
+            pickle.dump(block, run, pickle.HIGHEST_PROTOCOL)
+            block = list(islice(groups, _RUN_BLOCKSIZE))
+    except BaseException:
+        run.close()
+        raise
+    return run
+
+
+def _read_run(run, index):
+    """Yield `(key, index, values)` for each group in `run`."""
+    run.seek(0)
+    while True:
+        try:
+            block = pickle.load(run)
+        except EOFError:
+            return
+        for key, values in block:
+            yield key, index, values
+
+
+def groupify_columns(columns, keys, val_key=None, nested=False):
+    """
+    Groups the rows of columnar data by the given key columns.
+
+    Where `groupify` walks a list of objects one item at a time,
+    `groupify_columns` operates on whole columns at once. `columns` is any
+    object that returns a column when indexed by name: a dict of lists, a
+    dict of NumPy arrays, a NumPy structured array, a pandas DataFrame, etc.
+
+    Each group is keyed by a tuple of its key column values, like the
+    result of `groupify(..., flat=True)`, and maps to the row indices of its
+    members, in the order the groups are first seen:
+
+    >>> columns = {
+    ...   'when': ['Fri', 'Fri', 'Sat', 'Sat', 'Sun', 'Sun'],
+    ...   'where': ['Home', 'Work', 'Home', 'Home', 'Home', 'Work'],
+    ...   'what': ['Eat cereal', 'Feed Ivan', 'Sleep in', 'Play Zelda',
+    ...            'Sleep in', 'Reset database']}
+    >>>
+    >>> for group, indices in groupify_columns(columns, 'when').items():
+    ...   print(group, indices)
+    ('Fri',) [0, 1]
+    ('Sat',) [2, 3]
+    ('Sun',) [4, 5]
+    >>>
+    >>> for group, indices in groupify_columns(
+    ...     columns, ['when', 'where']).items():
+    ...   print(group, indices)
+    ('Fri', 'Home') [0]
+    ('Fri', 'Work') [1]
+    ('Sat', 'Home') [2, 3]
+    ('Sun', 'Home') [4]
+    ('Sun', 'Work') [5]
+
+    If `nested` is True, the result has the same shape as `groupify`:
+
+    >>> from json import dumps
+    >>> nested = groupify_columns(columns, ['when', 'where'], 'what', True)
+    >>> print(dumps(nested, indent=2))
+    {
+      "Fri": {
+        "Home": [
+          "Eat cereal"
+        ],
+        "Work": [
+          "Feed Ivan"
+        ]
+      },
+      "Sat": {
+        "Home": [
+          "Sleep in",
+          "Play Zelda"
+        ]
+      },
+      "Sun": {
+        "Home": [
+          "Sleep in"
+        ],
+        "Work": [
+          "Reset database"
+        ]
+      }
+    }
+
+    Note:
+        If the key columns are NumPy arrays, the keys are factorized with
+        vectorized sort and unique operations, and each group is returned as
+        an integer NumPy array of row indices (or, if `val_key` is given, as
+        an array of values taken from the `val_key` column). NumPy is never
+        imported by `groupify_columns` itself; it is only used if the
+        columns already are NumPy arrays. Otherwise the rows are grouped in
+        pure Python and each group is a list.
+
+    Args:
+        columns (map): An object that returns a column, i.e. a sequence of
+            row values, when indexed by a column name.
+        keys (str or list): The name of the column, or the list of column
+            names, used to group the rows.
+        val_key (str): The name of a column used to generate the leaf values.
+            If `val_key` is `None`, then the row indices themselves are used.
+            Defaults to `None`.
+        nested (bool): If True, return nested OrderedDicts with one level per
+            key, just like `groupify`. Otherwise return a single OrderedDict
+            keyed by tuples of key column values, even if there is only one
+            key. Defaults to False.
+
+    Returns:
+        OrderedDict: The row indices, or `val_key` values, of each group.
+
+    """
+    if not isinstance(keys, (list, tuple)):
+        keys = [keys]
+    key_columns = [columns[key] for key in keys]
+    if not key_columns:
+        raise ValueError("Unable to groupify columns without keys", keys)
+
+    numpy = sys.modules.get("numpy")
+    groups = None
+    if numpy is not None and all(
+        isinstance(c, numpy.ndarray) for c in key_columns
+    ):
+        try:
+            groups = _groupify_ndarrays(numpy, key_columns)
+        except TypeError:
+            # Object arrays holding unorderable values can't be sorted, so
+            # fall back to grouping them one row at a time.
+            pass
+    if groups is None:
+        groups = _groupify_sequences(key_columns)
+
+    if val_key is not None:
+        values = columns[val_key]
+        if numpy is not None and isinstance(values, numpy.ndarray):
+            for group_key, indices in groups.items():
+                groups[group_key] = values[indices]
+        else:
+            for group_key, indices in groups.items():
+                groups[group_key] = [values[i] for i in indices]
+
+    if nested:
+        return _nest_groups(groups)
+    return groups
+
+
+def _groupify_ndarrays(numpy, key_columns):
+    """Group row indices of NumPy `key_columns` using vectorized ops."""
+    groups = OrderedDict()
+    size = len(key_columns[0])
+    if not size:
+        return groups
+
+    # Factorize each key column into integer codes, then combine the codes
+    # of every column into a single code per row. If the combined codes get
+    # too sparse they are re-factorized, so they can never overflow.
+    codes = numpy.zeros(size, dtype=numpy.intp)
+    cardinality = 1
+    for column in key_columns:
+        uniques, inverse = numpy.unique(column, return_inverse=True)
+        if cardinality * len(uniques) > 2 ** 31:
+            codes, cardinality = _factorize_codes(numpy, codes)
+        codes = codes * len(uniques) + inverse.reshape(-1)
+        cardinality *= len(uniques)
+
+    # A stable sort keeps the rows of each group in their original order,
+    # so the first row of each run is where that group is first seen. Small
+    # codes are sorted as 16-bit ints, for which NumPy uses a radix sort.
+    if cardinality > 2 ** 16:
+        codes, cardinality = _factorize_codes(numpy, codes)
+    if cardinality <= 2 ** 16:
+        codes = codes.astype(numpy.uint16)
+    order = numpy.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    bounds = numpy.flatnonzero(sorted_codes[1:] != sorted_codes[:-1]) + 1
+    runs = numpy.split(order, bounds)
+    firsts = order[numpy.concatenate(([0], bounds))]
+
+    group_keys = [column[firsts].tolist() for column in key_columns]
+    group_keys = list(zip(*group_keys))
+    for i in numpy.argsort(firsts, kind="stable").tolist():
+        groups[group_keys[i]] = runs[i]
+    return groups
+
+
+def _factorize_codes(numpy, codes):
+    """Return dense `codes` and their cardinality."""
+    uniques, codes = numpy.unique(codes, return_inverse=True)
+    return codes.reshape(-1), len(uniques)
+
+
+def _groupify_sequences(key_columns):
+    """Group row indices of `key_columns` one row at a time."""
+    groups = OrderedDict()
+    for i, group_key in enumerate(zip(*key_columns)):
+        try:
+            groups[group_key].append(i)
+        except KeyError:
+            groups[group_key] = [i]
+    return groups
+
+
+def _nest_groups(groups):
+    """Convert tuple-keyed `groups` into one level of OrderedDicts per key."""
+    nested = OrderedDict()
+    for group_key, leaf in groups.items():
+        current = nested
+        for key in group_key[:-1]:
+            if key not in current:
+                current[key] = OrderedDict()
+            current = current[key]
+        current[group_key[-1]] = leaf
+    return nested
+
+
+class nestedview(Mapping):
+    """
+    A read-only nested view of groups keyed by tuples.
+
+    Wraps a dict keyed by tuples of equal length, such as the result of
+    `groupify(..., flat=True)` or `groupify_columns`, so that it can be
+    accessed one tuple element at a time, as if it were nested OrderedDicts.
+    Groups with a single key are keyed by 1-tuples:
+
+    >>> groups = {
+    ...   ('Fri', 'Home'): ['Eat cereal'],
+    ...   ('Fri', 'Work'): ['Feed Ivan'],
+    ...   ('Sat', 'Home'): ['Sleep in', 'Play Zelda']}
+    >>> view = nestedview(groups)
+    >>> list(view)
+    ['Fri', 'Sat']
+    >>> view['Fri']['Work']
+    ['Feed Ivan']
+    >>> dict(view['Sat'])
+    {'Home': ['Sleep in', 'Play Zelda']}
+
+    Nothing is copied up front. The child groups of a view are only indexed
+    the first time the view is accessed, and only the views that are actually
+    accessed are ever created.
+
+    Note:
+        A view indexes its groups when it is first accessed, so it does not
+        reflect groups that are added to the underlying dict afterwards.
+
+    Args:
+        groups (dict): The flat groups, keyed by tuples.
+
+    Raises:
+        TypeError: When the view is first accessed, if a key of `groups` is
+            not a tuple.
+
+    """
+
+    __slots__ = ("_groups", "_prefix", "_keys", "_children")
+
+    def __init__(self, groups, _prefix=(), _keys=None):
+        self._groups = groups
+        self._prefix = _prefix
+        self._keys = _keys
+        self._children = None
+
+    def _index(self):
+        """Map each child key to a view, or to the full keys beneath it."""
+        if self._children is None:
+            keys = self._groups if self._keys is None else self._keys
+            level = len(self._prefix)
+            children = _ordereddict()
+            for key in keys:
+                if not isinstance(key, tuple):
+                    raise TypeError(
+                        "Unable to view non-tuple key {0!r}".format(key), key
+                    )
+                child = key[level]
+                if child in children:
+                    children[child].append(key)
+                else:
+                    children[child] = [key]
+            self._children = children
+        return self._children
+
+    def __getitem__(self, key):
+        children = self._index()
+        child = children[key]
+        if isinstance(child, nestedview):
+            return child
+        if len(child[0]) == len(self._prefix) + 1:
+            return self._groups[child[0]]
+        child = children[key] = nestedview(
+            self._groups, self._prefix + (key,), child
+        )
+        return child
+
+    def __iter__(self):
+        return iter(self._index())
+
+    def __len__(self):
+        return len(self._index())
+
+    def __contains__(self, key):
+        return key in self._index()
+
+    def __repr__(self):
+        return "{0}({1!r})".format(type(self).__name__, dict(self.items()))
+
+
+class keydefaultdict(defaultdict):
+    """
+    A defaultdict that passes the missed key to the factory function.
+
+    >>> def echo_factory(missing_key):
+    ...     return missing_key
+    ...
+    >>> d = keydefaultdict(echo_factory)
+    >>> d['Hello World']
+    'Hello World'
+    >>> d['Hello World'] = 'Goodbye'
+    >>> d['Hello World']
+    'Goodbye'
+
+    """
+
+    def __missing__(self, key):
+        if self.default_factory is None:
+            raise KeyError(key)
+        else:
+            ret = self[key] = self.default_factory(key)
+            return ret
+
+
+class boundedkeydefaultdict(keydefaultdict):
+    """
+    A keydefaultdict that holds a bounded number of entries.
+
+    Once `maxsize` entries are held, adding another entry evicts the least
+    recently used one, just like `functools.lru_cache`:
+
+    >>> d = boundedkeydefaultdict(str.upper, maxsize=2)
+    >>> d['a'], d['b'], d['a'], d['c']
+    ('A', 'B', 'A', 'C')
+    >>> sorted(d.keys())
+    ['a', 'c']
+    >>> d.hits, d.misses, d.evictions
+    (1, 3, 1)
+
+    Entries may also expire `ttl` seconds after they are set, after which
+    the next access calls the factory again:
+
+    >>> clock = [0]
+    >>> d = boundedkeydefaultdict(str.upper, ttl=60, timer=lambda: clock[0])
+    >>> d['a']
+    'A'
+    >>> d['a'] = 'Alpha'
+    >>> clock[0] = 61
+    >>> d['a']
+    'A'
+
+    Note:
+        Expired entries are only removed when they are accessed, when they
+        are evicted, or when `expire` is called, so they are still counted
+        by `len` and included when iterating until then.
+
+    Note:
+        Just like `defaultdict`, only ``d[key]`` calls the factory for a
+        missing key; `get` and ``key in d`` do not. A `boundedkeydefaultdict`
+        is not thread-safe.
+
+    Args:
+        default_factory (callable): Called with a missing key to create its
+            value. If `None`, missing keys raise `KeyError`.
+        maxsize (int): The maximum number of entries, at least 1. If `None`,
+            the number of entries is unbounded. Defaults to 128.
+        policy (str): Either "lru" to evict the least recently used entry,
+            or "lfu" to evict the least frequently used entry, breaking ties
+            by least recent use. Defaults to "lru".
+        ttl (float): The number of seconds after which an entry expires. If
+            `None`, entries never expire. Defaults to `None`.
+        timer (callable): A function that returns the current time in
+            seconds, used to expire entries. Defaults to `time.monotonic`,
+            or `time.time` on Python 2.
+
+    Attributes:
+        hits (int): The number of times ``d[key]`` found `key`.
+        misses (int): The number of times ``d[key]`` did not find `key`,
+            including keys whose entries had expired.
+        evictions (int): The number of entries removed to make room for new
+            entries, or because they had expired.
+
+    Raises:
+        ValueError: If `maxsize` is less than 1, or `policy` is not "lru" or
+            "lfu".
+
+    """
+
+    def __init__(
+        self,
+        default_factory=None,
+        maxsize=128,
+        policy="lru",
+        ttl=None,
+        timer=None,
+    ):
+        super(boundedkeydefaultdict, self).__init__(default_factory)
+        if maxsize is not None and maxsize < 1:
+            raise ValueError("maxsize must be at least 1", maxsize)
+        if policy not in _EVICTION_POLICIES:
+            raise ValueError(
+                "Unknown eviction policy {0!r}, expected one of: {1}".format(
+                    policy, ", ".join(sorted(_EVICTION_POLICIES))
+                ),
+                policy,
+            )
+        self.maxsize = maxsize
+        self.policy = policy
+        self.ttl = ttl
+        self.timer = timer or getattr(time, "monotonic", time.time)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._usage = _EVICTION_POLICIES[policy]()
+        self._expires = {}
+
+    def __getitem__(self, key):
+        if dict.__contains__(self, key):
+            if not self._expired(key):
+                self.hits += 1
+                self._usage.touch(key)
+                return dict.__getitem__(self, key)
+            self._evict(key)
+        self.misses += 1
+        return self.__missing__(key)
+
+    def __setitem__(self, key, value):
+        if dict.__contains__(self, key):
+            self._usage.touch(key)
+        else:
+            while self.maxsize is not None and len(self) >= self.maxsize:
+                self._evict(self._usage.victim())
+            self._usage.add(key)
+        if self.ttl is not None:
+            self._expires[key] = self.timer() + self.ttl
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._usage.discard(key)
+        self._expires.pop(key, None)
+
+    def __contains__(self, key):
+        if not dict.__contains__(self, key):
+            return False
+        if self._expired(key):
+            self._evict(key)
+            return False
+        return True
+
+    def __copy__(self):
+        copied = type(self)(
+            self.default_factory,
+            self.maxsize,
+            self.policy,
+            self.ttl,
+            self.timer,
+        )
+        for key, value in self.items():
+            dict.__setitem__(copied, key, value)
+        copied._usage = self._usage.copy()
+        copied._expires = dict(self._expires)
+        return copied
+
+    copy = __copy__
+
+    def __reduce__(self):
+        args = (
+            self.default_factory,
+            self.maxsize,
+            self.policy,
+            self.ttl,
+            self.timer,
+        )
+        items = ((k, dict.__getitem__(self, k)) for k in self._usage.ordered())
+        return type(self), args, None, None, items
+
+    def _expired(self, key):
+        """Return True if the entry for `key` has expired."""
+        return self.ttl is not None and self._expires[key] <= self.timer()
+
+    def _evict(self, key):
+        """Remove the entry for `key` and count its eviction."""
+        del self[key]
+        self.evictions += 1
+
+    def get(self, key, default=None):
+        return dict.__getitem__(self, key) if key in self else default
+
+    def pop(self, key, *args):
+        if key in self:
+            value = dict.__getitem__(self, key)
+            del self[key]
+            return value
+        if args:
+            return args[0]
+        raise KeyError(key)
+
+    def popitem(self):
+        """
+        Remove and return the entry that would be evicted next.
+
+        Expired entries are evicted along the way instead of being returned.
+        """
+        while self:
+            key = self._usage.victim()
+            if self._expired(key):
+                self._evict(key)
+                continue
+            value = dict.__getitem__(self, key)
+            del self[key]
+            return key, value
+        raise KeyError("popitem(): dictionary is empty")
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return dict.__getitem__(self, key)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        dict.clear(self)
+        self._usage = _EVICTION_POLICIES[self.policy]()
+        self._expires.clear()
+
+    def expire(self):
+        """
+        Remove every expired entry.
+
+        Returns:
+            int: The number of entries removed.
+
+        """
+        if self.ttl is None:
+            return 0
+        now = self.timer()
+        expired = [k for k, t in self._expires.items() if t <= now]
+        for key in expired:
+            self._evict(key)
+        return len(expired)
+
+
+class _LRUUsage(object):
+    """Tracks the order in which keys were used by a bounded dict."""
+
+    __slots__ = ("_order",)
+
+    def __init__(self):
+        self._order = OrderedDict()
+
+    def add(self, key):
+        self._order[key] = None
+
+    def touch(self, key):
+        del self._order[key]
+        self._order[key] = None
+
+    def discard(self, key):
+        self._order.pop(key, None)
+
+    def victim(self):
+        return next(iter(self._order))
+
+    def ordered(self):
+        return iter(self._order)
+
+    def copy(self):
+        copied = type(self)()
+        copied._order = self._order.copy()
+        return copied
+
+
+class _LFUUsage(object):
+    """
+    Tracks how often keys were used, for `boundedkeydefaultdict`.
+
+    Keys are kept in buckets by use count, and each bucket is ordered by most
+    recent use, so adding, using, and evicting keys is O(1). Only after a
+    key is discarded from the least used bucket does the next `victim` scan
+    the remaining buckets for the new least count.
+    """
+
+    __slots__ = ("_counts", "_buckets", "_min_count")
+
+    def __init__(self):
+        self._counts = {}
+        self._buckets = {}
+        self._min_count = 0
+
+    def _bucket(self, count):
+        if count not in self._buckets:
+            self._buckets[count] = OrderedDict()
+        return self._buckets[count]
+
+    def add(self, key):
+        self._counts[key] = 1
+        self._bucket(1)[key] = None
+        self._min_count = 1
+
+    def touch(self, key):
+        count = self.discard(key)
+        if count == self._min_count and count not in self._buckets:
+            self._min_count = count + 1
+        self._counts[key] = count + 1
+        self._bucket(count + 1)[key] = None
+
+    def discard(self, key):
+        count = self._counts.pop(key, None)
+        if count is not None:
+            bucket = self._buckets[count]
+            del bucket[key]
+            if not bucket:
+                del self._buckets[count]
+        return count
+
+    def victim(self):
+        if self._min_count not in self._buckets:
+            self._min_count = min(self._buckets)
+        return next(iter(self._buckets[self._min_count]))
+
+    def ordered(self):
+        return chain.from_iterable(
+            self._buckets[count] for count in sorted(self._buckets)
+        )
+
+    def copy(self):
+        copied = type(self)()
+        copied._counts = dict(self._counts)
+        copied._buckets = dict(
+            (count, bucket.copy()) for count, bucket in self._buckets.items()
+        )
+        copied._min_count = self._min_count
+        return copied
+
+
+_EVICTION_POLICIES = {"lru": _LRUUsage, "lfu": _LFUUsage}
+
+
+class concurrentkeydefaultdict(keydefaultdict):
+    """
+    A keydefaultdict that calls its factory once per key across threads.
+
+    When several threads miss on the same key at once, only the first calls
+    `default_factory`; the others wait for it to finish and then return the
+    same value, or raise the same exception. Misses on different keys call
+    the factory in parallel, even when they share a lock stripe, because
+    the stripe lock is only held while checking for and registering the
+    in-flight call, never while the factory runs.
+
+    >>> d = concurrentkeydefaultdict(str.upper)
+    >>> d['a']
+    'A'
+
+    Exceptions raised by the factory are not cached, so the next miss on
+    the same key calls the factory again.
+
+    Note:
+        Apart from ``d[key]`` on a missing key, a `concurrentkeydefaultdict`
+        is a plain `dict`, so every other operation is as atomic as it is
+        for `dict`. Assigning a key while its factory is running does not
+        stop the factory's result from replacing the assigned value.
+
+    Note:
+        On free-threaded CPython builds (``python3.13t`` and later) there is
+        no global interpreter lock, and factories for different keys truly
+        run at the same time on different cores. `dict` operations are still
+        individually thread-safe on those builds, and single-flight factory
+        calls rely only on the stripe locks, never on the GIL, so behavior
+        is the same; more `stripes` reduce contention between threads that
+        miss at the same time.
+
+    Args:
+        default_factory (callable): Called with a missing key to create its
+            value. If `None`, missing keys raise `KeyError`.
+        stripes (int): The number of locks that keys are spread across by
+            hash. Defaults to 16.
+
+    Raises:
+        ValueError: If `stripes` is less than 1.
+        RuntimeError: If the factory looks up the key it is creating.
+
+    """
+
+    def __init__(self, default_factory=None, stripes=16):
+        super(concurrentkeydefaultdict, self).__init__(default_factory)
+        if stripes < 1:
+            raise ValueError(
+                "stripes must be at least 1, got {0!r}".format(stripes)
+            )
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._calls = {}
+
+    def __missing__(self, key):
+        if self.default_factory is None:
+            raise KeyError(key)
+        lock = self._locks[hash(key) % len(self._locks)]
+        with lock:
+            if dict.__contains__(self, key):
+                return dict.__getitem__(self, key)
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _FactoryCall()
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            return call.wait(key)
+        try:
+            value = self.default_factory(key)
+        except BaseException:
+            call.exc_info = sys.exc_info()
+            with lock:
+                del self._calls[key]
+            call.done.set()
+            raise
+        with lock:
+            dict.__setitem__(self, key, value)
+            del self._calls[key]
+        call.value = value
+        call.done.set()
+        return value
+
+    def __copy__(self):
+        copied = type(self)(self.default_factory, len(self._locks))
+        dict.update(copied, self)
+        return copied
+
+    copy = __copy__
+
+    def __reduce__(self):
+        args = (self.default_factory, len(self._locks))
+        return type(self), args, None, None, iter(self.items())
+
+
+class _FactoryCall(object):
+    """A factory call in progress for a thread-safe keydefaultdict."""
+
+    __slots__ = ("owner", "done", "value", "exc_info")
+
+    def __init__(self):
+        self.owner = threading.current_thread()
+        self.done = threading.Event()
+        self.value = None
+        self.exc_info = None
+
+    def wait(self, key):
+        """Wait for the call to finish and return its value."""
+        if self.owner is threading.current_thread():
+            raise RuntimeError(
+                "default_factory looked up {0!r} while creating it".format(key)
+            )
+        self.done.wait()
+        if self.exc_info is not None:
+            six.reraise(*self.exc_info)
+        return self.value
+
+
+class asynckeydefaultdict(keydefaultdict):
+    """
+    A keydefaultdict for asyncio whose factory is a coroutine function.
+
+    Looking up a missing key schedules ``default_factory(key)`` as a task
+    and stores the task, so every concurrent lookup of that key awaits the
+    same call instead of starting a new one::
+
+        async def fetch_user(user_id):
+            return await db.fetch_one(USER_QUERY, user_id)
+
+        users = asynckeydefaultdict(fetch_user)
+        alice, also_alice = await asyncio.gather(
+            users.get(1), users.get(1)
+        )
+
+    Once the task is done, later lookups return its result immediately.
+
+    Note:
+        Unlike `dict.get`, `get` takes no default; it looks up `key` just
+        like ``d[key]``, calling the factory if `key` is missing, and
+        returns an awaitable. ``d[key]`` returns the stored task itself, so
+        cancelling an awaiter of ``d[key]`` cancels the task for everyone;
+        cancelling an awaiter of ``d.get(key)`` does not.
+
+    Args:
+        default_factory (callable): Called with a missing key to create an
+            awaitable for its value, typically a coroutine function. If
+            `None`, missing keys raise `KeyError`.
+        evict_failures (bool): If True, a task that raises an exception or
+            is cancelled is removed once it is done, so the next lookup
+            calls the factory again. Otherwise the task is kept, and every
+            lookup of that key raises the same exception. Defaults to False.
+
+    """
+
+    def __init__(self, default_factory=None, evict_failures=False):
+        super(asynckeydefaultdict, self).__init__(default_factory)
+        self.evict_failures = evict_failures
+
+    def __missing__(self, key):
+        import asyncio
+
+        if self.default_factory is None:
+            raise KeyError(key)
+        task = asyncio.ensure_future(self.default_factory(key))
+        dict.__setitem__(self, key, task)
+        if self.evict_failures:
+            task.add_done_callback(functools.partial(self._evict, key))
+        return task
+
+    def _evict(self, key, task):
+        """Remove `task` from `key` if it failed."""
+        if task.cancelled() or task.exception() is not None:
+            if dict.get(self, key) is task:
+                dict.__delitem__(self, key)
+
+    def get(self, key):
+        """
+        Return an awaitable for the value of `key`.
+
+        Args:
+            key: The key to look up.
+
+        Returns:
+            awaitable: Resolves to the value created by the factory for
+            `key`, shielded so that cancelling it does not cancel the
+            shared task.
+
+        """
+        import asyncio
+
+        return asyncio.shield(self[key])
+
+    def __copy__(self):
+        copied = type(self)(self.default_factory, self.evict_failures)
+        dict.update(copied, self)
+        return copied
+
+    copy = __copy__
+
+
+class batchkeydefaultdict(keydefaultdict):
+    """
+    A keydefaultdict whose factory creates values for many keys at once.
+
+    `default_factory` is called with a list of missing keys and returns a
+    mapping of keys to values, so a bulk lookup, e.g. a multi-get from a
+    remote store, can be made once for many keys with `prefetch`:
+
+    >>> calls = []
+    >>> def squares(keys):
+    ...     calls.append(keys)
+    ...     return dict((k, k * k) for k in keys)
+    >>> d = batchkeydefaultdict(squares)
+    >>> d.prefetch([1, 2, 3])
+    >>> d[2], d[4]
+    (4, 16)
+    >>> calls
+    [[1, 2, 3], [4]]
+
+    Keys missing from the returned mapping are not stored, and looking them
+    up raises `KeyError`.
+
+    If `window` is given, a missing key waits up to `window` seconds for
+    misses from other threads, and all of them are passed to a single call
+    to `default_factory`. Every thread waits for that call and then returns
+    its own value, or raises the same exception. Exceptions are not cached,
+    so the next miss on a failed key calls the factory again.
+
+    Note:
+        With a `window`, every lookup of a missing key takes at least
+        `window` seconds, even when no other thread is looking up keys, so
+        it should be small compared to the latency of `default_factory`.
+
+    Args:
+        default_factory (callable): Called with a list of missing keys, and
+            returns a mapping of those keys to their values. If `None`,
+            missing keys raise `KeyError`.
+        window (float): The number of seconds a missing key waits for
+            misses from other threads before calling `default_factory`. If
+            `None`, each miss calls `default_factory` immediately. Defaults
+            to `None`.
+
+    Raises:
+        RuntimeError: If the factory looks up a key it is creating.
+
+    """
+
+    def __init__(self, default_factory=None, window=None):
+        super(batchkeydefaultdict, self).__init__(default_factory)
+        self.window = window
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._pending = None
+
+    def __missing__(self, key):
+        if self.default_factory is None:
+            raise KeyError(key)
+        if self.window is None:
+            values = self._load([key])
+        else:
+            values = self._load_batched(key)
+        try:
+            return values[key]
+        except KeyError:
+            six.raise_from(KeyError(key), None)
+
+    def _load(self, keys):
+        """Call the factory with `keys` and store the values it returns."""
+        values = dict(self.default_factory(keys))
+        with self._lock:
+            dict.update(self, values)
+        return values
+
+    def _load_batched(self, key):
+        """Add `key` to the pending batch, and wait for it to be loaded."""
+        with self._lock:
+            if dict.__contains__(self, key):
+                return {key: dict.__getitem__(self, key)}
+            call = self._calls.get(key)
+            leader = False
+            if call is None:
+                call = self._pending
+                if call is None:
+                    call = self._pending = _BatchCall()
+                    leader = True
+                call.keys.append(key)
+                self._calls[key] = call
+        if not leader:
+            return call.wait(key)
+
+        time.sleep(self.window)
+        with self._lock:
+            self._pending = None
+        try:
+            call.value = self._load(list(call.keys))
+        except BaseException:
+            call.exc_info = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                for k in call.keys:
+                    del self._calls[k]
+            call.done.set()
+        return call.value
+
+    def prefetch(self, keys):
+        """
+        Create the values for all of `keys` that are missing in one call.
+
+        Args:
+            keys (iterable): The keys to create values for. Keys that are
+                already present are skipped.
+
+        """
+        if self.default_factory is None:
+            return
+        missing = uniquify([k for k in keys if not dict.__contains__(self, k)])
+        if missing:
+            self._load(missing)
+
+    def __copy__(self):
+        copied = type(self)(self.default_factory, self.window)
+        dict.update(copied, self)
+        return copied
+
+    copy = __copy__
+
+    def __reduce__(self):
+        args = (self.default_factory, self.window)
+        return type(self), args, None, None, iter(self.items())
+
+
+class _BatchCall(_FactoryCall):
+    """A factory call for the pending keys of `batchkeydefaultdict`."""
+
+    __slots__ = ("keys",)
+
+    def __init__(self):
+        super(_BatchCall, self).__init__()
+        self.keys = []
+
+
+class persistentkeydefaultdict(keydefaultdict):
+    """
+    A keydefaultdict that stores its values in a sqlite database.
+
+    Values created by `default_factory` or assigned to keys are written to
+    the database at `path`, and a missing key is looked up in the database
+    before `default_factory` is called, so values survive restarting the
+    process, and are shared with other processes using the same `path`:
+
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'cache.db')
+    >>> d = persistentkeydefaultdict(str.upper, path)
+    >>> d['a']
+    'A'
+    >>> d.close()
+    >>> d = persistentkeydefaultdict(None, path)
+    >>> d['a']
+    'A'
+    >>> d.close()
+
+    Deleting a key, or calling `clear`, removes it from the database too.
+    The dict itself only holds the values this instance has looked up, so
+    `len` and iteration do not include values that are only in the
+    database, nor does ``key in d``. Values written by other processes are
+    not seen for keys this instance has already looked up.
+
+    Note:
+        Each process opens its own connection, in WAL mode so readers never
+        block, and writes are made in short transactions that wait up to
+        `timeout` seconds for other writers. Two processes that miss on the
+        same key at the same time may both call `default_factory`, and the
+        last one to finish wins.
+
+    Args:
+        default_factory (callable): Called with a missing key to create its
+            value. If `None`, keys missing from the database raise
+            `KeyError`.
+        path (str): The path of the sqlite database file, which is created
+            if it does not exist.
+        serializer: An object with ``dumps`` and ``loads`` functions, such
+            as the `json` module, used for both keys and values. Equal keys
+            must serialize to equal bytes or strings. Defaults to `pickle`.
+        maxsize (int): The maximum number of entries in the database. Once
+            reached, the least recently written entries are removed. If
+            `None`, the number of entries is unbounded. Defaults to `None`.
+        timeout (float): The number of seconds to wait for the database to
+            be unlocked by other processes. Defaults to 30.
+
+    """
+
+    def __init__(
+        self,
+        default_factory=None,
+        path=None,
+        serializer=None,
+        maxsize=None,
+        timeout=30,
+    ):
+        super(persistentkeydefaultdict, self).__init__(default_factory)
+        if path is None:
+            raise TypeError("persistentkeydefaultdict requires a path")
+        self.path = path
+        self.serializer = serializer
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+
+    def __missing__(self, key):
+        row = self._select(key)
+        if row is not None:
+            value = self._loads(row[0])
+        elif self.default_factory is None:
+            raise KeyError(key)
+        else:
+            value = self.default_factory(key)
+            self._store(key, value)
+        dict.__setitem__(self, key, value)
+        return value
+
+    def __setitem__(self, key, value):
+        self._store(key, value)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        cursor = self._execute(
+            "DELETE FROM entries WHERE key = ?", self._dumps(key)
+        )
+        if not dict.__contains__(self, key):
+            if not cursor.rowcount:
+                raise KeyError(key)
+        else:
+            dict.__delitem__(self, key)
+
+    def _connect(self):
+        """Return the connection for this process, opening it if needed."""
+        if self._connection is None or self._pid != os.getpid():
+            import sqlite3
+
+            connection = sqlite3.connect(
+                self.path,
+                timeout=self.timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries "
+                "(key BLOB PRIMARY KEY, value BLOB)"
+            )
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def _execute(self, sql, *params):
+        with self._lock:
+            return self._connect().execute(sql, params)
+
+    def _select(self, key):
+        """Return the database row for `key`, or `None`."""
+        return self._execute(
+            "SELECT value FROM entries WHERE key = ?", self._dumps(key)
+        ).fetchone()
+
+    def _transaction(self, func):
+        """Return `func(connection)`, called in a write transaction."""
+        with self._lock:
+            connection = self._connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(connection)
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+            return result
+
+    def _store(self, key, value, replace=True):
+        """
+        Write `value` for `key`, then enforce `maxsize`.
+
+        If `replace` is False and `key` is already in the database, its
+        database row is left alone and returned instead.
+        """
+        data = self._dumps(key), self._dumps(value)
+
+        def store(connection):
+            cursor = connection.execute(
+                "INSERT OR {0} INTO entries VALUES (?, ?)".format(
+                    "REPLACE" if replace else "IGNORE"
+                ),
+                data,
+            )
+            if not cursor.rowcount:
+                return connection.execute(
+                    "SELECT value FROM entries WHERE key = ?", data[:1]
+                ).fetchone()
+            if self.maxsize is not None:
+                connection.execute(
+                    "DELETE FROM entries WHERE rowid IN (SELECT rowid "
+                    "FROM entries ORDER BY rowid DESC LIMIT -1 OFFSET ?)",
+                    (self.maxsize,),
+                )
+            return None
+
+        return self._transaction(store)
+
+    def _delete(self, key):
+        """Delete `key` from the database, and return its row or `None`."""
+        params = (self._dumps(key),)
+
+        def delete(connection):
+            row = connection.execute(
+                "SELECT value FROM entries WHERE key = ?", params
+            ).fetchone()
+            if row is not None:
+                connection.execute("DELETE FROM entries WHERE key = ?", params)
+            return row
+
+        return self._transaction(delete)
+
+    def _dumps(self, obj):
+        if self.serializer is None:
+            data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+        else:
+            data = self.serializer.dumps(obj)
+        if isinstance(data, six.text_type):
+            return data
+        import sqlite3
+
+        return sqlite3.Binary(data)
+
+    def _loads(self, data):
+        if not isinstance(data, six.text_type):
+            data = bytes(data)
+        if self.serializer is None:
+            return pickle.loads(data)
+        return self.serializer.loads(data)
+
+    def pop(self, key, *args):
+        # Deleting the row and the entry without checking for them first
+        # means other threads and processes can't remove them in between.
+        row = self._delete(key)
+        value = dict.pop(self, key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if row is not None:
+            return self._loads(row[0])
+        if args:
+            return args[0]
+        raise KeyError(key)
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        self._execute("DELETE FROM entries WHERE key = ?", self._dumps(key))
+        return key, value
+
+    def clear(self):
+        """Remove every entry, from the database too."""
+        self._execute("DELETE FROM entries")
+        dict.clear(self)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if not dict.__contains__(self, key):
+            row = self._store(key, default, replace=False)
+            value = default if row is None else self._loads(row[0])
+            dict.__setitem__(self, key, value)
+        return dict.__getitem__(self, key)
+
+    def close(self):
+        """Close the connection to the database, if it is open."""
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+
+    def __copy__(self):
+        copied = type(self)(
+            self.default_factory,
+            self.path,
+            self.serializer,
+            self.maxsize,
+            self.timeout,
+        )
+        dict.update(copied, self)
+        return copied
+
+    copy = __copy__
+
+    def __reduce__(self):
+        args = (
+            self.default_factory,
+            self.path,
+            self.serializer,
+            self.maxsize,
+            self.timeout,
+        )
+        return type(self), args
+
+
+def keygetter(key):
+    """
+    Return a function that extracts `key` from an item.
+
+    `keygetter` compiles the `key` argument accepted by `groupify`,
+    `uniquify`, and friends into a single callable, so the work of
+    interpreting `key` is done once instead of once per item.
+
+    A string names an attribute of the item, or a key of the item if the item
+    is a dict. Dots in the string separate the steps of a path, which may mix
+    attributes and keys:
+
+    >>> from collections import namedtuple
+    >>> Owner = namedtuple('Owner', ['name', 'address'])
+    >>> owner = Owner('Rob', {'city': 'Oakland', 'zip': '94610'})
+    >>> keygetter('name')(owner)
+    'Rob'
+    >>> keygetter('address.zip')(owner)
+    '94610'
+    >>> keygetter('owner.address.city')({'owner': owner})
+    'Oakland'
+
+    A tuple or list of keys creates a composite key:
+
+    >>> keygetter(('name', 'address.zip'))(owner)
+    ('Rob', '94610')
+
+    An int gets the item at that index, a callable is returned unchanged, and
+    `None` returns the item itself:
+
+    >>> keygetter(0)(owner)
+    'Rob'
+    >>> keygetter(len)(owner)
+    2
+    >>> keygetter(None)(owner) is owner
+    True
+
+    Note:
+        Items that are dicts are always accessed by key, so a dict's own
+        attributes can't be addressed by name. Other mappings are accessed
+        by attribute first, falling back to key if the attribute is missing.
+
+    Args:
+        key (str|int|callable|tuple|list): The key to compile.
+
+    Returns:
+        callable: A function of one argument that returns `key` for an item.
+
+    Raises:
+        TypeError: If `key` is not a supported type.
+
+    """
+    return _keygetter(key, None)
+
+
+def _keygetter(key, item_type):
+    """
+    Compile `key` like `keygetter`, specialized for items of `item_type`.
+
+    Names are compiled straight to `operator.itemgetter` if `item_type` is a
+    dict, or to `operator.attrgetter` if it is not a mapping at all, which
+    avoids checking the type of every item.
+    """
+    if key is None:
+        return _identity
+    if callable(key):
+        return key
+    if isinstance(key, six.integer_types):
+        return operator.itemgetter(key)
+    if isinstance(key, six.string_types):
+        names = key.split(".")
+        getters = [_name_getter(names[:1], item_type)]
+        getters.extend(_name_getter([name]) for name in names[1:])
+        if len(getters) == 1:
+            return getters[0]
+
+        def get_path(item):
+            for getter in getters:
+                item = getter(item)
+            return item
+
+        return get_path
+    if isinstance(key, (tuple, list)) and key:
+        if len(key) > 1 and all(
+            isinstance(k, six.string_types) and "." not in k for k in key
+        ):
+            # attrgetter and itemgetter return tuples for multiple names
+            return _name_getter(key, item_type)
+        getters = [_keygetter(k, item_type) for k in key]
+        return lambda item: tuple([getter(item) for getter in getters])
+    raise TypeError("Unable to get key {0!r}".format(key), key)
+
+
+def _name_getter(names, item_type=None):
+    """Return a function that gets `names` by key from dicts, else by attr."""
+    get_attr = operator.attrgetter(*names)
+    get_item = operator.itemgetter(*names)
+    if item_type is not None:
+        if issubclass(item_type, dict):
+            return get_item
+        if not issubclass(item_type, Mapping):
+            return get_attr
+
+    def getter(item):
+        if isinstance(item, dict):
+            return get_item(item)
+        try:
+            return get_attr(item)
+        except AttributeError:
+            if isinstance(item, Mapping):
+                return get_item(item)
+            raise
+
+    return getter
+
+
+# Per-type results of is_listy and is_mappy, which are cleared whenever the
+# ABC cache token changes or they grow past _MAX_CACHED_TYPES, and per-type
+# overrides from register_listy and register_mappy, which are not. A plain
+# dict is several times faster to look up than a WeakKeyDictionary, so the
+# size cap is what keeps short-lived types, e.g. those of per-call
+# namedtuples or mocks, from being held forever.
+_MAX_CACHED_TYPES = 512
+_listy_types = {}
+_mappy_types = {}
+_listy_overrides = {}
+_mappy_overrides = {}
+_types_token = _abc_cache_token()
+
+
+def _is_listy(x):
+    return (
+        isinstance(x, Sized)
+        and isinstance(x, Iterable)
+        and not isinstance(x, (Mapping, type(b"")))
+        and not isinstance(x, six.string_types)
+    )
+
+
+def _is_mappy(x):
+    return isinstance(x, Mapping)
+
+
+def _classify(x, types, overrides, test):
+    """
+    Return the result of `test` for `x`, caching it by the type of `x`.
+
+    The most specific class in the MRO of ``type(x)`` found in `overrides`
+    takes precedence over `test`. Objects whose ``__class__`` is not their
+    type, e.g. proxies and mocks, are tested but never cached.
+    """
+    global _types_token
+    token = _abc_cache_token()
+    if token != _types_token:
+        _listy_types.clear()
+        _mappy_types.clear()
+        _types_token = token
+
+    x_type = type(x)
+    for cls in getattr(x_type, "__mro__", ()):
+        if cls in overrides:
+            result = overrides[cls]
+            break
+    else:
+        result = test(x)
+    if getattr(x, "__class__", None) is x_type:
+        if len(types) >= _MAX_CACHED_TYPES:
+            types.clear()
+        types[x_type] = result
+    return result
+
+
+def _register(cls, value, overrides):
+    if not isclass(cls):
+        raise TypeError("Expected a class, got {0!r}".format(cls), cls)
+    if value is None:
+        overrides.pop(cls, None)
+    else:
+        overrides[cls] = bool(value)
+    _listy_types.clear()
+    _mappy_types.clear()
+
+
+def register_listy(cls, listy=True):
+    """
+    Set whether instances of `cls` and its subclasses are "listy".
+
+    This overrides the usual "listy" test, e.g. for sized iterables that
+    should be treated as single values, or for sequences that do not
+    register themselves with `collections.abc`:
+
+    >>> class Point(tuple):
+    ...     pass
+    >>> register_listy(Point, False)
+    >>> listify(Point([1, 2]))
+    [(1, 2)]
+    >>> register_listy(Point, None)
+    >>> listify(Point([1, 2]))
+    [1, 2]
+
+    Args:
+        cls (class): The class to register.
+        listy (bool): Whether instances of `cls` are "listy", or `None`
+            to remove a previous registration. Defaults to True.
+
+    Raises:
+        TypeError: If `cls` is not a class.
+
+    """
+    _register(cls, listy, _listy_overrides)
+
+
+def register_mappy(cls, mappy=True):
+    """
+    Set whether instances of `cls` and its subclasses are "mappy".
+
+    This overrides the usual "mappy" test, e.g. for map-like classes that
+    do not register themselves with `collections.abc.Mapping`.
+
+    Args:
+        cls (class): The class to register.
+        mappy (bool): Whether instances of `cls` are "mappy", or `None` to
+            remove a previous registration. Defaults to True.
+
+    Raises:
+        TypeError: If `cls` is not a class.
+
+    """
+    _register(cls, mappy, _mappy_overrides)
+
+
+def is_listy(x):
+    """
+    Return True if `x` is "listy", i.e. a list-like object.
+
+    "Listy" is defined as a sized iterable which is neither a map nor a string:
+
+    >>> is_listy(['a', 'b'])
+    True
+    >>> is_listy(set())
+    True
+    >>> is_listy(iter(['a', 'b']))
+    False
+    >>> is_listy({'a': 'b'})
+    False
+    >>> is_listy('a regular string')
+    False
+
+    Note:
+        Iterables and generators fail the "listy" test because they
+        are not sized.
+
+    Note:
+        The result is cached by the type of `x`, until a class is registered
+        with any ABC, or with `register_listy`.
+
+    Args:
+        x (any value): The object to test.
+
+    Returns:
+        bool: True if `x` is "listy", False otherwise.
+
+    """
+    result = _listy_types.get(type(x))
+    if result is None or _types_token != _abc_cache_token():
+        result = _classify(x, _listy_types, _listy_overrides, _is_listy)
+    return result
+
+
+def listify(x, minlen=0, default=None, cls=None):
+    """
+    Return a listified version of `x`.
+
+    If `x` is a non-string iterable, it is wrapped in a list; otherwise
+    a list is returned with `x` as its only element. If `x` is `None`, an
+    empty list is returned.
+
+    >>> listify('a regular string')
+    ['a regular string']
+    >>> listify(tuple(['a', 'b', 'c']))
+    ['a', 'b', 'c']
+    >>> listify({'a': 'A'})
+    [{'a': 'A'}]
+    >>> listify(None)
+    []
+
+    Note:
+        Not guaranteed to return a copy of `x`. If `x` is already a list and
+        `cls` is not specified, then `x` itself is returned.
+
+    Args:
+        x (any value): Value to listify.
+
+        minlen (int): Minimum length of the returned list. If the returned
+            list would be shorter than `minlen` it is padded with values from
+            `default`. Defaults to 0.
+
+            >>> listify([], minlen=0)
+            []
+            >>> listify([], minlen=1)
+            [None]
+            >>> listify('item', minlen=3)
+            ['item', None, None]
+
+        default (any value): Value that should be used to pad the list if it
+            would be shorter than `minlen`:
+
+            >>> listify([], minlen=1, default='PADDING')
+            ['PADDING']
+            >>> listify('item', minlen=3, default='PADDING')
+            ['item', 'PADDING', 'PADDING']
+
+        cls (class or callable): Instead of wrapping `x` in a list, wrap it
+            in an instance of `cls`. `cls` should accept an iterable object
+            as its single parameter when called:
+
+            >>> from collections import deque
+            >>> listify(['a', 'b', 'c'], cls=deque)
+            deque(['a', 'b', 'c'])
+
+    Returns:
+        list or `cls`: A listified version of `x`.
+
+    """
+    if x is None:
+        x = []
+    elif not isinstance(x, list):
+        x = list(x) if is_listy(x) else [x]
+
+    if minlen and len(x) < minlen:
+        x.extend([default for i in range(minlen - len(x))])
+
+    if cls and not (isclass(cls) and issubclass(type(x), cls)):
+        x = cls(x)
+    return x
+
+
+def listview(x, minlen=0, default=None):
+    """
+    Return a list-like view of `x`, without copying it if possible.
+
+    Like `listify`, but "listy" objects that can be indexed, such as tuples,
+    ranges, `array.array`, `bytearray`, `memoryview` and NumPy arrays, are
+    returned as they are instead of being copied into a new list. Other
+    "listy" objects, such as sets, are copied into a list:
+
+    >>> listview((1, 2))
+    (1, 2)
+    >>> listview('a regular string')
+    ('a regular string',)
+    >>> listview(None)
+    ()
+    >>> listview({'a'})
+    ['a']
+
+    If `minlen` is given and the view would be shorter, it is wrapped in a
+    `paddedview`, which pads it with `default` without copying it:
+
+    >>> from array import array
+    >>> view = listview(array('i', [1, 2]), minlen=4, default=0)
+    >>> list(view)
+    [1, 2, 0, 0]
+
+    Note:
+        The returned view may be `x` itself, so it may be mutable, and it
+        reflects later changes to `x`. Use `listify` for a list that can be
+        changed without affecting `x`.
+
+    Args:
+        x (any value): Value to view as a list.
+
+        minlen (int): Minimum length of the returned view. If the view would
+            be shorter than `minlen` it is padded with `default`. Defaults to
+            0.
+
+        default (any value): Value that pads the view if it would be
+            shorter than `minlen`.
+
+    Returns:
+        sequence: A list-like view of `x`.
+
+    """
+    if x is None:
+        view = ()
+    elif is_listy(x):
+        view = x if hasattr(type(x), "__getitem__") else list(x)
+    else:
+        view = (x,)
+
+    if minlen and len(view) < minlen:
+        view = paddedview(view, minlen, default)
+    return view
+
+
+class paddedview(Sequence):
+    """
+    A read-only view of a sequence, padded to a minimum length.
+
+    >>> view = paddedview((1, 2), 4)
+    >>> list(view)
+    [1, 2, None, None]
+    >>> view[-1], view[:3]
+    (None, [1, 2, None])
+
+    The padding is never stored, and the view reflects changes to `seq`,
+    including its length.
+
+    Args:
+        seq (sequence): The sequence to pad.
+
+        minlen (int): The minimum length of the view.
+
+        default (any value): Value that pads `seq` if it is shorter than
+            `minlen`.
+
+    """
+
+    __slots__ = ("_seq", "_minlen", "_default")
+
+    def __init__(self, seq, minlen, default=None):
+        self._seq = seq
+        self._minlen = minlen
+        self._default = default
+
+    def __len__(self):
+        return max(len(self._seq), self._minlen)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        size = len(self._seq)
+        if index < 0:
+            index += len(self)
+        if 0 <= index < size:
+            return self._seq[index]
+        if size <= index < self._minlen:
+            return self._default
+        raise IndexError("paddedview index out of range")
+
+    def __iter__(self):
+        size = len(self._seq)
+        return chain(self._seq, repeat(self._default, self._minlen - size))
+
+    def __repr__(self):
+        return "{0}({1!r}, {2!r}, {3!r})".format(
+            type(self).__name__, self._seq, self._minlen, self._default
+        )
+
+
+def chunkify(x, size, cls=None):
+    """
+    Split `x` into chunks of `size` items, without copying it if possible.
+
+    Chunks are created lazily, as they are iterated over, and the last chunk
+    may be shorter than `size`:
+
+    >>> [list(chunk) for chunk in chunkify([1, 2, 3, 4, 5], 2)]
+    [[1, 2], [3, 4], [5]]
+
+    How `x` is split depends on its type:
+
+    * Bytes and other objects supporting the buffer protocol, except NumPy
+      arrays, are split into `memoryview` slices.
+    * NumPy arrays and ranges are sliced, which does not copy them.
+    * Other indexable "listy" objects, such as lists and tuples, are split
+      into `sliceview` objects, which index into `x` without copying it.
+    * Iterators, generators and other iterables are split into lists with
+      `itertools.islice`, so they never need to be listified first.
+    * Anything else, such as a string, is a single item, like in `listify`.
+
+    >>> [bytes(chunk) for chunk in chunkify(b'abcde', 2)]
+    [b'ab', b'cd', b'e']
+    >>> list(chunkify((n * n for n in range(5)), 2))
+    [[0, 1], [4, 9], [16]]
+
+    Args:
+        x (any value): Value to split into chunks.
+
+        size (int): The number of items in each chunk.
+
+        cls (class or callable): If given, each chunk is converted to `cls`,
+            e.g. `list` for code that requires lists. Defaults to `None`.
+
+    Yields:
+        sequence: A chunk of `x`.
+
+    Raises:
+        ValueError: If `size` is less than 1.
+
+    """
+    if size < 1:
+        raise ValueError(
+            "Chunk size must be at least 1, got {0!r}".format(size)
+        )
+    return _chunkify(x, size, cls)
+
+
+def _chunkify(x, size, cls):
+    numpy = sys.modules.get("numpy")
+    sliceable = (range,) if numpy is None else (range, numpy.ndarray)
+    if x is None:
+        chunks = iter(())
+    elif isinstance(x, sliceable):
+        chunks = (x[i : i + size] for i in range(0, len(x), size))
+    elif isinstance(x, (bytes, bytearray, memoryview, array)):
+        view = memoryview(x)
+        chunks = (view[i : i + size] for i in range(0, len(view), size))
+    elif is_listy(x) and hasattr(type(x), "__getitem__"):
+        chunks = (sliceview(x, i, i + size) for i in range(0, len(x), size))
+    elif isinstance(x, Iterable) and not isinstance(x, _SINGLE_ITEMS):
+        iterator = iter(x)
+        chunks = iter(lambda: list(islice(iterator, size)), [])
+    else:
+        chunks = iter([(x,)])
+
+    for chunk in chunks:
+        yield chunk if cls is None else cls(chunk)
+
+
+# Iterables that chunkify treats as a single item, like listify does
+_SINGLE_ITEMS = (Mapping,) + six.string_types
+
+
+class sliceview(Sequence):
+    """
+    A read-only view of the items of a sequence between two indices.
+
+    >>> view = sliceview(['a', 'b', 'c', 'd'], 1, 3)
+    >>> len(view), view[0], list(view)
+    (2, 'b', ['b', 'c'])
+
+    Indexing the view indexes `seq`, so nothing is copied, and changes to
+    the items of `seq` are visible through the view. Indices are clamped to
+    the length of `seq` when the view is created, like slices are.
+
+    Args:
+        seq (sequence): The sequence to view.
+        start (int): The index of the first item of the view.
+        stop (int): The index after the last item of the view.
+
+    """
+
+    __slots__ = ("_seq", "_start", "_stop")
+
+    def __init__(self, seq, start, stop):
+        start, stop, _ = slice(start, stop).indices(len(seq))
+        self._seq = seq
+        self._start = start
+        self._stop = max(start, stop)
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                return type(self)(
+                    self._seq, self._start + start, self._start + stop
+                )
+            return [self[i] for i in range(start, stop, step)]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("sliceview index out of range")
+        return self._seq[self._start + index]
+
+    def __iter__(self):
+        return map(self._seq.__getitem__, range(self._start, self._stop))
+
+    def __repr__(self):
+        return "{0}({1!r}, {2!r}, {3!r})".format(
+            type(self).__name__, self._seq, self._start, self._stop
+        )
+
+
+class lazylist(Sequence):
+    """
+    A read-only sequence that pulls items from an iterator as needed.
+
+    Items are only pulled from `iterable` when they are indexed or iterated
+    over, and are remembered so they can be accessed again, which makes it
+    possible to index generators and unbounded iterators:
+
+    >>> from itertools import count
+    >>> squares = lazylist(n * n for n in count())
+    >>> squares[3]
+    9
+    >>> squares
+    lazylist([0, 1, 4, 9, ...])
+    >>> squares[2:5]
+    [4, 9, 16]
+    >>> evens = squares[::2]
+    >>> evens[:3]
+    [0, 4, 16]
+
+    Slices without a stop, such as ``squares[::2]``, return another
+    `lazylist`, other slices return a list.
+
+    Note:
+        `len`, negative indices, and ``reversed`` pull every remaining
+        item, so they never return for unbounded iterators. Iterating over
+        a `lazylist` from several places at once is fine, since each
+        iteration only pulls the items the others have not.
+
+    Args:
+        iterable (iterable): The items of the sequence.
+
+    """
+
+    __slots__ = ("_items", "_iterator")
+
+    def __init__(self, iterable=()):
+        self._items = []
+        self._iterator = iter(iterable)
+
+    def _fill(self, size=None):
+        """Pull items until there are `size` of them, or all if `None`."""
+        if self._iterator is None:
+            return
+        if size is None:
+            self._items.extend(self._iterator)
+        elif size > len(self._items):
+            needed = size - len(self._items)
+            self._items.extend(islice(self._iterator, needed))
+            if len(self._items) >= size:
+                return
+        else:
+            return
+        self._iterator = None
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.start, index.stop, index.step
+            if stop is None and (start or 0) >= 0 and (step or 1) > 0:
+                return type(self)(islice(self, start, None, step))
+            if min(start or 0, stop or 0) < 0 or (step or 1) < 0:
+                self._fill()
+            else:
+                self._fill(stop)
+            return self._items[index]
+        if index < 0:
+            self._fill()
+        else:
+            self._fill(index + 1)
+        return self._items[index]
+
+    def __iter__(self):
+        i = 0
+        while True:
+            if i >= len(self._items):
+                self._fill(i + 1)
+                if i >= len(self._items):
+                    return
+            yield self._items[i]
+            i += 1
+
+    def __len__(self):
+        self._fill()
+        return len(self._items)
+
+    def __bool__(self):
+        self._fill(1)
+        return bool(self._items)
+
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        items = repr(self._items)
+        if self._iterator is not None:
+            items = items[:-1] + (", ...]" if self._items else "...]")
+        return "{0}({1})".format(type(self).__name__, items)
+
+
+def is_mappy(x):
+    """
+    Return True if `x` is "mappy", i.e. a map-like object.
+
+    "Mappy" is defined as any instance of `collections.Mapping`:
+
+    >>> is_mappy({'a': 'b'})
+    True
+    >>> from collections import defaultdict
+    >>> is_mappy(defaultdict(list))
+    True
+    >>> is_mappy('a regular string')
+    False
+    >>> is_mappy(['a', 'b'])
+    False
+    >>> is_listy(iter({'a': 'b'}))
+    False
+
+    Note:
+        Iterables and generators fail the "mappy" test.
+
+    Note:
+        The result is cached by the type of `x`, until a class is registered
+        with any ABC, or with `register_mappy`.
+
+    Args:
+        x (any value): The object to test.
+
+    Returns:
+        bool: True if `x` is "mappy", False otherwise.
+
+    """
+    result = _mappy_types.get(type(x))
+    if result is None or _types_token != _abc_cache_token():
+        result = _classify(x, _mappy_types, _mappy_overrides, _is_mappy)
+    return result
+
+
+def mappify(x, default=True, cls=None):
+    """
+    Return a mappified version of `x`.
+
+    If `x` is a string, it becomes the only key of the returned dict. If `x`
+    is a non-string iterable, the elements of `x` become keys in the returned
+    dict. The values of the returned dict are set to `default`. If `x` is
+    `None`, an empty dict is returned.
+
+    If `x` is a map, it is returned directly.
+
+    >>> mappify('a regular string')
+    {'a regular string': True}
+    >>> mappify(['a'])
+    {'a': True}
+    >>> mappify({'a': 'A'})
+    {'a': 'A'}
+    >>> mappify(None)
+    {}
+
+    Note:
+        Not guaranteed to return a copy of `x`. If `x` is already a map and
+        `cls` is not specified, then `x` itself is returned.
+
+    Args:
+        x (str, map, or iterable): Value to mappify.
+
+        default (any value): Value used to fill out missing values of the
+            returned dict.
+
+        cls (class or callable): Instead of wrapping `x` in a dict, wrap it
+            in an instance of `cls`. `cls` should accept a map object as
+            its single parameter when called:
+
+            >>> from collections import defaultdict
+            >>> mappify('a', cls=lambda x: defaultdict(None, x))
+            defaultdict(None, {'a': True})
+
+    Returns:
+        dict or `cls`: A mappified version of `x`.
+
+    Raises:
+        TypeError: If `x` is not a map, iterable, or string.
+
+    """
+    if x is None:
+        x = {}
+    elif not is_mappy(x):
+        if isinstance(x, six.string_types):
+            x = {x: default}
+        elif isinstance(x, Iterable):
+            # If cls is specified, attempt to preserve the order of x, in
+            # case cls is also a class that preserves order.
+            arg = [(v, default) for v in x]
+            x = OrderedDict(arg) if cls else dict(arg)
+        else:
+            raise TypeError(
+                "Unable to mappify non-mappy {0}".format(type(x)), x
+            )
+
+    if cls and not (isclass(cls) and issubclass(type(x), cls)):
+        x = cls(x)
+    return x
+
+
+class frozendict(Mapping):
+    """
+    An immutable, hashable dict.
+
+    Accepts the same arguments as `dict`, and can be used as a dict key or a
+    set member as long as its values are hashable. Its hash is computed the
+    first time it is needed, and then remembered:
+
+    >>> config = frozendict({'host': 'localhost', 'port': 80})
+    >>> cache = {config: 'connection'}
+    >>> cache[frozendict(port=80, host='localhost')]
+    'connection'
+
+    A `frozendict` is equal to any map with the same items, and works as the
+    `cls` of `mappify`:
+
+    >>> mappify(['a', 'b'], cls=frozendict) == {'a': True, 'b': True}
+    True
+
+    Use `freeze` to convert nested dicts and lists as well.
+
+    """
+
+    __slots__ = ("_dict", "_hash")
+
+    def __init__(self, *args, **kwargs):
+        self._dict = dict(*args, **kwargs)
+        self._hash = None
+
+    def __getitem__(self, key):
+        return self._dict[key]
+
+    def __contains__(self, key):
+        return key in self._dict
+
+    def __iter__(self):
+        return iter(self._dict)
+
+    def __len__(self):
+        return len(self._dict)
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(frozenset(self._dict.items()))
+        return self._hash
+
+    def __eq__(self, other):
+        if isinstance(other, frozendict):
+            if self._hash is not None and other._hash is not None:
+                if self._hash != other._hash:
+                    return False
+            return self._dict == other._dict
+        if isinstance(other, Mapping):
+            return self._dict == dict(other.items())
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __reduce__(self):
+        return type(self), (self._dict,)
+
+    def __repr__(self):
+        return "{0}({1!r})".format(type(self).__name__, self._dict)
+
+
+class frozenlist(Sequence):
+    """
+    An immutable, hashable list.
+
+    Like a tuple, but its hash is computed the first time it is needed, and
+    then remembered, and it is equal to lists and tuples with the same
+    items. It works as the `cls` of `listify`:
+
+    >>> key = listify('a', minlen=2, cls=frozenlist)
+    >>> key
+    frozenlist(['a', None])
+    >>> key == ['a', None] and key == ('a', None)
+    True
+    >>> {key: 1}[frozenlist(['a', None])]
+    1
+
+    Use `freeze` to convert nested dicts and lists as well.
+
+    Args:
+        iterable (iterable): The items of the list.
+
+    """
+
+    __slots__ = ("_items", "_hash")
+
+    def __init__(self, iterable=()):
+        self._items = tuple(iterable)
+        self._hash = None
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return type(self)(self._items[index])
+        return self._items[index]
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(self._items)
+        return self._hash
+
+    def __eq__(self, other):
+        if isinstance(other, frozenlist):
+            if self._hash is not None and other._hash is not None:
+                if self._hash != other._hash:
+                    return False
+            return self._items == other._items
+        if isinstance(other, (list, tuple)):
+            return self._items == tuple(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __reduce__(self):
+        return type(self), (self._items,)
+
+    def __repr__(self):
+        return "{0}({1!r})".format(type(self).__name__, list(self._items))
+
+
+def freeze(x):
+    """
+    Return an immutable, hashable copy of `x`, converting nested values too.
+
+    Maps become `frozendict`, lists and other "listy" objects become
+    `frozenlist`, sets become `frozenset`, bytearrays become bytes, and the
+    items of tuples, including namedtuples, are frozen. Anything else, such
+    as strings and numbers, is returned as is:
+
+    >>> config = freeze({'hosts': ['a', 'b'], 'retry': {'times': 3}})
+    >>> config['hosts']
+    frozenlist(['a', 'b'])
+    >>> config == {'hosts': ['a', 'b'], 'retry': {'times': 3}}
+    True
+    >>> isinstance(hash(config), int)
+    True
+
+    Args:
+        x (any value): The value to freeze.
+
+    Returns:
+        any value: An immutable copy of `x`, which is hashable as long as
+        everything it contains is hashable once frozen.
+
+    """
+    if is_mappy(x):
+        return frozendict((k, freeze(v)) for k, v in x.items())
+    if isinstance(x, tuple):
+        items = [freeze(v) for v in x]
+        return type(x)(*items) if hasattr(x, "_fields") else tuple(items)
+    if isinstance(x, (set, frozenset)):
+        return frozenset(map(freeze, x))
+    if isinstance(x, bytearray):
+        return bytes(x)
+    if is_listy(x):
+        return frozenlist(map(freeze, x))
+    return x
+
+
+def thaw(x):
+    """
+    Return a mutable copy of `x`, converting nested values too.
+
+    The inverse of `freeze`: maps become dicts, `frozenlist` and other
+    "listy" objects become lists, frozensets become sets, and the items of
+    tuples are thawed:
+
+    >>> config = thaw(freeze({'hosts': ['a', 'b']}))
+    >>> config['hosts'].append('c')
+    >>> config
+    {'hosts': ['a', 'b', 'c']}
+
+    Note:
+        The items of sets are not thawed, since they must be hashable.
+
+    Args:
+        x (any value): The value to thaw.
+
+    Returns:
+        any value: A mutable copy of `x`.
+
+    """
+    if is_mappy(x):
+        return dict((k, thaw(v)) for k, v in x.items())
+    if isinstance(x, tuple):
+        items = [thaw(v) for v in x]
+        return type(x)(*items) if hasattr(x, "_fields") else tuple(items)
+    if isinstance(x, (set, frozenset)):
+        return set(x)
+    if is_listy(x):
+        return [thaw(v) for v in x]
+    return x
+
+
+def nesteddefaultdict():
+    """
+    A defaultdict that returns nested defaultdicts as the default value.
+
+    Each defaultdict returned as the default value will also return nested
+    defaultdicts, and so on.
+
+    >>> nested = nesteddefaultdict()
+    >>> nested_child = nested['New Key 1']
+    >>> nested_child
+    defaultdict(...)
+    >>> nested_grandchild = nested_child['New Key 2']
+    >>> nested_grandchild
+    defaultdict(...)
+
+    Note:
+        Every level is a separate defaultdict, and reading a missing key
+        creates it. `pathtree` stores nested values more compactly, and
+        never creates anything when reading.
+
+    """
+    return defaultdict(nesteddefaultdict)
+
+
+# Marks a missing node or value in a pathtree, since None may be a value
+_MISSING = object()
+
+
+class _PathNode(dict):
+    """An inner node of a `pathtree`, mapping path segments to children."""
+
+    __slots__ = ()
+
+
+class pathtree(MutableMapping):
+    """
+    A tree of values addressed by paths.
+
+    A path is a tuple of keys, one per level of the tree, or a string of
+    keys separated by `sep`. Paths are like the keys of nested dicts, except
+    that intermediate levels are created when a value is set, and never when
+    a value is read:
+
+    >>> t = pathtree()
+    >>> t['a', 'b', 'c'] = 1
+    >>> t['a.b.d'] = 2
+    >>> t['a', 'b', 'c'], t.get('a.x.y')
+    (1, None)
+    >>> list(t.iterprefix('a.b'))
+    [(('a', 'b', 'c'), 1), (('a', 'b', 'd'), 2)]
+    >>> t.to_dict()
+    {'a': {'b': {'c': 1, 'd': 2}}}
+
+    A `pathtree` is a map whose keys are the full paths of its values, as
+    tuples, so a path that only leads to other values, like ``'a.b'``
+    above, is not a key. Each level is stored as a single dict, and values
+    are stored directly in the dict of their level.
+
+    Note:
+        A value cannot be stored at a path that leads to other values, and
+        a path cannot lead through a value; both raise `TypeError`.
+
+    Args:
+        items (Mapping or iterable): Paths and values to add, like the
+            arguments of `dict.update`. Defaults to `None`.
+        sep (str): The separator of keys in string paths. If `None`, a
+            string is a single key. Defaults to ".".
+
+    """
+
+    __slots__ = ("sep", "_root", "_len")
+
+    def __init__(self, items=None, sep="."):
+        self.sep = sep
+        self._root = _PathNode()
+        self._len = 0
+        if items is not None:
+            self.update(items)
+
+    @classmethod
+    def from_dict(cls, nested, sep="."):
+        """
+        Return a `pathtree` containing the values of nested maps.
+
+        Nested maps become levels of the tree, and everything else becomes
+        a value. Keys are never split on `sep`.
+
+        >>> t = pathtree.from_dict({'a': {'b': 1, 'c.d': 2}})
+        >>> t['a', 'b'], t['a', 'c.d']
+        (1, 2)
+
+        Args:
+            nested (Mapping): The nested maps.
+            sep (str): The separator of keys in string paths of the returned
+                tree. Defaults to ".".
+
+        Returns:
+            pathtree: A new tree.
+
+        """
+        tree = cls(sep=sep)
+        stack = [(nested, tree._root)]
+        while stack:
+            source, node = stack.pop()
+            for key, value in source.items():
+                if is_mappy(value):
+                    child = node[key] = _PathNode()
+                    stack.append((value, child))
+                else:
+                    node[key] = value
+                    tree._len += 1
+        return tree
+
+    def to_dict(self):
+        """
+        Return the values of the tree as nested dicts.
+
+        Returns:
+            dict: A new dict for every level of the tree.
+
+        """
+        result = {}
+        stack = [(self._root, result)]
+        while stack:
+            node, out = stack.pop()
+            for key, child in node.items():
+                if type(child) is _PathNode:
+                    out[key] = {}
+                    stack.append((child, out[key]))
+                else:
+                    out[key] = child
+        return result
+
+    def _path(self, path):
+        """Return `path` as a tuple of keys."""
+        if isinstance(path, tuple):
+            return path
+        if isinstance(path, six.string_types) and self.sep:
+            return tuple(path.split(self.sep))
+        if isinstance(path, list):
+            return tuple(path)
+        return (path,)
+
+    def _node(self, path):
+        """Return the node or value at `path`, or `_MISSING`."""
+        node = self._root
+        for key in path:
+            if type(node) is not _PathNode:
+                return _MISSING
+            node = node.get(key, _MISSING)
+            if node is _MISSING:
+                break
+        return node
+
+    def __getitem__(self, path):
+        value = self._node(self._path(path))
+        if value is _MISSING or type(value) is _PathNode:
+            raise KeyError(path)
+        return value
+
+    def __contains__(self, path):
+        value = self._node(self._path(path))
+        return value is not _MISSING and type(value) is not _PathNode
+
+    def __setitem__(self, path, value):
+        keys = self._path(path)
+        node = self._root
+        for i, key in enumerate(keys[:-1]):
+            child = node.get(key, _MISSING)
+            if child is _MISSING:
+                child = node[key] = _PathNode()
+            elif type(child) is not _PathNode:
+                raise TypeError(
+                    "Unable to set {0!r} under the value at {1!r}".format(
+                        path, keys[: i + 1]
+                    )
+                )
+            node = child
+        if not keys:
+            raise TypeError("Unable to set a value at the root")
+        old = node.get(keys[-1], _MISSING)
+        if old is _MISSING or (type(old) is _PathNode and not old):
+            self._len += 1
+        elif type(old) is _PathNode:
+            raise TypeError(
+                "Unable to set {0!r}, it leads to other values".format(path)
+            )
+        node[keys[-1]] = value
+
+    def __delitem__(self, path):
+        keys = self._path(path)
+        parents = []
+        node = self._root
+        for key in keys:
+            if type(node) is not _PathNode or key not in node:
+                raise KeyError(path)
+            parents.append(node)
+            node = node[key]
+        if not keys or type(node) is _PathNode:
+            raise KeyError(path)
+        for node, key in zip(reversed(parents), reversed(keys)):
+            del node[key]
+            if node or node is self._root:
+                break
+        self._len -= 1
+
+    def __iter__(self):
+        for path, _ in self.iterprefix(()):
+            yield path
+
+    def __len__(self):
+        return self._len
+
+    def iterprefix(self, prefix):
+        """
+        Iterate over the paths and values under `prefix`.
+
+        Args:
+            prefix: A path, which is included if it is itself the path of a
+                value.
+
+        Yields:
+            tuple: A (path, value) pair, where path is a tuple, for every
+            value whose path starts with `prefix`.
+
+        """
+        prefix = self._path(prefix)
+        node = self._node(prefix)
+        if node is _MISSING:
+            return
+        if type(node) is not _PathNode:
+            yield prefix, node
+            return
+        stack = [(prefix, iter(node.items()))]
+        while stack:
+            path, children = stack[-1]
+            for key, child in children:
+                if type(child) is _PathNode:
+                    stack.append((path + (key,), iter(child.items())))
+                    break
+                yield path + (key,), child
+            else:
+                stack.pop()
+
+    def clear(self):
+        self._root = _PathNode()
+        self._len = 0
+
+    def copy(self):
+        return type(self)(self.iterprefix(()), self.sep)
+
+    __copy__ = copy
+
+    def __reduce__(self):
+        return type(self), (None, self.sep), None, None, self.iterprefix(())
+
+    def __repr__(self):
+        return "{0}({1!r})".format(
+            type(self).__name__, dict(self.iterprefix(()))
+        )
+
+
+def _merge_last(path, old, new):
+    return new
+
+
+def _merge_first(path, old, new):
+    return old
+
+
+def _merge_concat(path, old, new):
+    return listify(old) + listify(new)
+
+
+def _merge_error(path, old, new):
+    raise ValueError(
+        "Conflicting values at {0!r}: {1!r} and {2!r}".format(path, old, new),
+        path,
+    )
+
+
+_MERGE_CONFLICTS = {
+    "last": _merge_last,
+    "first": _merge_first,
+    "concat": _merge_concat,
+    "error": _merge_error,
+}
+
+
+def deepmerge(maps, conflict="last"):
+    """
+    Merge nested maps into a new nested dict.
+
+    Maps at the same path are merged, and other values at the same path
+    conflict, and are resolved by `conflict`:
+
+    >>> defaults = {'db': {'host': 'localhost', 'port': 5432}}
+    >>> config = {'db': {'host': 'db.example.com'}, 'debug': True}
+    >>> merged = deepmerge([defaults, config])
+    >>> merged['db']['host'], merged['db']['port'], merged['debug']
+    ('db.example.com', 5432, True)
+    >>> merged = deepmerge([defaults, config], conflict='first')
+    >>> merged['db']['host']
+    'localhost'
+
+    The maps are never modified, and a new dict is created for every nested
+    map, though other values are not copied. Maps are merged with an
+    explicit stack rather than recursion, so they may be arbitrarily deep.
+
+    Args:
+        maps (list): The nested maps to merge, in order.
+        conflict (str or callable): How to resolve conflicting values:
+            "last" keeps the value from the last map, "first" keeps the
+            value from the first map, "concat" concatenates both values as
+            lists, using `listify`, and "error" raises `ValueError`. If
+            callable, it is called with the path of the conflict, as a
+            tuple, the value so far, and the new value, and returns the
+            value to keep. Defaults to "last".
+
+    Returns:
+        dict: The merged maps.
+
+    Raises:
+        ValueError: If `conflict` is "error" and values conflict, or if
+            `conflict` is an unknown strategy.
+
+    """
+    if callable(conflict):
+        resolve = conflict
+    elif conflict in _MERGE_CONFLICTS:
+        resolve = _MERGE_CONFLICTS[conflict]
+    else:
+        raise ValueError(
+            "Unknown conflict strategy {0!r}, expected one of: {1}".format(
+                conflict, ", ".join(sorted(_MERGE_CONFLICTS))
+            ),
+            conflict,
+        )
+
+    merged = {}
+    for source in maps:
+        stack = [((), source, merged)]
+        while stack:
+            path, source, target = stack.pop()
+            for key, value in source.items():
+                old = target.get(key, _MISSING)
+                if type(old) is dict and is_mappy(value):
+                    stack.append((path + (key,), value, old))
+                    continue
+                if old is not _MISSING:
+                    value = resolve(path + (key,), old, value)
+                    if value is old:
+                        continue
+                if is_mappy(value):
+                    child = target[key] = {}
+                    stack.append((path + (key,), value, child))
+                else:
+                    target[key] = value
+    return merged
+
+
+def flatten(nested, sep=None):
+    """
+    Flatten nested maps into a single dict keyed by paths.
+
+    >>> flat = flatten({'a': {'b': 1, 'c': {'d': 2}}, 'e': 3})
+    >>> flat == {('a', 'b'): 1, ('a', 'c', 'd'): 2, ('e',): 3}
+    True
+    >>> flatten({'a': {'b': 1}}, sep='.')
+    {'a.b': 1}
+
+    Empty nested maps are kept as values, so `unflatten` can restore them.
+    Maps are flattened with an explicit stack rather than recursion, so
+    they may be arbitrarily deep.
+
+    Args:
+        nested (Mapping): The nested maps to flatten.
+        sep (str): If given, paths are strings of the keys, converted with
+            `str`, joined by `sep`. Otherwise, paths are tuples. Defaults
+            to `None`.
+
+    Returns:
+        dict: The values of `nested` keyed by their paths.
+
+    """
+    flat = {}
+    stack = [((), iter(nested.items()))]
+    while stack:
+        path, items = stack[-1]
+        for key, value in items:
+            if is_mappy(value) and value:
+                stack.append((path + (key,), iter(value.items())))
+                break
+            flat[path + (key,)] = value
+        else:
+            stack.pop()
+    if sep is not None:
+        flat = dict(
+            (sep.join(map(str, path)), value) for path, value in flat.items()
+        )
+    return flat
+
+
+def unflatten(flat, sep=None):
+    """
+    Convert a dict keyed by paths into nested dicts.
+
+    The inverse of `flatten`:
+
+    >>> unflatten({('a', 'b'): 1, ('a', 'c'): 2})
+    {'a': {'b': 1, 'c': 2}}
+    >>> unflatten({'a.b': 1}, sep='.')
+    {'a': {'b': 1}}
+
+    Args:
+        flat (Mapping): Values keyed by paths, which are tuples of keys, or
+            strings of keys joined by `sep`. Other keys are paths of a
+            single key.
+        sep (str): The separator of keys in string paths. If `None`, a
+            string is a single key. Defaults to `None`.
+
+    Returns:
+        dict: The values of `flat` in nested dicts.
+
+    Raises:
+        ValueError: If one path leads through the value of another path, or
+            a path is empty.
+
+    """
+    nested = {}
+    branches = set()
+    for path, value in flat.items():
+        if isinstance(path, six.string_types) and sep is not None:
+            path = path.split(sep)
+        elif not isinstance(path, tuple):
+            path = (path,)
+        if not path:
+            raise ValueError("Unable to unflatten an empty path", path)
+        target = nested
+        for i, key in enumerate(path[:-1]):
+            child = target.get(key, _MISSING)
+            if child is _MISSING:
+                child = target[key] = {}
+                branches.add(id(child))
+            elif id(child) not in branches:
+                raise ValueError(
+                    "Conflicting paths at {0!r}".format(tuple(path[: i + 1])),
+                    path,
+                )
+            target = child
+        if path[-1] in target:
+            raise ValueError(
+                "Conflicting paths at {0!r}".format(tuple(path)), path
+            )
+        target[path[-1]] = value
+    return nested
+
+
+# The hashes of persistentmap keys are split into 5 bit chunks, one per level
+# of the trie, so each node has up to 32 entries
+_HAMT_BITS = 5
+_HAMT_MASK = (1 << _HAMT_BITS) - 1
+_UINT64_MASK = (1 << 64) - 1
+
+try:
+    _popcount = int.bit_count
+except AttributeError:  # pragma: no cover
+
+    def _popcount(n):
+        return bin(n).count("1")
+
+
+class _HamtNode(object):
+    """
+    A node of a hash array mapped trie.
+
+    Each bit set in `bitmap` is a 5 bit chunk of hash, and has an entry in
+    `entries`, in bit order. An entry is either a (hash, key, value) leaf
+    tuple, a `_HamtNode` for the next chunk of hash, or a `_HamtCollision`.
+    Nodes are never modified once created.
+    """
+
+    __slots__ = ("bitmap", "entries")
+
+    def __init__(self, bitmap, entries):
+        self.bitmap = bitmap
+        self.entries = entries
+
+
+class _HamtCollision(object):
+    """The (hash, key, value) leaf tuples of different keys with one hash."""
+
+    __slots__ = ("hash", "entries")
+
+    def __init__(self, hash, entries):
+        self.hash = hash
+        self.entries = entries
+
+
+_HAMT_EMPTY = _HamtNode(0, ())
+
+
+def _hamt_find(node, h, key):
+    """Return the leaf tuple for `key` with hash `h`, or `None`."""
+    shift = 0
+    while True:
+        if type(node) is _HamtCollision:
+            if node.hash == h:
+                for leaf in node.entries:
+                    if leaf[1] is key or leaf[1] == key:
+                        return leaf
+            return None
+        bit = 1 << ((h >> shift) & _HAMT_MASK)
+        if not node.bitmap & bit:
+            return None
+        entry = node.entries[_popcount(node.bitmap & (bit - 1))]
+        if type(entry) is tuple:
+            if entry[0] == h and (entry[1] is key or entry[1] == key):
+                return entry
+            return None
+        node = entry
+        shift += _HAMT_BITS
+
+
+def _hamt_assoc(node, shift, leaf):
+    """
+    Return a copy of `node` containing `leaf`, and whether it was added.
+
+    Only the nodes on the path to `leaf` are copied; the rest are shared.
+    If the key of `leaf` is already set to the same object, `node` itself
+    is returned.
+    """
+    h, key = leaf[0], leaf[1]
+    if type(node) is _HamtCollision:
+        if node.hash == h:
+            for i, old in enumerate(node.entries):
+                if old[1] is key or old[1] == key:
+                    if old[2] is leaf[2]:
+                        return node, False
+                    entries = (
+                        node.entries[:i] + (leaf,) + node.entries[i + 1 :]
+                    )
+                    return _HamtCollision(h, entries), False
+            return _HamtCollision(h, node.entries + (leaf,)), True
+        node = _HamtNode(1 << ((node.hash >> shift) & _HAMT_MASK), (node,))
+
+    bit = 1 << ((h >> shift) & _HAMT_MASK)
+    index = _popcount(node.bitmap & (bit - 1))
+    entries = node.entries
+    if not node.bitmap & bit:
+        entries = entries[:index] + (leaf,) + entries[index:]
+        return _HamtNode(node.bitmap | bit, entries), True
+
+    entry = entries[index]
+    added = True
+    if type(entry) is not tuple:
+        child, added = _hamt_assoc(entry, shift + _HAMT_BITS, leaf)
+        if child is entry:
+            return node, False
+    elif entry[0] != h:
+        next_shift = shift + _HAMT_BITS
+        bits = (entry[0] >> next_shift) & _HAMT_MASK
+        split = _HamtNode(1 << bits, (entry,))
+        child = _hamt_assoc(split, next_shift, leaf)[0]
+    elif entry[1] is key or entry[1] == key:
+        if entry[2] is leaf[2]:
+            return node, False
+        child, added = leaf, False
+    else:
+        child = _HamtCollision(h, (entry, leaf))
+    entries = entries[:index] + (child,) + entries[index + 1 :]
+    return _HamtNode(node.bitmap, entries), added
+
+
+def _hamt_dissoc(node, shift, h, key):
+    """
+    Return a copy of `node` without `key`, or `None` if it would be empty.
+
+    If `key` is missing, `node` itself is returned. Inner nodes left with
+    only a leaf or a collision are replaced by it.
+    """
+    if type(node) is _HamtCollision:
+        if node.hash == h:
+            for i, old in enumerate(node.entries):
+                if old[1] is key or old[1] == key:
+                    entries = node.entries[:i] + node.entries[i + 1 :]
+                    if len(entries) == 1:
+                        return entries[0]
+                    return _HamtCollision(h, entries)
+        return node
+
+    bit = 1 << ((h >> shift) & _HAMT_MASK)
+    if not node.bitmap & bit:
+        return node
+    index = _popcount(node.bitmap & (bit - 1))
+    entries = node.entries
+    entry = entries[index]
+    if type(entry) is tuple:
+        if entry[0] != h or not (entry[1] is key or entry[1] == key):
+            return node
+        child = None
+    else:
+        child = _hamt_dissoc(entry, shift + _HAMT_BITS, h, key)
+        if child is entry:
+            return node
+        if (
+            type(child) is _HamtNode
+            and len(child.entries) == 1
+            and type(child.entries[0]) is not _HamtNode
+        ):
+            child = child.entries[0]
+
+    if child is not None:
+        entries = entries[:index] + (child,) + entries[index + 1 :]
+        return _HamtNode(node.bitmap, entries)
+    if len(entries) == 1:
+        return None
+    entries = entries[:index] + entries[index + 1 :]
+    return _HamtNode(node.bitmap ^ bit, entries)
+
+
+def _hamt_leaves(node):
+    """Iterate over the (hash, key, value) leaf tuples under `node`."""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        for entry in node.entries:
+            if type(entry) is tuple:
+                yield entry
+            else:
+                stack.append(entry)
+
+
+class persistentmap(Mapping):
+    """
+    An immutable map whose changed copies share most of their structure.
+
+    Instead of being modified, a `persistentmap` returns a new version of
+    itself from `set`, `delete`, `set_in`, and `delete_in`, which only
+    copies the O(log n) nodes of a hash array mapped trie (HAMT) on the way
+    to the changed key, and shares everything else with the old version.
+    Old versions are unaffected, so they can be handed to other threads as
+    snapshots without copying or locking:
+
+    >>> state = persistentmap.from_dict({
+    ...   'hosts': {'a': 'up', 'b': 'up'},
+    ...   'config': {'retries': 3}})
+    >>> snapshot = state
+    >>> state = state.set_in(('hosts', 'b'), 'down')
+    >>> state.get_in(('hosts', 'b')), snapshot.get_in(('hosts', 'b'))
+    ('down', 'up')
+    >>> state['config'] is snapshot['config']
+    True
+
+    Nested maps are `persistentmap` too, so `set_in` only copies the maps
+    on the way to the changed key, in O(depth * log n).
+
+    Note:
+        "Persistent" refers to old versions persisting after changes, not
+        to storage; see `persistentkeydefaultdict` for that. Keys are not
+        kept in insertion order.
+
+    Args:
+        items (Mapping or iterable): Keys and values, like the arguments of
+            `dict`. Defaults to `None`.
+
+    """
+
+    __slots__ = ("_root", "_len")
+
+    def __init__(self, items=None, **kwargs):
+        if kwargs:
+            items = dict(items or (), **kwargs)
+        if is_mappy(items):
+            items = items.items()
+        root, size = _HAMT_EMPTY, 0
+        for key, value in items or ():
+            leaf = (hash(key) & _UINT64_MASK, key, value)
+            root, added = _hamt_assoc(root, 0, leaf)
+            size += added
+        self._root = root
+        self._len = size
+
+    @classmethod
+    def _make(cls, root, size):
+        new = cls.__new__(cls)
+        new._root = _HAMT_EMPTY if root is None else root
+        new._len = size
+        return new
+
+    def __getitem__(self, key):
+        leaf = _hamt_find(self._root, hash(key) & _UINT64_MASK, key)
+        if leaf is None:
+            raise KeyError(key)
+        return leaf[2]
+
+    def __contains__(self, key):
+        h = hash(key) & _UINT64_MASK
+        return _hamt_find(self._root, h, key) is not None
+
+    def __iter__(self):
+        for leaf in _hamt_leaves(self._root):
+            yield leaf[1]
+
+    def __len__(self):
+        return self._len
+
+    def set(self, key, value):
+        """
+        Return a copy with `key` set to `value`.
+
+        Returns:
+            persistentmap: The new version, or this one if `key` is already
+            set to `value` itself.
+
+        """
+        leaf = (hash(key) & _UINT64_MASK, key, value)
+        root, added = _hamt_assoc(self._root, 0, leaf)
+        if root is self._root:
+            return self
+        return self._make(root, self._len + added)
+
+    def delete(self, key):
+        """
+        Return a copy without `key`.
+
+        Raises:
+            KeyError: If `key` is missing.
+
+        """
+        h = hash(key) & _UINT64_MASK
+        root = _hamt_dissoc(self._root, 0, h, key)
+        if root is self._root:
+            raise KeyError(key)
+        return self._make(root, self._len - 1)
+
+    def _path(self, path):
+        path = tuple(path) if isinstance(path, (tuple, list)) else (path,)
+        if not path:
+            raise ValueError("Path must contain at least one key", path)
+        return path
+
+    def get_in(self, path, default=None):
+        """
+        Return the value at `path` in nested maps, or `default`.
+
+        Args:
+            path (tuple): The key at each level. A value that is not a tuple
+                or list is a single key.
+            default (any value): Returned if `path` is missing. Defaults to
+                `None`.
+
+        """
+        value = self
+        for key in self._path(path):
+            if not is_mappy(value) or key not in value:
+                return default
+            value = value[key]
+        return value
+
+    def set_in(self, path, value):
+        """
+        Return a copy with the value at `path` in nested maps set to `value`.
+
+        Missing maps on the way to `value` are created.
+
+        Args:
+            path (tuple): The key at each level. A value that is not a tuple
+                or list is a single key.
+            value (any value): The value to set.
+
+        Returns:
+            persistentmap: The new version.
+
+        Raises:
+            TypeError: If `path` leads through a value that is not a
+                `persistentmap`.
+
+        """
+        path = self._path(path)
+        maps = [self]
+        for i, key in enumerate(path[:-1]):
+            child = maps[-1].get(key, _MISSING)
+            if child is _MISSING:
+                child = type(self)()
+            elif not isinstance(child, persistentmap):
+                raise TypeError(
+                    "Unable to set {0!r} under the value at {1!r}".format(
+                        path, path[: i + 1]
+                    )
+                )
+            maps.append(child)
+        for parent, key in zip(reversed(maps), reversed(path)):
+            value = parent.set(key, value)
+        return value
+
+    def delete_in(self, path):
+        """
+        Return a copy without the value at `path` in nested maps.
+
+        Maps left empty are kept.
+
+        Raises:
+            KeyError: If `path` is missing.
+
+        """
+        path = self._path(path)
+        maps = [self]
+        for key in path[:-1]:
+            child = maps[-1].get(key, _MISSING)
+            if not isinstance(child, persistentmap):
+                raise KeyError(path)
+            maps.append(child)
+        try:
+            value = maps[-1].delete(path[-1])
+        except KeyError:
+            six.raise_from(KeyError(path), None)
+        for parent, key in zip(reversed(maps[:-1]), reversed(path[:-1])):
+            value = parent.set(key, value)
+        return value
+
+    @classmethod
+    def from_dict(cls, nested):
+        """
+        Return a `persistentmap` of nested maps, converting each of them.
+
+        Args:
+            nested (Mapping): The nested maps.
+
+        Returns:
+            persistentmap: A new map.
+
+        """
+        stack = [(None, iter(nested.items()), [])]
+        while True:
+            _, items, converted = stack[-1]
+            for key, value in items:
+                if is_mappy(value) and not isinstance(value, persistentmap):
+                    stack.append((key, iter(value.items()), []))
+                    break
+                converted.append((key, value))
+            else:
+                key, _, converted = stack.pop()
+                value = cls(converted)
+                if not stack:
+                    return value
+                stack[-1][2].append((key, value))
+
+    def to_dict(self):
+        """
+        Return the map as a dict, converting nested `persistentmap` too.
+
+        Returns:
+            dict: A new dict for every nested `persistentmap`.
+
+        """
+        result = {}
+        stack = [(self, result)]
+        while stack:
+            source, out = stack.pop()
+            for _, key, value in _hamt_leaves(source._root):
+                if isinstance(value, persistentmap):
+                    out[key] = {}
+                    stack.append((value, out[key]))
+                else:
+                    out[key] = value
+        return result
+
+    def __reduce__(self):
+        return type(self), (list(self.items()),)
+
+    def __repr__(self):
+        return "{0}({1!r})".format(type(self).__name__, dict(self.items()))
 
 
 def readable_join(xs, conjunction="and", sep=","):
@@ -456,6 +4312,172 @@ def readable_join(xs, conjunction="and", sep=","):
     return (sep + " " if len(xs) > 2 else " ").join(xs)
 
 
+_UNHASHABLE = object()
+
+
+def iuniquify(x, key=None, mode="exact", maxsize=100000, error_rate=0.001):
+    """
+    Yield the items of `x` lazily, skipping items seen before.
+
+    Unlike `uniquify`, `x` may be any iterable, including unbounded ones,
+    and items are yielded as soon as they are pulled from `x`:
+
+    >>> from itertools import cycle, islice
+    >>> list(islice(iuniquify(cycle('abcab'), mode='lru', maxsize=3), 3))
+    ['a', 'b', 'c']
+
+    Unhashable keys, such as dicts and lists, are compared by their
+    `freeze` copies, as in `uniquify`.
+
+    `mode` trades exactness for bounded memory:
+
+    * "exact" remembers every key, so memory grows with the number of
+      distinct keys.
+    * "lru" remembers the `maxsize` most recently seen keys, so a key is
+      only skipped if it was seen among them.
+    * "bloom" remembers keys in a Bloom filter sized for `maxsize` keys,
+      using about 1.44 * log2(1 / `error_rate`) bits per key, e.g. under
+      2 bytes per key for the default `error_rate`. An item is
+      wrongly skipped as a duplicate with probability `error_rate`, which
+      grows once more than `maxsize` distinct keys are seen. Duplicates
+      are never yielded.
+
+    Args:
+        x (iterable): Items to uniquify.
+        key (str or callable): Used to extract a comparison key from each
+            item, see `uniquify`. By default, compares the items directly.
+        mode (str): One of "exact", "lru", or "bloom". Defaults to "exact".
+        maxsize (int): The number of keys remembered in "lru" mode, or
+            expected in "bloom" mode. Defaults to 100000.
+        error_rate (float): The probability that an item is wrongly skipped
+            in "bloom" mode. Defaults to 0.001.
+
+    Returns:
+        iterator: The items of `x`, without duplicates.
+
+    Raises:
+        ValueError: If `mode` is unknown, `maxsize` is less than 1, or
+            `error_rate` is not between 0 and 1.
+
+    """
+    if mode not in ("exact", "lru", "bloom"):
+        raise ValueError(
+            "Unknown mode {0!r}, expected one of: bloom, exact, lru".format(
+                mode
+            ),
+            mode,
+        )
+    if maxsize < 1:
+        raise ValueError("maxsize must be at least 1", maxsize)
+    if mode == "exact":
+        seen = _ExactSeen()
+    elif mode == "lru":
+        seen = _LRUSeen(maxsize)
+    elif not 0 < error_rate < 1:
+        raise ValueError("error_rate must be between 0 and 1", error_rate)
+    else:
+        seen = _BloomSeen(maxsize, error_rate)
+    return _iuniquify(x, key, seen.add)
+
+
+def _iuniquify(x, key, add):
+    getters = keydefaultdict(functools.partial(_keygetter, key))
+    item_type = None
+    for item in x:
+        if type(item) is not item_type:
+            item_type = type(item)
+            get_key = getters[item_type]
+        item_key = get_key(item)
+        try:
+            added = add(item_key)
+        except TypeError:
+            added = add((_UNHASHABLE, freeze(item_key)))
+        if added:
+            yield item
+
+
+class _ExactSeen(object):
+    """Remembers every key for `iuniquify`."""
+
+    __slots__ = ("_keys",)
+
+    def __init__(self):
+        # A dict, so that set keys raise TypeError as in `uniquify`
+        self._keys = {}
+
+    def add(self, key):
+        """Remember `key`, and return True if it was not seen before."""
+        if key in self._keys:
+            return False
+        self._keys[key] = None
+        return True
+
+
+class _LRUSeen(object):
+    """Remembers the most recently seen keys for `iuniquify`."""
+
+    __slots__ = ("_keys", "_maxsize")
+
+    def __init__(self, maxsize):
+        self._keys = OrderedDict()
+        self._maxsize = maxsize
+
+    def add(self, key):
+        """Remember `key`, and return True if it was not seen recently."""
+        keys = self._keys
+        if key in keys:
+            del keys[key]
+            keys[key] = None
+            return False
+        if len(keys) >= self._maxsize:
+            keys.popitem(last=False)
+        keys[key] = None
+        return True
+
+
+class _BloomSeen(object):
+    """
+    Remembers keys approximately, in a Bloom filter, for `iuniquify`.
+
+    The bit positions of a key are derived from two hashes of it, using
+    double hashing; both come from scrambling ``hash(key)`` with splitmix64,
+    since the hashes of small ints are the ints themselves.
+    """
+
+    __slots__ = ("_bits", "_size", "_hashes")
+
+    def __init__(self, capacity, error_rate):
+        size = int(math.ceil(-capacity * math.log(error_rate) / _LN2 ** 2))
+        self._size = max(size, 8)
+        self._hashes = max(1, int(round(self._size / capacity * _LN2)))
+        self._bits = bytearray((self._size + 7) // 8)
+
+    def add(self, key):
+        """Remember `key`, and return True if it was probably not seen."""
+        h = _splitmix64(hash(key) & _UINT64_MASK)
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        bits, size = self._bits, self._size
+        added = False
+        for i in range(self._hashes):
+            position = (h1 + i * h2) % size
+            byte, mask = position >> 3, 1 << (position & 7)
+            if not bits[byte] & mask:
+                bits[byte] |= mask
+                added = True
+        return added
+
+
+_LN2 = math.log(2)
+
+
+def _splitmix64(n):
+    """Scramble the bits of a 64 bit int."""
+    n = (n + 0x9E3779B97F4A7C15) & _UINT64_MASK
+    n = ((n ^ (n >> 30)) * 0xBF58476D1CE4E5B9) & _UINT64_MASK
+    n = ((n ^ (n >> 27)) * 0x94D049BB133111EB) & _UINT64_MASK
+    return n ^ (n >> 31)
+
+
 def uniquify(x, key=lambda o: o, cls=None):
     """
     Returns an order-preserved copy of `x` with duplicate items removed.
@@ -468,13 +4490,23 @@ def uniquify(x, key=lambda o: o, cls=None):
 
         key (str or callable): Similar to `sorted`, specifies an attribute or
             function of one argument that is used to extract a comparison key
-            from each list element: key=str.lower. By default, compares the
-            elements directly.
+            from each list element: key=str.lower. Any key accepted by
+            `keygetter` may be used, including dict keys and dotted paths.
+            By default, compares the elements directly.
 
             >>> strings = ['ASDF', 'asdf', 'ZXCV', 'zxcv']
             >>> uniquify(strings, key=str.lower)
             ['ASDF', 'ZXCV']
 
+            Keys need not be hashable. Unhashable keys, such as the dicts
+            and lists of JSON records, are compared by their `freeze`
+            copies, and keys that are still unhashable are sorted instead,
+            so the cost stays near linear:
+
+            >>> records = [{'id': [1]}, {'id': [2]}, {'id': [1]}]
+            >>> uniquify(records, key='id')
+            [{'id': [1]}, {'id': [2]}]
+
         cls (class or callable): Instead of wrapping `x` in a list, wrap it
             in an instance of `cls`. `cls` should accept an iterable object
             as its single parameter when called:
@@ -487,15 +4519,68 @@ def uniquify(x, key=lambda o: o, cls=None):
         list: An order-preserved copy of `x` with duplicate items removed.
 
     Raises:
-        TypeError: If `x` is not "listy".
+        TypeError: If `x` is not "listy", or if some keys are neither
+            hashable once frozen nor orderable.
 
     """
     if not is_listy(x):
         raise TypeError("Unable to uniquify non-listy {0}".format(type(x)), x)
-    seen = set()
-    keys = [(key(o) if callable(key) else getattr(o, key), o) for o in x]
-    x = [o for k, o in keys if k not in seen and not seen.add(k)]
+    getters = keydefaultdict(functools.partial(_keygetter, key))
+    keys = []
+    item_type = None
+    for o in x:
+        if type(o) is not item_type:
+            item_type = type(o)
+            get_key = getters[item_type]
+        keys.append((get_key(o), o))
+    # A dict rather than a set, because `k in set()` looks a set key up as
+    # a frozenset instead of raising TypeError like every other unhashable
+    # key, and is no faster.
+    seen = {}
+    try:
+        x = [o for k, o in keys if k not in seen and not seen.setdefault(k)]
+    except TypeError:
+        x = _uniquify_unhashable(keys)
 
     if cls and not (isclass(cls) and issubclass(type(x), cls)):
         x = cls(x)
     return x
+
+
+def _uniquify_unhashable(keys):
+    """Uniquify `(key, item)` pairs, some of whose keys are unhashable."""
+    seen = set()
+    unique = [False] * len(keys)
+    unhashable = []
+    for i, (k, o) in enumerate(keys):
+        # Not `k in seen`, which looks up a set as a frozenset instead of
+        # raising.
+        try:
+            hash(k)
+        except TypeError:
+            k = (_UNHASHABLE, freeze(k))
+            try:
+                hash(k)
+            except TypeError:
+                unhashable.append(i)
+                continue
+        if k not in seen:
+            seen.add(k)
+            unique[i] = True
+
+    # The sort is stable, so equal keys end up adjacent with the first one
+    # seen leading its run.
+    try:
+        unhashable.sort(key=lambda i: keys[i][0])
+    except TypeError:
+        raise TypeError(
+            "Unable to uniquify keys that are neither hashable nor orderable",
+            [keys[i][0] for i in unhashable],
+        )
+    previous = _MISSING
+    for i in unhashable:
+        k = keys[i][0]
+        if previous is _MISSING or k != previous:
+            unique[i] = True
+            previous = k
+    return [o for (k, o), is_unique in zip(keys, unique) if is_unique]
@@ -6,27 +6,68 @@
 
 from __future__ import absolute_import, print_function
 
-from collections import defaultdict, deque
+import copy
+import gc
+import json
+import multiprocessing
+import operator
+import pickle
+import random
+import threading
+import time
+import weakref
+from array import array
+from collections import defaultdict, deque, namedtuple, OrderedDict
 from datetime import datetime as dt
+from itertools import count
 
 try:
-    from collections.abc import Sequence, Set
+    from collections.abc import Mapping, Sequence, Set
 except ImportError:
-    from collections import Sequence, Set
+    from collections import Mapping, Sequence, Set
 
 import pytest
 import six
 from six import u
 
 from pockets.collections import (
+    GroupAccumulator,
+    ItemIndex,
+    asynckeydefaultdict,
+    batchkeydefaultdict,
+    boundedkeydefaultdict,
+    chunkify,
+    concurrentkeydefaultdict,
+    deepmerge,
+    flatten,
+    freeze,
+    frozendict,
+    frozenlist,
     groupify,
+    groupify_columns,
+    igroupify,
+    indexify,
     keydefaultdict,
+    keygetter,
     is_listy,
+    iuniquify,
+    lazylist,
     listify,
+    listview,
     is_mappy,
     mappify,
     nesteddefaultdict,
+    nestedview,
+    paddedview,
+    pathtree,
+    persistentkeydefaultdict,
+    persistentmap,
     readable_join,
+    register_listy,
+    register_mappy,
+    sliceview,
+    thaw,
+    unflatten,
     uniquify,
 )
 
@@ -83,6 +124,557 @@ class TestKeydefaultdict(object):
         pytest.raises(KeyError, d.__getitem__, "asdf")
 
 
+class TestBoundedkeydefaultdict(object):
+    def test_lru_eviction(self):
+        calls = []
+
+        def factory(key):
+            calls.append(key)
+            return key.upper()
+
+        d = boundedkeydefaultdict(factory, maxsize=2)
+        assert [d[k] for k in "abacb"] == ["A", "B", "A", "C", "B"]
+        assert calls == ["a", "b", "c", "b"]
+        assert sorted(d) == ["b", "c"]
+        assert (d.hits, d.misses, d.evictions) == (1, 4, 2)
+
+    def test_lfu_eviction(self):
+        d = boundedkeydefaultdict(str.upper, maxsize=2, policy="lfu")
+        d["a"], d["a"], d["b"], d["c"]
+        assert sorted(d) == ["a", "c"]
+        d["c"], d["c"], d["d"]
+        assert sorted(d) == ["c", "d"]
+        assert d.evictions == 2
+
+    def test_lfu_ties_evict_least_recent(self):
+        d = boundedkeydefaultdict(str.upper, maxsize=2, policy="lfu")
+        d["a"], d["b"], d["b"], d["a"], d["c"]
+        assert sorted(d) == ["a", "c"]
+
+    def test_lfu_tracks_least_count(self):
+        d = boundedkeydefaultdict(str.upper, maxsize=2, policy="lfu")
+        d["a"], d["b"], d["a"], d["b"], d["b"]
+        assert d._usage._min_count == 2
+        d["c"]
+        assert sorted(d) == ["b", "c"]
+        assert d._usage._min_count == 1
+        del d["c"]
+        d["b"], d["d"], d["e"]
+        assert sorted(d) == ["b", "e"]
+
+    def test_unbounded(self):
+        d = boundedkeydefaultdict(str, maxsize=None)
+        for i in range(1000):
+            d[i]
+        assert len(d) == 1000
+        assert d.evictions == 0
+
+    def test_setitem_evicts(self):
+        d = boundedkeydefaultdict(maxsize=2)
+        d.update(a=1, b=2)
+        d["a"] = 10
+        d["c"] = 3
+        assert dict(d) == {"a": 10, "c": 3}
+        pytest.raises(KeyError, d.__getitem__, "b")
+
+    def test_ttl(self):
+        clock = [0]
+        d = boundedkeydefaultdict(
+            str.upper, ttl=10, timer=lambda: clock[0]
+        )
+        d["a"] = "alpha"
+        d["b"]
+        clock[0] = 5
+        d["b"] = "beta"
+        clock[0] = 10
+        assert "a" not in d
+        assert d.get("b") == "beta"
+        assert d["a"] == "A"
+        assert d.evictions == 1
+        clock[0] = 15
+        assert d.expire() == 1
+        assert dict(d) == {"a": "A"}
+        assert d.evictions == 2
+
+    def test_pop_and_popitem(self):
+        d = boundedkeydefaultdict(str.upper, maxsize=3)
+        d["a"], d["b"], d["c"], d["a"]
+        assert d.popitem() == ("b", "B")
+        assert d.pop("c") == "C"
+        assert d.pop("c", None) is None
+        pytest.raises(KeyError, d.pop, "c")
+        del d["a"]
+        pytest.raises(KeyError, d.popitem)
+        d["x"]
+        assert dict(d) == {"x": "X"}
+
+    def test_popitem_skips_expired(self):
+        clock = [0]
+        d = boundedkeydefaultdict(str.upper, ttl=10, timer=lambda: clock[0])
+        d["a"]
+        clock[0] = 5
+        d["b"]
+        clock[0] = 12
+        assert d.popitem() == ("b", "B")
+        assert d.evictions == 1
+        assert len(d) == 0
+        d["c"]
+        clock[0] = 30
+        pytest.raises(KeyError, d.popitem)
+        assert d.evictions == 2
+
+    def test_setdefault_and_clear(self):
+        d = boundedkeydefaultdict(str.upper, maxsize=1)
+        assert d.setdefault("a", 1) == 1
+        assert d.setdefault("a", 2) == 1
+        d.clear()
+        assert len(d) == 0
+        assert d["b"] == "B"
+
+    def test_copy_and_pickle(self):
+        d = boundedkeydefaultdict(str.upper, maxsize=2)
+        d["a"], d["b"], d["a"]
+        for other in [copy.copy(d), d.copy(), pickle.loads(pickle.dumps(d))]:
+            assert type(other) is boundedkeydefaultdict
+            assert dict(other) == {"a": "A", "b": "B"}
+            other["c"]
+            assert sorted(other) == ["a", "c"]
+        assert sorted(d) == ["a", "b"]
+
+    def test_no_default_factory(self):
+        d = boundedkeydefaultdict()
+        pytest.raises(KeyError, d.__getitem__, "a")
+        assert d.misses == 1
+
+    def test_unknown_policy(self):
+        pytest.raises(ValueError, boundedkeydefaultdict, str, policy="fifo")
+
+    @pytest.mark.parametrize("maxsize", [0, -1])
+    def test_invalid_maxsize(self, maxsize):
+        pytest.raises(ValueError, boundedkeydefaultdict, str, maxsize)
+
+
+class TestConcurrentkeydefaultdict(object):
+    def run_threads(self, target, args_list):
+        threads = [threading.Thread(target=target, args=a) for a in args_list]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+
+    def test_single_flight(self):
+        calls = []
+
+        def factory(key):
+            calls.append(key)
+            time.sleep(0.05)
+            return object()
+
+        d = concurrentkeydefaultdict(factory)
+        results = []
+        self.run_threads(lambda: results.append(d["a"]), [()] * 8)
+        assert calls == ["a"]
+        assert len(results) == 8
+        assert all(r is d["a"] for r in results)
+
+    def test_distinct_keys_in_parallel(self):
+        started = {"a": threading.Event(), "b": threading.Event()}
+
+        def factory(key):
+            started[key].set()
+            other = "b" if key == "a" else "a"
+            return started[other].wait(5)
+
+        d = concurrentkeydefaultdict(factory, stripes=1)
+        self.run_threads(d.__getitem__, [("a",), ("b",)])
+        assert d == {"a": True, "b": True}
+
+    def test_exceptions_shared_and_not_cached(self):
+        calls = []
+
+        def factory(key):
+            calls.append(key)
+            time.sleep(0.05)
+            if len(calls) == 1:
+                raise ValueError(key)
+            return key.upper()
+
+        d = concurrentkeydefaultdict(factory)
+        errors = []
+
+        def get():
+            try:
+                d["a"]
+            except ValueError as e:
+                errors.append(e)
+
+        self.run_threads(get, [()] * 4)
+        assert calls == ["a"]
+        assert len(errors) == 4
+        assert "a" not in d
+        assert d["a"] == "A"
+        assert calls == ["a", "a"]
+
+    def test_recursive_lookup(self):
+        d = concurrentkeydefaultdict(lambda key: d[key])
+        pytest.raises(RuntimeError, d.__getitem__, "a")
+        assert "a" not in d
+        assert d._calls == {}
+
+    def test_copy_and_pickle(self):
+        d = concurrentkeydefaultdict(str.upper, stripes=4)
+        d["a"]
+        for other in [copy.copy(d), d.copy(), pickle.loads(pickle.dumps(d))]:
+            assert type(other) is concurrentkeydefaultdict
+            assert other == {"a": "A"}
+            assert len(other._locks) == 4
+            assert other["b"] == "B"
+
+    def test_no_default_factory(self):
+        d = concurrentkeydefaultdict()
+        pytest.raises(KeyError, d.__getitem__, "a")
+
+    def test_invalid_stripes(self):
+        pytest.raises(ValueError, concurrentkeydefaultdict, str, 0)
+
+
+class TestAsynckeydefaultdict(object):
+    @pytest.fixture
+    def asyncio(self):
+        return pytest.importorskip("asyncio")
+
+    @pytest.fixture
+    def loop(self, asyncio):
+        loop = asyncio.new_event_loop()
+        yield loop
+        loop.close()
+
+    def make_factory(self, loop, calls, error=None):
+        def factory(key):
+            calls.append(key)
+            future = loop.create_future()
+            if error is None:
+                loop.call_later(0.01, future.set_result, key.upper())
+            else:
+                loop.call_later(0.01, future.set_exception, error)
+            return future
+
+        return factory
+
+    def test_coalesced(self, asyncio, loop):
+        calls = []
+        d = asynckeydefaultdict(self.make_factory(loop, calls))
+        results = loop.run_until_complete(
+            asyncio.gather(d.get("a"), d.get("a"), d.get("b"), d["a"])
+        )
+        assert results == ["A", "A", "B", "A"]
+        assert calls == ["a", "b"]
+        assert loop.run_until_complete(d.get("a")) == "A"
+        assert calls == ["a", "b"]
+
+    def test_failures_cached(self, asyncio, loop):
+        calls = []
+        d = asynckeydefaultdict(
+            self.make_factory(loop, calls, ValueError("a"))
+        )
+        for _ in range(2):
+            pytest.raises(ValueError, loop.run_until_complete, d.get("a"))
+        assert calls == ["a"]
+        assert "a" in d
+
+    def test_failures_evicted(self, asyncio, loop):
+        calls = []
+        d = asynckeydefaultdict(
+            self.make_factory(loop, calls, ValueError("a")),
+            evict_failures=True,
+        )
+        gathered = asyncio.gather(d.get("a"), d.get("a"))
+        pytest.raises(ValueError, loop.run_until_complete, gathered)
+        assert calls == ["a"]
+        assert "a" not in d
+        pytest.raises(ValueError, loop.run_until_complete, d.get("a"))
+        assert calls == ["a", "a"]
+
+    def test_get_shields_task(self, asyncio, loop):
+        calls = []
+        d = asynckeydefaultdict(self.make_factory(loop, calls))
+        waiter = d.get("a")
+        waiter.cancel()
+        assert loop.run_until_complete(d["a"]) == "A"
+        assert calls == ["a"]
+
+    def test_copy(self, loop):
+        d = asynckeydefaultdict(str.upper, evict_failures=True)
+        d["a"] = 1
+        other = copy.copy(d)
+        assert type(other) is asynckeydefaultdict
+        assert other == {"a": 1}
+        assert other.evict_failures
+
+    def test_no_default_factory(self):
+        d = asynckeydefaultdict()
+        pytest.raises(KeyError, d.__getitem__, "a")
+
+
+class TestBatchkeydefaultdict(object):
+    def make_factory(self, calls, delay=0, error=None):
+        def factory(keys):
+            calls.append(sorted(keys))
+            time.sleep(delay)
+            if error is not None and not error.pop():
+                raise ValueError(keys)
+            return dict((k, k.upper()) for k in keys if k != "missing")
+
+        return factory
+
+    def test_prefetch(self):
+        calls = []
+        d = batchkeydefaultdict(self.make_factory(calls))
+        d.prefetch(["a", "b", "a", "missing"])
+        assert d == {"a": "A", "b": "B"}
+        d.prefetch(["b", "c"])
+        d.prefetch(["a"])
+        assert d["c"] == "C"
+        assert calls == [["a", "b", "missing"], ["c"]]
+
+    def test_missing_key(self):
+        calls = []
+        d = batchkeydefaultdict(self.make_factory(calls))
+        assert d["a"] == "A"
+        pytest.raises(KeyError, d.__getitem__, "missing")
+        assert "missing" not in d
+        assert calls == [["a"], ["missing"]]
+
+    def test_window_coalesces_threads(self):
+        calls = []
+        d = batchkeydefaultdict(self.make_factory(calls), window=0.1)
+        results = {}
+
+        def get(key):
+            results[key] = d[key]
+
+        threads = [threading.Thread(target=get, args=(k,)) for k in "abca"]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        assert results == {"a": "A", "b": "B", "c": "C"}
+        assert calls == [["a", "b", "c"]]
+
+    def test_window_missing_key(self):
+        calls = []
+        d = batchkeydefaultdict(self.make_factory(calls), window=0)
+        pytest.raises(KeyError, d.__getitem__, "missing")
+        assert d["a"] == "A"
+        assert d._calls == {} and d._pending is None
+
+    def test_window_exceptions_not_cached(self):
+        calls = []
+        d = batchkeydefaultdict(
+            self.make_factory(calls, error=[True, False]), window=0
+        )
+        pytest.raises(ValueError, d.__getitem__, "a")
+        assert d._calls == {} and d._pending is None
+        assert d["a"] == "A"
+        assert calls == [["a"], ["a"]]
+
+    def test_window_recursive_lookup(self):
+        d = batchkeydefaultdict(lambda keys: {"a": d["a"]}, window=0)
+        pytest.raises(RuntimeError, d.__getitem__, "a")
+
+    def test_copy_and_pickle(self):
+        d = batchkeydefaultdict(dict.fromkeys, window=0.5)
+        d.prefetch(["a"])
+        for other in [copy.copy(d), pickle.loads(pickle.dumps(d))]:
+            assert type(other) is batchkeydefaultdict
+            assert other == {"a": None}
+            assert other.window == 0.5
+
+    def test_no_default_factory(self):
+        d = batchkeydefaultdict()
+        d.prefetch(["a"])
+        pytest.raises(KeyError, d.__getitem__, "a")
+
+
+class TestPersistentkeydefaultdict(object):
+    @pytest.fixture
+    def path(self, tmpdir):
+        return str(tmpdir.join("cache.db"))
+
+    def test_persists(self, path):
+        calls = []
+
+        def factory(key):
+            calls.append(key)
+            return [key] * 2
+
+        d = persistentkeydefaultdict(factory, path)
+        assert d["a"] == ["a", "a"]
+        d[("b", 1)] = {"x": 1}
+        d.close()
+
+        d = persistentkeydefaultdict(factory, path)
+        assert len(d) == 0
+        assert d["a"] == ["a", "a"]
+        assert d[("b", 1)] == {"x": 1}
+        assert calls == ["a"]
+        d.close()
+
+    def test_shared_between_instances(self, path):
+        d1 = persistentkeydefaultdict(str.upper, path)
+        d2 = persistentkeydefaultdict(None, path)
+        d1["a"]
+        assert d2["a"] == "A"
+        del d2["a"]
+        pytest.raises(KeyError, d2.__getitem__, "a")
+        assert "a" in d1
+
+    def test_shared_between_processes(self, path):
+        d = persistentkeydefaultdict(str.upper, path)
+        d["a"]
+        process = multiprocessing.Process(target=d.__getitem__, args=("b",))
+        process.start()
+        process.join(30)
+        assert process.exitcode == 0
+        assert persistentkeydefaultdict(None, path)["b"] == "B"
+
+    def test_serializer(self, path):
+        d = persistentkeydefaultdict(lambda k: {"key": k}, path, json)
+        assert d["a"] == {"key": "a"}
+        d.close()
+        d = persistentkeydefaultdict(None, path, json)
+        assert d["a"] == {"key": "a"}
+
+    def test_maxsize(self, path):
+        d = persistentkeydefaultdict(str.upper, path, maxsize=2)
+        d["a"], d["b"], d["c"]
+        d["a"] = "alpha"
+        d = persistentkeydefaultdict(None, path)
+        assert d["a"] == "alpha"
+        assert d["c"] == "C"
+        pytest.raises(KeyError, d.__getitem__, "b")
+
+    def test_delete(self, path):
+        d = persistentkeydefaultdict(str.upper, path)
+        d.update(a=1, b=2, c=3)
+        d.close()
+        d = persistentkeydefaultdict(None, path)
+        assert d.pop("a") == 1
+        assert d.pop("a", None) is None
+        pytest.raises(KeyError, d.pop, "a")
+        pytest.raises(KeyError, d.__delitem__, "a")
+        d["b"]
+        assert d.popitem() == ("b", 2)
+        pytest.raises(KeyError, d.__getitem__, "b")
+        d.clear()
+        pytest.raises(KeyError, d.__getitem__, "c")
+
+    def test_concurrent_pop(self, path):
+        d = persistentkeydefaultdict(str.upper, path)
+        errors = []
+
+        def pop():
+            try:
+                for i in range(200):
+                    d["a"]
+                    d.pop("a", None)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=pop) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+
+    def test_pop_deleted_elsewhere(self, path):
+        d1 = persistentkeydefaultdict(str.upper, path)
+        d2 = persistentkeydefaultdict(None, path)
+        d1["a"], d1["b"]
+        assert d2.pop("b") == "B"
+        assert d2.pop("b", None) is None
+        assert d1.pop("b") == "B"
+        assert d1.pop("b", None) is None
+
+    def test_setdefault(self, path):
+        d = persistentkeydefaultdict(None, path)
+        assert d.setdefault("a", 1) == 1
+        assert d.setdefault("a", 2) == 1
+        assert persistentkeydefaultdict(None, path)["a"] == 1
+
+    def test_setdefault_keeps_stored_value(self, path):
+        d1 = persistentkeydefaultdict(None, path)
+        d1["a"] = 1
+        d2 = persistentkeydefaultdict(None, path)
+        assert d2.setdefault("a", 2) == 1
+        assert d2["a"] == 1
+        assert persistentkeydefaultdict(None, path)["a"] == 1
+        default = []
+        assert d2.setdefault("b", default) is default
+        assert d1["b"] == []
+
+    def test_copy_and_pickle(self, path):
+        d = persistentkeydefaultdict(str.upper, path, maxsize=10)
+        d["a"]
+        for other in [copy.copy(d), pickle.loads(pickle.dumps(d))]:
+            assert type(other) is persistentkeydefaultdict
+            assert other.maxsize == 10
+            assert other["a"] == "A"
+
+    def test_requires_path(self):
+        pytest.raises(TypeError, persistentkeydefaultdict, str.upper)
+
+
+class TestKeygetter(object):
+    owner = {"name": "Rob", "address": {"zip": "94610"}}
+
+    def test_attribute(self):
+        assert keygetter("when")(reminders[0]) == "Fri"
+        pytest.raises(AttributeError, keygetter("nope"), reminders[0])
+
+    def test_item(self):
+        assert keygetter("name")(self.owner) == "Rob"
+        assert keygetter("keys")({"keys": "value"}) == "value"
+        assert keygetter(1)(["a", "b"]) == "b"
+        pytest.raises(KeyError, keygetter("nope"), self.owner)
+
+    def test_mapping(self):
+        class Record(Mapping):
+            def __getitem__(self, key):
+                return key.upper()
+
+            def __iter__(self):
+                return iter([])
+
+            def __len__(self):
+                return 0
+
+        assert keygetter("name")(Record()) == "NAME"
+        assert keygetter("owner.name")({"owner": Record()}) == "NAME"
+
+    def test_dotted_path(self):
+        item = {"owner": Reminder("Fri", self.owner, "Eat cereal")}
+        assert keygetter("owner.when")(item) == "Fri"
+        assert keygetter("owner.where.address.zip")(item) == "94610"
+
+    def test_composite(self):
+        get = keygetter(("when", "where"))
+        assert get(reminders[0]) == ("Fri", "Home")
+        assert get({"when": "Sat", "where": "Work"}) == ("Sat", "Work")
+        get = keygetter(["name", "address.zip", len])
+        assert get(self.owner) == ("Rob", "94610", 2)
+        assert keygetter(("name",))(self.owner) == ("Rob",)
+
+    def test_callable(self):
+        assert keygetter(len) is len
+        assert keygetter(None)(self.owner) is self.owner
+
+    def test_unsupported(self):
+        pytest.raises(TypeError, keygetter, 1.5)
+        pytest.raises(TypeError, keygetter, ())
+
+
 class TestGroupify(object):
     @pytest.mark.parametrize(
         "items,keys,val_key,expected",
@@ -168,6 +760,668 @@ class TestGroupify(object):
         assert groupify(items, keys, val_key) == expected
 
 
+class TestGroupifyKeys(object):
+    records = [
+        {"when": r.when, "where": r.where, "what": r.what} for r in reminders
+    ]
+
+    def test_dict_items(self):
+        for keys in ("when", ["when", "where"], ["where", "when"]):
+            groups = groupify(self.records, keys, "what")
+            assert groups == groupify(reminders, keys, "what")
+
+    def test_mixed_items(self):
+        items = [i for pair in zip(reminders, self.records) for i in pair]
+        groups = groupify(items, ["when", "where"], "what")
+        assert groups["Sat"]["Home"] == [
+            "Sleep in",
+            "Sleep in",
+            "Play Zelda",
+            "Play Zelda",
+        ]
+
+    def test_composite_key(self):
+        groups = groupify(reminders, ("when", ("where", "what")))
+        assert groups["Sat"][("Home", "Sleep in")] == [reminders[2]]
+
+    def test_dotted_path(self):
+        items = [{"reminder": r} for r in reminders]
+        groups = groupify(items, "reminder.when", "reminder.what")
+        assert groups == groupify(reminders, "when", "what")
+
+    def test_int_val_key(self):
+        rows = [("a", 1), ("b", 1), ("c", 2)]
+        assert groupify(rows, 1, 0) == {1: ["a", "b"], 2: ["c"]}
+        groups = [(k, list(v)) for k, v in igroupify(rows, 1, 0)]
+        assert groups == [(1, ["a", "b"]), (2, ["c"])]
+        assert GroupAccumulator(1, 0, rows).snapshot() == {
+            1: ["a", "b"],
+            2: ["c"],
+        }
+        pytest.raises(ValueError, groupify, rows, 1, 0, indices=True)
+        assert groupify(rows, 1, "") == groupify(rows, 1)
+
+
+class TestGroupifyFlat(object):
+    def test_flat(self):
+        groups = groupify(reminders, ["when", "where"], "what", flat=True)
+        assert type(groups) in (dict, OrderedDict)
+        assert list(groups.items()) == [
+            (("Fri", "Home"), ["Eat cereal"]),
+            (("Fri", "Work"), ["Feed Ivan"]),
+            (("Sat", "Home"), ["Sleep in", "Play Zelda"]),
+            (("Sun", "Home"), ["Sleep in"]),
+            (("Sun", "Work"), ["Reset database"]),
+        ]
+
+    def test_single_key(self):
+        groups = groupify(reminders, "when", "what", flat=True)
+        assert list(groups.keys()) == [("Fri",), ("Sat",), ("Sun",)]
+        assert groups[("Sat",)] == ["Sleep in", "Play Zelda"]
+
+    def test_callable_keys(self):
+        groups = groupify(
+            reminders, [lambda r: r.what, "when"], "where", flat=True
+        )
+        assert groups[("Sleep in", "Sun")] == ["Home"]
+
+    def test_agg(self):
+        groups = groupify(
+            reminders, ["where", "when"], agg="count", flat=True
+        )
+        assert groups == {
+            ("Home", "Fri"): 1,
+            ("Work", "Fri"): 1,
+            ("Home", "Sat"): 2,
+            ("Home", "Sun"): 1,
+            ("Work", "Sun"): 1,
+        }
+
+    def test_thread_pool(self):
+        futures = pytest.importorskip("concurrent.futures")
+        expected = groupify(reminders, ["when", "where"], flat=True)
+        with futures.ThreadPoolExecutor(max_workers=2) as executor:
+            groups = groupify(
+                reminders,
+                ["when", "where"],
+                executor=executor,
+                chunksize=1,
+                flat=True,
+            )
+        assert list(groups.items()) == list(expected.items())
+
+
+class TestGroupifyIndices(object):
+    def tolists(self, groups):
+        if isinstance(groups, array):
+            return groups.tolist()
+        return dict((k, self.tolists(v)) for k, v in groups.items())
+
+    def expected(self, keys, **kwargs):
+        positions = dict((id(r), i) for i, r in enumerate(reminders))
+        return groupify(
+            reminders, keys, lambda r: positions[id(r)], **kwargs
+        )
+
+    @pytest.mark.parametrize("keys", ["when", ["when", "where"]])
+    def test_indices(self, keys):
+        groups = groupify(reminders, keys, indices=True)
+        assert self.tolists(groups) == self.expected(keys)
+        leaf = groups["Sat"] if keys == "when" else groups["Sat"]["Home"]
+        assert isinstance(leaf, array)
+        assert leaf.itemsize == 8
+        assert leaf.tolist() == [2, 3]
+
+    def test_iterator(self):
+        groups = groupify(iter(reminders), "where", indices=True, flat=True)
+        assert groups[("Home",)].tolist() == [0, 2, 3, 4]
+        assert groups[("Work",)].tolist() == [1, 5]
+
+    def test_agg(self):
+        groups = groupify(reminders, "where", agg="last", indices=True)
+        assert groups == {"Home": 4, "Work": 5}
+
+    def test_thread_pool(self):
+        futures = pytest.importorskip("concurrent.futures")
+        with futures.ThreadPoolExecutor(max_workers=2) as executor:
+            groups = groupify(
+                reminders,
+                ["where", "when"],
+                executor=executor,
+                chunksize=2,
+                indices=True,
+            )
+        assert self.tolists(groups) == self.expected(["where", "when"])
+        assert isinstance(groups["Home"]["Sat"], array)
+
+    def test_numpy(self):
+        numpy = pytest.importorskip("numpy")
+        groups = groupify(reminders, "when", indices=True)
+        indices = numpy.frombuffer(groups["Sun"], dtype=numpy.int64)
+        assert indices.tolist() == [4, 5]
+
+    def test_val_key(self):
+        pytest.raises(
+            ValueError, groupify, reminders, "when", "what", indices=True
+        )
+
+
+class TestNestedview(object):
+    def test_nestedview(self):
+        for keys in ("when", ["when", "where"], ["where", "when", "what"]):
+            view = nestedview(groupify(reminders, keys, flat=True))
+            assert view == groupify(reminders, keys)
+
+    def test_lazy(self):
+        groups = groupify(reminders, ["where", "when"], "what", flat=True)
+        view = nestedview(groups)
+        assert view["Home"] is view["Home"]
+        assert view["Home"]["Sat"] is groups[("Home", "Sat")]
+        assert list(view["Home"]) == ["Fri", "Sat", "Sun"]
+        assert list(view["Work"].items()) == [
+            ("Fri", ["Feed Ivan"]),
+            ("Sun", ["Reset database"]),
+        ]
+
+    def test_mapping(self):
+        view = nestedview(groupify(reminders, ["where", "when"], flat=True))
+        assert len(view) == 2
+        assert len(view["Home"]) == 3
+        assert "Work" in view
+        assert "Sat" not in view["Work"]
+        pytest.raises(KeyError, view.__getitem__, "Sat")
+        pytest.raises(KeyError, view["Work"].__getitem__, "Sat")
+        assert view.get("Nowhere") is None
+        assert "Work" in repr(view)
+
+    def test_empty(self):
+        view = nestedview({})
+        assert len(view) == 0
+        assert list(view) == []
+
+    def test_groupify_columns(self):
+        columns = {
+            "when": [r.when for r in reminders],
+            "where": [r.where for r in reminders],
+        }
+        view = nestedview(groupify_columns(columns, ["when", "where"]))
+        assert view["Sat"]["Home"] == [2, 3]
+        view = nestedview(groupify_columns(columns, "when"))
+        assert list(view) == ["Fri", "Sat", "Sun"]
+        assert view["Sat"] == [2, 3]
+
+    def test_non_tuple_keys(self):
+        view = nestedview({"Fri": [0, 1], "Sat": [2]})
+        pytest.raises(TypeError, list, view)
+        pytest.raises(TypeError, view.__getitem__, "F")
+
+
+class TestGroupifyAgg(object):
+    numbers = [("a", 3), ("b", 10), ("a", 1), ("a", 2), ("b", 5)]
+
+    @pytest.mark.parametrize(
+        "agg,expected",
+        [
+            ("count", {"a": 3, "b": 2}),
+            ("sum", {"a": 6, "b": 15}),
+            ("min", {"a": 1, "b": 5}),
+            ("max", {"a": 3, "b": 10}),
+            ("mean", {"a": 2.0, "b": 7.5}),
+            ("first", {"a": 3, "b": 10}),
+            ("last", {"a": 2, "b": 5}),
+            (lambda x, y: x * y, {"a": 6, "b": 50}),
+        ],
+    )
+    def test_agg(self, agg, expected):
+        groups = groupify(
+            self.numbers, lambda n: n[0], lambda n: n[1], agg=agg
+        )
+        assert groups == expected
+        assert list(groups.keys()) == ["a", "b"]
+
+    def test_agg_nested(self):
+        groups = groupify(reminders, ["when", "where"], "what", agg="count")
+        assert groups == {
+            "Fri": {"Home": 1, "Work": 1},
+            "Sat": {"Home": 2},
+            "Sun": {"Home": 1, "Work": 1},
+        }
+        groups = groupify(reminders, ["where", "when"], agg="first")
+        assert groups["Home"]["Sat"] is reminders[2]
+
+    def test_agg_matches_leaf_lists(self):
+        keys = ["where", "when"]
+        leaves = groupify(reminders, keys, "what")
+        groups = groupify(reminders, keys, "what", agg=lambda x, y: x + y)
+        for where, whens in leaves.items():
+            for when, whats in whens.items():
+                assert groups[where][when] == "".join(whats)
+
+    def test_unknown_agg(self):
+        pytest.raises(ValueError, groupify, reminders, "when", agg="median")
+        pytest.raises(ValueError, groupify, reminders, "when", agg=1)
+
+    def test_group_accumulator(self):
+        groups = GroupAccumulator(lambda n: n[0], lambda n: n[1], agg="mean")
+        groups.extend(self.numbers[:2])
+        assert groups.snapshot() == {"a": 3.0, "b": 10.0}
+
+        other = GroupAccumulator(
+            lambda n: n[0], lambda n: n[1], self.numbers[2:], "mean"
+        )
+        assert other.snapshot() == {"a": 1.5, "b": 5.0}
+
+        groups.merge(other)
+        assert groups.snapshot() == {"a": 2.0, "b": 7.5}
+        assert other.snapshot() == {"a": 1.5, "b": 5.0}
+
+    def test_group_accumulator_merge_agg_mismatch(self):
+        groups = GroupAccumulator("when", agg="count")
+        pytest.raises(ValueError, groups.merge, GroupAccumulator("when"))
+
+
+class TestGroupifyParallel(object):
+    @pytest.mark.parametrize("chunksize", [None, 1, 2, 4, 100])
+    @pytest.mark.parametrize(
+        "keys,val_key",
+        [
+            ("when", None),
+            (["where", "when"], None),
+            (["when", "where"], "what"),
+        ],
+    )
+    def test_thread_pool(self, keys, val_key, chunksize):
+        futures = pytest.importorskip("concurrent.futures")
+        expected = groupify(reminders, keys, val_key)
+        with futures.ThreadPoolExecutor(max_workers=3) as executor:
+            groups = groupify(
+                reminders, keys, val_key, None, executor, chunksize
+            )
+            assert groups == expected
+            assert list(groups.keys()) == list(expected.keys())
+
+            groups = groupify(
+                iter(reminders), keys, val_key, executor=executor
+            )
+            assert groups == expected
+
+    @pytest.mark.parametrize(
+        "agg", ["count", "max", "first", "last", operator.add]
+    )
+    def test_thread_pool_agg(self, agg):
+        futures = pytest.importorskip("concurrent.futures")
+        keys = ["where", "when"]
+        expected = groupify(reminders, keys, "what", agg=agg)
+        with futures.ThreadPoolExecutor(max_workers=2) as executor:
+            groups = groupify(
+                reminders, keys, "what", agg, executor=executor, chunksize=1
+            )
+        assert groups == expected
+
+    def test_empty(self):
+        futures = pytest.importorskip("concurrent.futures")
+        with futures.ThreadPoolExecutor(max_workers=2) as executor:
+            assert groupify([], "when", executor=executor) == {}
+
+    def test_process_pool(self):
+        pytest.importorskip("concurrent.futures")
+        expected = groupify(reminders, ["when", "where"], "what", agg="count")
+        groups = groupify(
+            reminders, ["when", "where"], "what", agg="count", executor=2
+        )
+        assert groups == expected
+        assert list(groups.keys()) == list(expected.keys())
+
+
+class TestIndexify(object):
+    def test_lookup(self):
+        index = indexify(reminders, ["when", "where"])
+        assert isinstance(index, ItemIndex)
+        assert index.lookup("when", "Sat") == reminders[2:4]
+        assert index.lookup("where", "Work") == [reminders[1], reminders[5]]
+        assert index.lookup("when", "Mon") == []
+        assert len(index) == 6
+        assert list(index) == reminders
+        assert index.values("when") == ["Fri", "Sat", "Sun"]
+        pytest.raises(KeyError, index.lookup, "what", "Sleep in")
+        pytest.raises(KeyError, index.lookup, ["when"], "Fri")
+
+    def test_query(self):
+        index = indexify(reminders, ["when", "where", "what"])
+        assert index.query({"when": "Sun", "where": "Home"}) == [reminders[4]]
+        assert index.query({"where": "Home", "what": "Sleep in"}) == [
+            reminders[2],
+            reminders[4],
+        ]
+        assert index.query({"when": "Fri", "what": "Sleep in"}) == []
+        assert index.query({"when": "Mon", "where": "Home"}) == []
+        assert index.query({}) == reminders
+        pytest.raises(KeyError, index.query, {"why": "?"})
+
+    def test_key_conventions(self):
+        def weekend(r):
+            return r.when in ("Sat", "Sun")
+
+        items = [{"a": {"b": 1}, "c": 2}, {"a": {"b": 2}, "c": 2}]
+        index = indexify(items, ["a.b", len, ["a.b", "c"]])
+        assert index.lookup(len, 2) == items
+        assert index.lookup("a.b", 2) == [items[1]]
+        assert index.lookup(["a.b", "c"], (1, 2)) == [items[0]]
+        assert index.lookup(("a.b", "c"), (2, 2)) == [items[1]]
+
+        index = indexify(reminders, [weekend, "where"])
+        assert index.query({weekend: True, "where": "Work"}) == [reminders[5]]
+
+        tuples = [("a", 1), ("b", 1)]
+        assert indexify(tuples, 1).lookup(1, 1) == tuples
+
+    def test_add_and_remove(self):
+        index = ItemIndex(["when", "where"])
+        index.extend(reminders[:3])
+        index.add(reminders[3])
+        assert index.lookup("when", "Sat") == reminders[2:4]
+        index.remove(Reminder("Sat", "Home", "Sleep in"))
+        assert index.lookup("when", "Sat") == [reminders[3]]
+        assert index.lookup("where", "Home") == [reminders[0], reminders[3]]
+        index.remove(reminders[3])
+        assert index.values("when") == ["Fri"]
+        assert index.lookup("when", "Sat") == []
+        assert len(index) == 2
+        pytest.raises(ValueError, index.remove, reminders[3])
+        pytest.raises(ValueError, index.remove, reminders[4])
+
+    def test_remove_duplicates(self):
+        items = [{"a": 1}, {"a": 1}]
+        index = indexify(items, "a")
+        index.remove({"a": 1})
+        assert index.lookup("a", 1) == [{"a": 1}]
+        index.add({"a": 1})
+        assert len(index.lookup("a", 1)) == 2
+
+    @pytest.mark.parametrize("value", [[1], {1}])
+    def test_add_unhashable(self, value):
+        index = ItemIndex(["a", "b"])
+        index.add({"a": 1, "b": 0})
+        pytest.raises(TypeError, index.add, {"a": 1, "b": value})
+        assert index.lookup("a", 1) == [{"a": 1, "b": 0}]
+        assert index.query({"a": 1}) == [{"a": 1, "b": 0}]
+        assert index.values("a") == [1]
+        assert len(index) == 1
+
+    def test_no_keys(self):
+        pytest.raises(ValueError, indexify, reminders, [])
+
+
+class TestGroupAccumulator(object):
+    @pytest.mark.parametrize(
+        "keys,val_key",
+        [
+            ("when", None),
+            (["when", "where"], None),
+            (["where", "when"], "what"),
+            (lambda r: "{0.when} - {0.where}".format(r), "what"),
+        ],
+    )
+    def test_snapshot(self, keys, val_key):
+        expected = groupify(reminders, keys, val_key)
+        groups = GroupAccumulator(keys, val_key)
+        assert groups.snapshot() == {}
+        groups.add(reminders[0])
+        groups.extend(reminders[1:4])
+        groups.extend(iter(reminders[4:]))
+        assert groups.snapshot() == expected
+        assert list(groups.snapshot().keys()) == list(expected.keys())
+
+        groups = GroupAccumulator(keys, val_key, reminders)
+        assert groups.snapshot() == expected
+
+    def test_snapshot_is_a_copy(self):
+        groups = GroupAccumulator(["when", "where"], "what", reminders[:3])
+        snapshot = groups.snapshot()
+        groups.add(reminders[3])
+        assert snapshot["Sat"]["Home"] == ["Sleep in"]
+        assert groups.snapshot()["Sat"]["Home"] == ["Sleep in", "Play Zelda"]
+
+    def test_merge(self):
+        keys = ["where", "when"]
+        groups = GroupAccumulator(keys, "what", reminders[:3])
+        other = GroupAccumulator(keys, "what", reminders[3:])
+        assert groups.merge(other) is groups
+        assert groups.snapshot() == groupify(reminders, keys, "what")
+        assert other.snapshot() == groupify(reminders[3:], keys, "what")
+
+        other.add(reminders[0])
+        assert groups.snapshot() == groupify(reminders, keys, "what")
+
+    def test_merge_custom_agg(self):
+        groups = GroupAccumulator("when", "what", reminders[:3], operator.add)
+        other = GroupAccumulator("when", "what", reminders[3:], operator.add)
+        groups.merge(other)
+        expected = groupify(reminders, "when", "what", agg=operator.add)
+        assert groups.snapshot() == expected
+        assert expected["Sat"] == "Sleep inPlay Zelda"
+
+    def test_merge_mismatched_keys(self):
+        groups = GroupAccumulator(["when", "where"])
+        pytest.raises(ValueError, groups.merge, GroupAccumulator("when"))
+
+    def test_no_keys(self):
+        pytest.raises(ValueError, GroupAccumulator, None)
+        pytest.raises(ValueError, GroupAccumulator, [])
+
+
+class TestIgroupify(object):
+    def expected(self, items, keys, val_key=None):
+        groups = groupify(items, keys, val_key, flat=True)
+        if len(listify(keys)) == 1:
+            groups = dict((k[0], v) for k, v in groups.items())
+        return sorted(groups.items())
+
+    @pytest.mark.parametrize("buffersize", [1, 2, 5, 6, 7, 100000])
+    @pytest.mark.parametrize(
+        "keys,val_key",
+        [
+            ("when", None),
+            (["when", "where"], None),
+            (["where", "what"], "when"),
+        ],
+    )
+    def test_igroupify(self, keys, val_key, buffersize):
+        groups = igroupify(reminders, keys, val_key, buffersize)
+        groups = [(key, list(values)) for key, values in groups]
+        assert groups == self.expected(reminders, keys, val_key)
+
+    def test_many_runs(self, monkeypatch, tmpdir):
+        import pockets.collections
+
+        monkeypatch.setattr(pockets.collections, "_IGROUPIFY_MAX_RUNS", 3)
+        rng = random.Random(0)
+        items = [(rng.randrange(20), rng.randrange(5), i) for i in range(500)]
+        groups = igroupify(
+            iter(items), [0, 1], 2, buffersize=7, tempdir=str(tmpdir)
+        )
+        groups = [(key, list(values)) for key, values in groups]
+        assert groups == self.expected(items, [0, 1], 2)
+        assert tmpdir.listdir() == []
+
+    def test_runs_merged_in_tiers(self, monkeypatch):
+        import pockets.collections
+
+        written = []
+        write_run = pockets.collections._write_run
+
+        def counting_write_run(groups, tempdir):
+            groups = list(groups)
+            written.append(sum(len(values) for _, values in groups))
+            return write_run(groups, tempdir)
+
+        monkeypatch.setattr(pockets.collections, "_IGROUPIFY_MAX_RUNS", 3)
+        monkeypatch.setattr(
+            pockets.collections, "_write_run", counting_write_run
+        )
+        items = [(i % 10, i) for i in range(81)]
+        groups = igroupify(items, 0, 1, buffersize=1)
+        groups = [(key, list(values)) for key, values in groups]
+        assert groups == self.expected(items, 0, 1)
+        # 81 runs of one item, merged 3 at a time into 27, 9, 3, and 1 runs,
+        # so that each item is written once per tier
+        assert sum(written) == 81 * 5
+        assert len(written) == 81 + 27 + 9 + 3 + 1
+
+    def test_lazy(self):
+        def items():
+            yield ("a", 1)
+            yield ("b", 2)
+            yield ("a", 3)
+
+        groups = igroupify(items(), 0, 1, buffersize=2)
+        key, values = next(groups)
+        assert key == "a"
+        assert next(values) == 1
+        assert next(values) == 3
+        assert [(k, list(v)) for k, v in groups] == [("b", [2])]
+
+    def test_empty(self):
+        assert list(igroupify([], "when")) == []
+        assert list(igroupify(iter([]), "when", buffersize=1)) == []
+
+    def test_invalid(self):
+        pytest.raises(ValueError, igroupify, reminders, None)
+        pytest.raises(ValueError, igroupify, reminders, "when", None, 0)
+
+    @pytest.mark.parametrize("validate", [False, True])
+    def test_presorted(self, validate):
+        items = sorted(reminders, key=lambda r: (r.where, r.when))
+        groups = igroupify(
+            items, ["where", "when"], "what", presorted=True, validate=validate
+        )
+        groups = [(key, list(values)) for key, values in groups]
+        assert groups == self.expected(reminders, ["where", "when"], "what")
+
+    def test_presorted_is_lazy(self):
+        consumed = []
+
+        def items():
+            for item in [("a", 1), ("a", 2), ("b", 3), ("c", 4)]:
+                consumed.append(item)
+                yield item
+
+        groups = igroupify(items(), 0, 1, presorted=True)
+        assert consumed == []
+        key, values = next(groups)
+        assert key == "a"
+        assert next(values) == 1
+        assert len(consumed) == 1
+        assert [(k, list(v)) for k, v in groups] == [("b", [3]), ("c", [4])]
+
+    def test_presorted_unsorted(self):
+        items = [("a", 1), ("b", 2), ("a", 3)]
+        groups = igroupify(items, 0, 1, presorted=True)
+        assert [(k, list(v)) for k, v in groups] == [
+            ("a", [1]),
+            ("b", [2]),
+            ("a", [3]),
+        ]
+
+        groups = igroupify(items, 0, 1, presorted=True, validate=True)
+        assert next(groups)[0] == "a"
+        assert next(groups)[0] == "b"
+        pytest.raises(ValueError, next, groups)
+
+        groups = igroupify(
+            [("b", 1), ("b", 2), ("a", 3)], 0, presorted=True, validate=True
+        )
+        pytest.raises(ValueError, list, groups)
+
+    def test_presorted_unorderable_keys(self):
+        items = [({"a": 1}, 1), ({"a": 1}, 2), ({"b": 2}, 3)]
+        groups = igroupify(items, 0, 1, presorted=True)
+        assert [(k, list(v)) for k, v in groups] == [
+            ({"a": 1}, [1, 2]),
+            ({"b": 2}, [3]),
+        ]
+
+
+class TestGroupifyColumns(object):
+    columns = {
+        "when": [r.when for r in reminders],
+        "where": [r.where for r in reminders],
+        "what": [r.what for r in reminders],
+    }
+
+    def test_single_key(self):
+        groups = groupify_columns(self.columns, "when")
+        assert list(groups.items()) == [
+            (("Fri",), [0, 1]),
+            (("Sat",), [2, 3]),
+            (("Sun",), [4, 5]),
+        ]
+
+    def test_multiple_keys(self):
+        groups = groupify_columns(self.columns, ["where", "when"])
+        assert list(groups.items()) == [
+            (("Home", "Fri"), [0]),
+            (("Work", "Fri"), [1]),
+            (("Home", "Sat"), [2, 3]),
+            (("Home", "Sun"), [4]),
+            (("Work", "Sun"), [5]),
+        ]
+
+    def test_val_key(self):
+        groups = groupify_columns(self.columns, "where", "what")
+        assert list(groups.items()) == [
+            (("Home",), ["Eat cereal", "Sleep in", "Play Zelda", "Sleep in"]),
+            (("Work",), ["Feed Ivan", "Reset database"]),
+        ]
+
+    def test_nested(self):
+        for keys in ("when", ["when", "where"]):
+            groups = groupify_columns(self.columns, keys, "what", nested=True)
+            assert groups == groupify(reminders, keys, "what")
+
+    def test_empty(self):
+        assert groupify_columns({"a": []}, "a") == {}
+        pytest.raises(ValueError, groupify_columns, self.columns, [])
+
+    def test_ndarray(self):
+        numpy = pytest.importorskip("numpy")
+        columns = dict(
+            (name, numpy.array(col)) for name, col in self.columns.items()
+        )
+        for keys in ("when", ["when", "where"], ["where", "when"]):
+            expected = groupify_columns(self.columns, keys)
+            groups = groupify_columns(columns, keys)
+            assert list(groups.keys()) == list(expected.keys())
+            for group, indices in groups.items():
+                assert isinstance(indices, numpy.ndarray)
+                assert indices.tolist() == expected[group]
+
+        groups = groupify_columns(columns, ["when", "where"], "what", True)
+        assert groups["Sat"]["Home"].tolist() == ["Sleep in", "Play Zelda"]
+
+    def test_ndarray_first_seen_order(self):
+        numpy = pytest.importorskip("numpy")
+        columns = {"a": numpy.array([3, 1, 3, 2, 1, 3])}
+        groups = groupify_columns(columns, "a")
+        assert list(groups.keys()) == [(3,), (1,), (2,)]
+        assert [g.tolist() for g in groups.values()] == [
+            [0, 2, 5],
+            [1, 4],
+            [3],
+        ]
+        assert groupify_columns({"a": numpy.array([])}, "a") == {}
+
+    def test_ndarray_unorderable(self):
+        numpy = pytest.importorskip("numpy")
+        column = numpy.array([1, "a", None, 1], dtype=object)
+        groups = groupify_columns({"a": column}, "a")
+        assert list(groups.items()) == [
+            ((1,), [0, 3]),
+            (("a",), [1]),
+            ((None,), [2]),
+        ]
+
+
 class TestIsListy(object):
     def test_sized_builtin(self):
         sized = [
@@ -421,6 +1675,401 @@ class TestListify(object):
         assert [a] == listify(a)
 
 
+class TestListview(object):
+    @pytest.mark.parametrize(
+        "x",
+        [
+            [1, 2],
+            (1, 2),
+            range(2),
+            array("d", [1.0, 2.0]),
+            bytearray(b"ab"),
+            memoryview(b"ab"),
+            deque([1, 2]),
+        ],
+    )
+    def test_not_copied(self, x):
+        assert listview(x) is x
+
+    @pytest.mark.parametrize(
+        "x,expected",
+        [
+            (None, ()),
+            ("a", ("a",)),
+            (b"a", (b"a",)),
+            (1, (1,)),
+            ({"a": 1}, ({"a": 1},)),
+            (set([1]), [1]),
+            (frozenset([1]), [1]),
+        ],
+    )
+    def test_other_values(self, x, expected):
+        assert listview(x) == expected
+
+    def test_ndarray(self):
+        np = pytest.importorskip("numpy")
+        x = np.arange(3)
+        assert listview(x) is x
+        view = listview(x, minlen=5, default=-1)
+        assert list(view) == [0, 1, 2, -1, -1]
+        x[0] = 9
+        assert view[0] == 9
+
+    def test_minlen(self):
+        x = [1, 2]
+        assert listview(x, minlen=2) is x
+        view = listview(x, minlen=4, default="pad")
+        assert isinstance(view, paddedview)
+        assert list(view) == [1, 2, "pad", "pad"]
+        assert x == [1, 2]
+        assert list(listview(None, minlen=2)) == [None, None]
+        assert list(listview("a", minlen=2)) == ["a", None]
+
+
+class TestChunkify(object):
+    def test_sequences(self):
+        x = [1, 2, 3, 4, 5]
+        chunks = list(chunkify(x, 2))
+        assert all(isinstance(c, sliceview) for c in chunks)
+        assert [list(c) for c in chunks] == [[1, 2], [3, 4], [5]]
+        x[0] = 9
+        assert chunks[0][0] == 9
+        assert [list(c) for c in chunkify((1, 2, 3), 3)] == [[1, 2, 3]]
+        assert [list(c) for c in chunkify(deque([1, 2, 3]), 2)] == [
+            [1, 2],
+            [3],
+        ]
+
+    def test_buffers(self):
+        for x in [b"abcde", bytearray(b"abcde"), memoryview(b"abcde")]:
+            chunks = list(chunkify(x, 2))
+            assert all(isinstance(c, memoryview) for c in chunks)
+            assert [c.tobytes() for c in chunks] == [b"ab", b"cd", b"e"]
+        data = bytearray(b"abc")
+        chunk = next(chunkify(data, 2))
+        data[0:1] = b"z"
+        assert chunk.tobytes() == b"zb"
+        numbers = array("d", [1.0, 2.0, 3.0])
+        assert [c.tolist() for c in chunkify(numbers, 2)] == [
+            [1.0, 2.0],
+            [3.0],
+        ]
+
+    def test_ranges(self):
+        assert list(chunkify(range(5), 2)) == [
+            range(0, 2),
+            range(2, 4),
+            range(4, 5),
+        ]
+
+    def test_ndarray(self):
+        np = pytest.importorskip("numpy")
+        x = np.arange(5)
+        chunks = list(chunkify(x, 2))
+        assert [c.tolist() for c in chunks] == [[0, 1], [2, 3], [4]]
+        assert all(c.base is x for c in chunks)
+
+    def test_iterators(self):
+        pulled = []
+
+        def generate():
+            for n in range(5):
+                pulled.append(n)
+                yield n
+
+        chunks = chunkify(generate(), 2)
+        assert next(chunks) == [0, 1]
+        assert pulled == [0, 1]
+        assert list(chunks) == [[2, 3], [4]]
+        assert list(chunkify(set([1]), 2)) == [[1]]
+        assert list(chunkify(iter([]), 2)) == []
+
+    def test_unbounded(self):
+        chunks = chunkify(count(), 3)
+        assert [next(chunks) for _ in range(2)] == [[0, 1, 2], [3, 4, 5]]
+
+    def test_single_items(self):
+        assert list(chunkify(None, 2)) == []
+        assert list(chunkify("abc", 2)) == [("abc",)]
+        assert list(chunkify({"a": 1}, 2)) == [({"a": 1},)]
+        assert list(chunkify(1, 2)) == [(1,)]
+
+    def test_empty(self):
+        assert list(chunkify([], 2)) == []
+        assert list(chunkify(b"", 2)) == []
+
+    def test_cls(self):
+        assert list(chunkify((1, 2, 3), 2, cls=list)) == [[1, 2], [3]]
+        assert list(chunkify(b"abc", 2, cls=bytes)) == [b"ab", b"c"]
+
+    def test_invalid_size(self):
+        pytest.raises(ValueError, chunkify, [1], 0)
+
+
+class TestSliceview(object):
+    def test_indexing(self):
+        view = sliceview("abcdef", 1, 5)
+        assert len(view) == 4
+        assert [view[i] for i in range(-4, 4)] == list("bcde") * 2
+        pytest.raises(IndexError, view.__getitem__, 4)
+        pytest.raises(IndexError, view.__getitem__, -5)
+        assert list(view[1:3]) == ["c", "d"]
+        assert isinstance(view[1:], sliceview)
+        assert view[::2] == ["b", "d"]
+        assert view[::-1] == list("edcb")
+        assert "c" in view and "a" not in view
+        assert view.index("d") == 2
+
+    def test_clamped(self):
+        assert list(sliceview([1, 2], 1, 10)) == [2]
+        assert list(sliceview([1, 2], -1, None)) == [2]
+        assert len(sliceview([1, 2], 5, 10)) == 0
+        assert len(sliceview([1, 2], 2, 1)) == 0
+
+    def test_repr(self):
+        assert repr(sliceview([1], 0, 1)) == "sliceview([1], 0, 1)"
+
+
+class TestLazylist(object):
+    def counted(self, iterable):
+        pulled = []
+
+        def generate():
+            for item in iterable:
+                pulled.append(item)
+                yield item
+
+        return lazylist(generate()), pulled
+
+    def test_indexing_is_lazy(self):
+        x, pulled = self.counted(range(10))
+        assert x[2] == 2
+        assert pulled == [0, 1, 2]
+        assert x[1] == 1
+        assert x[0:4] == [0, 1, 2, 3]
+        assert pulled == [0, 1, 2, 3]
+        pytest.raises(IndexError, x.__getitem__, 10)
+        assert len(pulled) == 10
+
+    def test_unbounded(self):
+        x = lazylist(count())
+        assert x[1000] == 1000
+        assert x[5:8] == [5, 6, 7]
+        assert x[3::3][:3] == [3, 6, 9]
+        assert next(iter(x[10:])) == 10
+        assert 50 in x
+        assert x.index(7) == 7
+        assert x
+
+    def test_negative_indices_force(self):
+        x, pulled = self.counted(range(5))
+        assert x[-1] == 4
+        assert len(pulled) == 5
+        x, pulled = self.counted(range(5))
+        assert x[-3:-1] == [2, 3]
+        assert x[::-2] == [4, 2, 0]
+        assert len(x) == 5
+
+    def test_iteration(self):
+        x, pulled = self.counted(range(4))
+        first, second = iter(x), iter(x)
+        assert [next(first), next(first)] == [0, 1]
+        assert list(second) == [0, 1, 2, 3]
+        assert list(first) == [2, 3]
+        assert pulled == [0, 1, 2, 3]
+        assert list(reversed(x)) == [3, 2, 1, 0]
+
+    def test_empty(self):
+        x = lazylist(iter([]))
+        assert not x
+        assert len(x) == 0
+        assert list(x) == []
+        assert repr(x) == "lazylist([])"
+        assert not lazylist()
+
+    def test_repr(self):
+        x = lazylist(iter([1, 2, 3]))
+        assert repr(x) == "lazylist([...])"
+        x[0]
+        assert repr(x) == "lazylist([1, ...])"
+        len(x)
+        assert repr(x) == "lazylist([1, 2, 3])"
+
+    def test_listify(self):
+        x = lazylist(n for n in range(3))
+        assert is_listy(x)
+        assert listify(x) == [0, 1, 2]
+        assert listview(x) is x
+        assert uniquify(lazylist(iter([1, 1, 2]))) == [1, 2]
+
+
+class TestPaddedview(object):
+    def test_indexing(self):
+        view = paddedview((1, 2), 4, 0)
+        assert len(view) == 4
+        assert [view[i] for i in range(-4, 4)] == [1, 2, 0, 0] * 2
+        pytest.raises(IndexError, view.__getitem__, 4)
+        pytest.raises(IndexError, view.__getitem__, -5)
+        assert view[1:] == [2, 0, 0]
+        assert view[::-2] == [0, 2]
+        assert view.index(0) == 2
+        assert view.count(0) == 2
+        assert 2 in view
+        assert list(reversed(view)) == [0, 0, 2, 1]
+
+    def test_longer_than_minlen(self):
+        view = paddedview([1, 2, 3], 2)
+        assert len(view) == 3
+        assert list(view) == [1, 2, 3]
+        assert view[-1] == 3
+
+    def test_reflects_changes(self):
+        seq = [1]
+        view = paddedview(seq, 3)
+        seq.extend([2, 3, 4])
+        assert list(view) == [1, 2, 3, 4]
+        del seq[:]
+        assert list(view) == [None, None, None]
+
+    def test_repr(self):
+        assert repr(paddedview([1], 2, 0)) == "paddedview([1], 2, 0)"
+
+
+class TestFrozendict(object):
+    def test_mapping(self):
+        d = frozendict([("a", 1)], b=2)
+        assert d["a"] == 1
+        assert "b" in d and "c" not in d
+        assert sorted(d) == ["a", "b"]
+        assert len(d) == 2
+        assert d.get("c", 3) == 3
+        assert repr(frozendict(a=1)) == "frozendict({'a': 1})"
+
+    def test_immutable(self):
+        d = frozendict(a=1)
+        with pytest.raises(TypeError):
+            d["a"] = 2
+        with pytest.raises(TypeError):
+            del d["a"]
+        pytest.raises(AttributeError, setattr, d, "x", 1)
+        assert not hasattr(d, "update")
+
+    def test_hash_and_equality(self):
+        d = frozendict(a=1, b=2)
+        assert d._hash is None
+        assert hash(d) == hash(frozendict(b=2, a=1))
+        assert d._hash is not None
+        assert d == {"a": 1, "b": 2}
+        assert d == OrderedDict([("b", 2), ("a", 1)])
+        assert d != frozendict(a=1)
+        assert d != frozendict(a=1, b=3)
+        assert d != [("a", 1), ("b", 2)]
+        assert len({d, frozendict(a=1, b=2), frozendict(a=1)}) == 2
+        pytest.raises(TypeError, hash, frozendict(a=[]))
+
+    def test_pickle(self):
+        d = frozendict(a=1)
+        hash(d)
+        other = pickle.loads(pickle.dumps(d))
+        assert other == d
+        assert other._hash is None
+
+    def test_mappify(self):
+        d = mappify({"a": 1}, cls=frozendict)
+        assert type(d) is frozendict
+        assert d == {"a": 1}
+        assert mappify(d, cls=frozendict) is d
+
+
+class TestFrozenlist(object):
+    def test_sequence(self):
+        x = frozenlist(iter([1, 2, 3]))
+        assert x[0] == 1 and x[-1] == 3
+        assert x[1:] == frozenlist([2, 3])
+        assert type(x[1:]) is frozenlist
+        assert len(x) == 3
+        assert 2 in x
+        assert list(x) == [1, 2, 3]
+        assert x.index(3) == 2
+        assert repr(x) == "frozenlist([1, 2, 3])"
+        assert frozenlist() == []
+
+    def test_immutable(self):
+        x = frozenlist([1])
+        with pytest.raises(TypeError):
+            x[0] = 2
+        pytest.raises(AttributeError, setattr, x, "y", 1)
+        assert not hasattr(x, "append")
+
+    def test_hash_and_equality(self):
+        x = frozenlist([1, 2])
+        assert hash(x) == hash((1, 2))
+        assert x._hash is not None
+        assert x == [1, 2] and x == (1, 2) and x == frozenlist((1, 2))
+        assert x != [2, 1] and x != frozenlist([1])
+        assert x != {1, 2}
+        assert {x: 1}[frozenlist([1, 2])] == 1
+        pytest.raises(TypeError, hash, frozenlist([[]]))
+
+    def test_pickle(self):
+        x = frozenlist(["a"])
+        hash(x)
+        other = pickle.loads(pickle.dumps(x))
+        assert other == x
+        assert other._hash is None
+
+    def test_listify(self):
+        x = listify("a", cls=frozenlist)
+        assert type(x) is frozenlist
+        assert x == ["a"]
+        assert listify(x, cls=frozenlist) == x
+        assert listify(x) == ["a"]
+
+
+class TestFreeze(object):
+    def test_nested(self):
+        value = {
+            "list": [1, {"a": [2]}],
+            "set": set([3]),
+            "tuple": (4, [5]),
+            "bytes": bytearray(b"6"),
+            "str": "7",
+        }
+        frozen = freeze(value)
+        assert type(frozen) is frozendict
+        assert type(frozen["list"]) is frozenlist
+        assert type(frozen["list"][1]) is frozendict
+        assert type(frozen["list"][1]["a"]) is frozenlist
+        assert type(frozen["set"]) is frozenset
+        assert frozen["tuple"] == (4, frozenlist([5]))
+        assert type(frozen["tuple"]) is tuple
+        assert frozen["bytes"] == b"6"
+        assert frozen == value
+        assert hash(frozen) == hash(freeze(value))
+
+    def test_namedtuple(self):
+        Point = namedtuple("Point", "x y")
+        frozen = freeze(Point([1], 2))
+        assert type(frozen) is Point
+        assert frozen == (frozenlist([1]), 2)
+        assert thaw(frozen) == Point([1], 2)
+
+    def test_scalars(self):
+        for value in [None, 1, "a", b"a", 1.5]:
+            assert freeze(value) is value
+            assert thaw(value) is value
+
+    def test_thaw(self):
+        value = {"a": [1, {"b": (2, [3])}], "c": set([4])}
+        thawed = thaw(freeze(value))
+        assert thawed == value
+        assert type(thawed["a"]) is list
+        assert type(thawed["a"][1]) is dict
+        assert type(thawed["a"][1]["b"][1]) is list
+        assert type(thawed["c"]) is set
+        thawed["a"].append(5)
+
+
 class TestNesteddefaultdict(object):
     def test_nesteddefaultdict(self):
         d1 = nesteddefaultdict()
@@ -431,6 +2080,379 @@ class TestNesteddefaultdict(object):
         assert isinstance(d3, defaultdict)
 
 
+class TestPathtree(object):
+    def test_paths(self):
+        t = pathtree()
+        t["a", "b"] = 1
+        t["a.c"] = 2
+        t[["d"]] = 3
+        t[4] = 4
+        assert t["a.b"] == 1
+        assert t[("a", "c")] == 2
+        assert t["d"] == t[("d",)] == 3
+        assert t[4] == 4
+        assert list(t) == [("a", "b"), ("a", "c"), ("d",), (4,)]
+        assert len(t) == 4
+
+    def test_sep(self):
+        t = pathtree(sep="/")
+        t["a/b.c"] = 1
+        assert t["a", "b.c"] == 1
+        t = pathtree(sep=None)
+        t["a.b"] = 1
+        assert list(t) == [("a.b",)]
+
+    def test_reads_do_not_allocate(self):
+        t = pathtree({"a.b": 1})
+        assert t.get("x.y.z") is None
+        assert "a.x" not in t
+        assert "a.b.c" not in t
+        pytest.raises(KeyError, t.__getitem__, "a")
+        pytest.raises(KeyError, t.__getitem__, "a.b.c")
+        pytest.raises(KeyError, t.__getitem__, ())
+        assert "a" not in t
+        assert t.to_dict() == {"a": {"b": 1}}
+
+    def test_overwrite(self):
+        t = pathtree()
+        t["a.b"] = 1
+        t["a.b"] = None
+        assert t["a.b"] is None
+        assert len(t) == 1
+
+    def test_conflicts(self):
+        t = pathtree({"a.b": 1})
+        pytest.raises(TypeError, t.__setitem__, "a", 2)
+        pytest.raises(TypeError, t.__setitem__, "a.b.c", 2)
+        pytest.raises(TypeError, t.__setitem__, (), 2)
+        assert dict(t) == {("a", "b"): 1}
+
+    def test_delete_prunes(self):
+        t = pathtree({"a.b.c": 1, "a.d": 2})
+        del t["a.b.c"]
+        assert t.to_dict() == {"a": {"d": 2}}
+        t["a.b"] = 3
+        assert t.pop("a.d") == 2
+        del t["a.b"]
+        assert t.to_dict() == {}
+        assert len(t) == 0
+        pytest.raises(KeyError, t.__delitem__, "a")
+        t["a.b"] = 1
+        pytest.raises(KeyError, t.__delitem__, "a")
+        pytest.raises(KeyError, t.__delitem__, "a.b.c")
+        pytest.raises(KeyError, t.__delitem__, ())
+
+    def test_iterprefix(self):
+        t = pathtree()
+        for path in ["a.b.c", "a.b.d", "a.e", "f"]:
+            t[path] = path
+        assert list(t.iterprefix("a")) == [
+            (("a", "b", "c"), "a.b.c"),
+            (("a", "b", "d"), "a.b.d"),
+            (("a", "e"), "a.e"),
+        ]
+        assert list(t.iterprefix("a.b.d")) == [(("a", "b", "d"), "a.b.d")]
+        assert list(t.iterprefix("a.x")) == []
+        assert list(t.iterprefix("f.x")) == []
+        assert len(list(t.iterprefix(()))) == 4
+
+    def test_to_and_from_dict(self):
+        nested = {"a": {"b": {"c": 1}, "d": [2]}, "e": 3, "f": {}}
+        t = pathtree.from_dict(nested)
+        assert len(t) == 3
+        assert t["a.d"] == [2]
+        assert t.to_dict() == nested
+        t["f.g"] = 4
+        assert t.to_dict()["f"] == {"g": 4}
+
+    def test_deep(self):
+        depth = 5000
+        path = tuple(range(depth))
+        t = pathtree()
+        t[path] = "leaf"
+        nested = t.to_dict()
+        other = pathtree.from_dict(nested)
+        assert other[path] == "leaf"
+        assert list(other.iterprefix(path[:10])) == [(path, "leaf")]
+        del other[path]
+        assert other.to_dict() == {}
+
+    def test_mapping_methods(self):
+        t = pathtree([("a.b", 1)])
+        assert t == pathtree({("a", "b"): 1})
+        assert t.setdefault("a.c", 2) == 2
+        t.update({"d": 3})
+        assert sorted(t.values()) == [1, 2, 3]
+        assert repr(pathtree({"a": 1})) == "pathtree({('a',): 1})"
+        t.clear()
+        assert len(t) == 0 and list(t) == []
+
+    def test_copy_and_pickle(self):
+        t = pathtree({"a/b": 1}, sep="/")
+        for other in [t.copy(), copy.copy(t), pickle.loads(pickle.dumps(t))]:
+            assert type(other) is pathtree
+            assert other.sep == "/"
+            assert other.to_dict() == {"a": {"b": 1}}
+            other["a/c"] = 2
+            assert "a/c" not in t
+
+
+def deep_dict(depth, leaf):
+    nested = leaf
+    for key in reversed(range(depth)):
+        nested = {key: nested}
+    return nested
+
+
+class TestDeepmerge(object):
+    def test_merge(self):
+        a = {"x": {"y": 1, "z": [1]}, "w": 0}
+        b = {"x": {"y": 2, "v": {"u": 3}}, "t": OrderedDict(s=4)}
+        merged = deepmerge([a, b])
+        assert merged == {
+            "x": {"y": 2, "z": [1], "v": {"u": 3}},
+            "w": 0,
+            "t": {"s": 4},
+        }
+        assert type(merged["t"]) is dict
+        assert merged["x"]["v"] is not b["x"]["v"]
+        assert a == {"x": {"y": 1, "z": [1]}, "w": 0}
+        assert deepmerge([]) == {}
+        assert deepmerge([a]) == a
+
+    def test_conflicts(self):
+        a = {"x": {"y": 1}, "z": [1]}
+        b = {"x": {"y": [2]}, "z": 2}
+        assert deepmerge([a, b], "first") == a
+        assert deepmerge([a, b], "last") == b
+        assert deepmerge([a, b], "concat") == {"x": {"y": [1, 2]}, "z": [1, 2]}
+        with pytest.raises(ValueError) as info:
+            deepmerge([a, {"x": {"y": 2}}], "error")
+        assert info.value.args[1] == ("x", "y")
+        assert deepmerge([a, {"x": {"w": 2}}], "error") == {
+            "x": {"y": 1, "w": 2},
+            "z": [1],
+        }
+
+    def test_map_and_value_conflict(self):
+        a = {"x": {"y": 1}}
+        b = {"x": 2}
+        assert deepmerge([a, b]) == {"x": 2}
+        assert deepmerge([b, a]) == {"x": {"y": 1}}
+        assert deepmerge([a, b], "first") == a
+        assert deepmerge([b, a], "first") == b
+        merged = deepmerge([b, a, {"x": {"z": 3}}])
+        assert merged == {"x": {"y": 1, "z": 3}}
+
+    def test_callable(self):
+        calls = []
+
+        def add(path, old, new):
+            calls.append(path)
+            return old + new
+
+        merged = deepmerge([{"a": {"b": 1}}, {"a": {"b": 2}}] * 2, add)
+        assert merged == {"a": {"b": 6}}
+        assert calls == [("a", "b")] * 3
+
+        replaced = deepmerge(
+            [{"a": {"b": 1}}, {"a": 2}], lambda path, old, new: {"c": new}
+        )
+        assert replaced == {"a": {"c": 2}}
+
+    def test_unknown_conflict(self):
+        pytest.raises(ValueError, deepmerge, [{}], "oldest")
+
+    def test_deep(self):
+        depth = 5000
+        merged = deepmerge(
+            [deep_dict(depth, {"a": 1}), deep_dict(depth, {"b": 2})]
+        )
+        assert flatten(merged) == {
+            tuple(range(depth)) + ("a",): 1,
+            tuple(range(depth)) + ("b",): 2,
+        }
+
+
+class TestFlatten(object):
+    def test_flatten(self):
+        nested = {"a": {"b": 1, "c": {"d": [2]}}, "e": 3, "f": {}}
+        assert flatten(nested) == {
+            ("a", "b"): 1,
+            ("a", "c", "d"): [2],
+            ("e",): 3,
+            ("f",): {},
+        }
+        assert flatten(nested, sep=".") == {
+            "a.b": 1,
+            "a.c.d": [2],
+            "e": 3,
+            "f": {},
+        }
+        assert flatten({1: {2: 3}}, sep="/") == {"1/2": 3}
+        assert flatten({}) == {}
+
+    def test_unflatten(self):
+        assert unflatten({("a", "b"): 1, ("a", "c"): 2, "d": 3, 4: 5}) == {
+            "a": {"b": 1, "c": 2},
+            "d": 3,
+            4: 5,
+        }
+        assert unflatten({"a.b": 1, "a.c.d": 2}, sep=".") == {
+            "a": {"b": 1, "c": {"d": 2}}
+        }
+        assert unflatten({"a.b": 1}) == {"a.b": 1}
+
+    def test_round_trip(self):
+        nested = {"a": {"b": 1, "c": {"d": [2]}}, "e": 3, "f": {}}
+        assert unflatten(flatten(nested)) == nested
+        assert unflatten(flatten(nested, "."), ".") == nested
+
+    def test_unflatten_conflicts(self):
+        for flat in [[("a", 1), ("a.b", 2)], [("a.b", 1), ("a", 2)]]:
+            pytest.raises(ValueError, unflatten, OrderedDict(flat), ".")
+        pytest.raises(ValueError, unflatten, {("a",): {}, ("a", "b"): 2})
+        pytest.raises(ValueError, unflatten, {(): 1})
+
+    def test_deep(self):
+        depth = 5000
+        nested = deep_dict(depth, "leaf")
+        flat = flatten(nested)
+        assert flat == {tuple(range(depth)): "leaf"}
+        assert flatten(unflatten(flat)) == flat
+
+
+class Collider(object):
+    def __init__(self, name, hash=0):
+        self.name = name
+        self.hash = hash
+
+    def __hash__(self):
+        return self.hash
+
+    def __eq__(self, other):
+        return isinstance(other, Collider) and self.name == other.name
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "Collider({0!r})".format(self.name)
+
+
+class TestPersistentmap(object):
+    def test_mapping(self):
+        m = persistentmap({"a": 1}, b=2)
+        assert m["a"] == 1 and m["b"] == 2
+        assert "a" in m and "c" not in m
+        assert sorted(m) == ["a", "b"]
+        assert len(m) == 2
+        assert m == {"a": 1, "b": 2}
+        assert m.get("c") is None
+        pytest.raises(KeyError, m.__getitem__, "c")
+        assert persistentmap([("a", 1), ("a", 2)]) == {"a": 2}
+        assert len(persistentmap()) == 0
+        assert repr(persistentmap(a=1)) == "persistentmap({'a': 1})"
+
+    def test_immutable(self):
+        m = persistentmap(a=1)
+        with pytest.raises(TypeError):
+            m["a"] = 2
+        pytest.raises(AttributeError, setattr, m, "x", 1)
+
+    def test_versions(self):
+        m1 = persistentmap(a=1)
+        m2 = m1.set("b", 2)
+        m3 = m2.set("a", 3)
+        m4 = m3.delete("b")
+        assert m1 == {"a": 1}
+        assert m2 == {"a": 1, "b": 2}
+        assert m3 == {"a": 3, "b": 2}
+        assert m4 == {"a": 3}
+        assert len(m4) == 1
+        assert m2.set("b", 2) is m2
+        pytest.raises(KeyError, m4.delete, "b")
+
+    @pytest.mark.parametrize("collide", [False, True])
+    def test_random_operations(self, collide):
+        rng = random.Random(0)
+        expected = {}
+        m = persistentmap()
+        versions = []
+        for i in range(5000):
+            n = rng.randrange(500)
+            key = Collider(n, n % 7) if collide else n
+            if rng.random() < 0.3 and key in expected:
+                del expected[key]
+                m = m.delete(key)
+            else:
+                expected[key] = i
+                m = m.set(key, i)
+            if i % 500 == 0:
+                versions.append((m, dict(expected)))
+            assert len(m) == len(expected)
+        assert dict(m.items()) == expected
+        for key in expected:
+            assert m[key] == expected[key]
+        for version, contents in versions:
+            assert dict(version.items()) == contents
+        for key in list(expected):
+            m = m.delete(key)
+        assert len(m) == 0 and list(m) == []
+
+    def test_negative_and_large_hashes(self):
+        keys = [-1, -2, 2 ** 64, -(2 ** 64), 2 ** 63 - 1, Collider("x", -5)]
+        m = persistentmap((k, k) for k in keys)
+        assert all(m[k] is k for k in keys)
+        for k in keys:
+            m = m.delete(k)
+        assert len(m) == 0
+
+    def test_nested(self):
+        nested = {"a": {"b": {"c": 1}}, "d": {"e": 2}, "f": 3}
+        m = persistentmap.from_dict(nested)
+        assert isinstance(m["a"]["b"], persistentmap)
+        assert m.to_dict() == nested
+        assert m.get_in(("a", "b", "c")) == 1
+        assert m.get_in("f") == 3
+        assert m.get_in(["a", "x", "c"], "missing") == "missing"
+        assert m.get_in(("f", "x")) is None
+
+        m2 = m.set_in(("a", "b", "c"), 10)
+        assert m.get_in(("a", "b", "c")) == 1
+        assert m2.get_in(("a", "b", "c")) == 10
+        assert m2["d"] is m["d"]
+        m3 = m2.set_in(["x", "y"], 4)
+        assert m3.to_dict()["x"] == {"y": 4}
+        pytest.raises(TypeError, m3.set_in, ("f", "g"), 1)
+        pytest.raises(ValueError, m3.set_in, (), 1)
+
+        m4 = m3.delete_in(("a", "b", "c"))
+        assert m4.to_dict()["a"] == {"b": {}}
+        assert m3.get_in(("a", "b", "c")) == 10
+        pytest.raises(KeyError, m4.delete_in, ("a", "b", "c"))
+        pytest.raises(KeyError, m4.delete_in, ("f", "g"))
+
+    def test_from_dict_keeps_persistentmaps(self):
+        inner = persistentmap(b=1)
+        m = persistentmap.from_dict({"a": inner})
+        assert m["a"] is inner
+
+    def test_deep(self):
+        depth = 3000
+        nested = deep_dict(depth, "leaf")
+        m = persistentmap.from_dict(nested)
+        path = tuple(range(depth))
+        assert m.get_in(path) == "leaf"
+        assert flatten(m.set_in(path, "new").to_dict()) == {path: "new"}
+
+    def test_pickle(self):
+        m = persistentmap.from_dict({"a": {"b": 1}})
+        other = pickle.loads(pickle.dumps(m))
+        assert type(other) is persistentmap
+        assert other.to_dict() == {"a": {"b": 1}}
+
+
 class TestReadableJoin(object):
     @pytest.mark.parametrize(
         "xs,args,expected",
@@ -468,6 +2490,102 @@ class TestIsMappy(object):
         assert is_mappy(x) == expected
 
 
+class TestRegisterTypes(object):
+    def test_register_listy(self):
+        class Pair(tuple):
+            pass
+
+        class Triple(Pair):
+            pass
+
+        assert is_listy(Triple((1, 2, 3)))
+        register_listy(Pair, False)
+        try:
+            assert not is_listy(Pair((1, 2)))
+            assert not is_listy(Triple((1, 2, 3)))
+            assert listify(Triple((1, 2, 3))) == [(1, 2, 3)]
+            register_listy(Triple)
+            assert not is_listy(Pair((1, 2)))
+            assert is_listy(Triple((1, 2, 3)))
+        finally:
+            register_listy(Pair, None)
+            register_listy(Triple, None)
+        assert is_listy(Pair((1, 2)))
+
+    def test_register_mappy(self):
+        class Record(object):
+            def __init__(self, **fields):
+                self.fields = fields
+
+            def keys(self):
+                return self.fields.keys()
+
+            def __getitem__(self, key):
+                return self.fields[key]
+
+        record = Record(a=1)
+        assert not is_mappy(record)
+        register_mappy(Record)
+        try:
+            assert is_mappy(record)
+            assert mappify(record, cls=dict) == {"a": 1}
+        finally:
+            register_mappy(Record, None)
+        assert not is_mappy(record)
+
+    def test_register_non_class(self):
+        pytest.raises(TypeError, register_listy, [])
+        pytest.raises(TypeError, register_mappy, "dict")
+
+    def test_abc_registration_invalidates(self):
+        class Table(object):
+            def __len__(self):
+                return 0
+
+            def __iter__(self):
+                return iter([])
+
+            def __getitem__(self, key):
+                raise KeyError(key)
+
+        assert is_listy(Table())
+        assert not is_mappy(Table())
+        Mapping.register(Table)
+        assert not is_listy(Table())
+        assert is_mappy(Table())
+
+    def test_proxy_not_cached(self):
+        class Proxy(object):
+            def __init__(self, target):
+                self.target = target
+
+            @property
+            def __class__(self):
+                return type(self.target)
+
+        assert is_listy(Proxy([]))
+        assert not is_listy(Proxy(1))
+        assert is_mappy(Proxy({}))
+        assert not is_mappy(Proxy([]))
+
+    def test_cache_is_bounded(self, monkeypatch):
+        import pockets.collections
+
+        monkeypatch.setattr(pockets.collections, "_MAX_CACHED_TYPES", 8)
+        first = namedtuple("Point", "x y")
+        assert is_listy(first(1, 2))
+        assert not is_mappy(first(1, 2))
+        first = weakref.ref(first)
+        for i in range(20):
+            point = namedtuple("Point", "x y")(1, 2)
+            assert is_listy(point)
+            assert not is_mappy(point)
+        gc.collect()
+        assert first() is None
+        assert len(pockets.collections._listy_types) <= 8
+        assert len(pockets.collections._mappy_types) <= 8
+
+
 class TestMappify(object):
     def test_default(self):
         assert {"a": None} == mappify(["a"], default=None)
@@ -581,6 +2699,64 @@ class TestMappify(object):
         pytest.raises(TypeError, mappify, object)
 
 
+class TestIuniquify(object):
+    @pytest.mark.parametrize("mode", ["exact", "lru", "bloom"])
+    def test_modes(self, mode):
+        items = ["a", "z", "a", "b", "a", "y", "a", "c", "a", "x"]
+        result = list(iuniquify(iter(items), mode=mode))
+        assert result == ["a", "z", "b", "y", "c", "x"]
+
+    @pytest.mark.parametrize("mode", ["exact", "lru", "bloom"])
+    def test_lazy(self, mode):
+        pulled = []
+
+        def generate():
+            for n in count():
+                pulled.append(n)
+                yield n // 2
+
+        unique = iuniquify(generate(), mode=mode)
+        assert [next(unique), next(unique)] == [0, 1]
+        assert pulled == [0, 1, 2]
+
+    def test_key(self):
+        items = [{"a": 1, "b": 1}, {"a": 1, "b": 2}, {"a": 2, "b": 1}]
+        assert list(iuniquify(items, "a")) == [items[0], items[2]]
+        assert list(iuniquify(reminders, "where")) == reminders[:2]
+        strings = ["ASDF", "asdf", "ZXCV", "zxcv"]
+        assert list(iuniquify(strings, str.lower)) == ["ASDF", "ZXCV"]
+
+    def test_lru_window(self):
+        items = [1, 2, 3, 1, 4, 5, 1, 2]
+        unique = iuniquify(items, mode="lru", maxsize=3)
+        assert list(unique) == [1, 2, 3, 4, 5, 2]
+        unique = iuniquify(items, mode="lru", maxsize=1)
+        assert list(unique) == items
+
+    def test_bloom_error_rate(self):
+        n = 20000
+        unique = list(iuniquify(range(n), mode="bloom", maxsize=n))
+        assert len(unique) > n * 0.995
+        again = list(iuniquify(list(range(n)) * 2, mode="bloom", maxsize=n))
+        assert len(again) == len(unique)
+
+    @pytest.mark.parametrize("mode", ["exact", "lru", "bloom"])
+    def test_unhashable_keys(self, mode):
+        items = [{"a": [1]}, {"a": [2]}, {"a": [1]}, {"a": (1,)}]
+        result = list(iuniquify(items, "a", mode=mode))
+        assert result == [items[0], items[1], items[3]]
+        items = [frozenset([1]), {1}]
+        assert list(iuniquify(items, mode=mode)) == items
+
+    def test_invalid(self):
+        pytest.raises(ValueError, iuniquify, [], mode="fifo")
+        pytest.raises(ValueError, iuniquify, [], mode="lru", maxsize=0)
+        for error_rate in [0, 1, 1.5]:
+            pytest.raises(
+                ValueError, iuniquify, [], mode="bloom", error_rate=error_rate
+            )
+
+
 class TestUniquify(object):
     def test_uniquify(self):
         pytest.raises(TypeError, uniquify, None)
@@ -607,6 +2783,81 @@ class TestUniquify(object):
             key="day",
         )
 
+    def test_dict_key(self):
+        records = [
+            {"id": 1, "v": "a"},
+            {"id": 2, "v": "b"},
+            {"id": 1, "v": "c"},
+        ]
+        assert ["a", "b"] == [r["v"] for r in uniquify(records, key="id")]
+
+    def test_unhashable_keys(self):
+        records = [
+            {"tags": ["a", "b"], "v": 1},
+            {"tags": {"a": 1}, "v": 2},
+            {"tags": "a", "v": 3},
+            {"tags": ["a", "b"], "v": 4},
+            {"tags": {"a": 1}, "v": 5},
+            {"tags": ("a", "b"), "v": 6},
+        ]
+        unique = uniquify(records, key="tags")
+        assert [r["v"] for r in unique] == [1, 2, 3, 6]
+        assert uniquify([[1], [2], [1], {3: [4]}, {3: [4]}]) == [
+            [1],
+            [2],
+            {3: [4]},
+        ]
+
+    def test_set_keys(self):
+        assert uniquify([{1}, {1}, {2}, frozenset([2])]) == [
+            {1},
+            {2},
+            frozenset([2]),
+        ]
+        records = [
+            {"tags": {"a", "b"}, "v": 1},
+            {"tags": {"b", "a"}, "v": 2},
+            {"tags": {"c"}, "v": 3},
+        ]
+        unique = uniquify(records, key="tags")
+        assert [r["v"] for r in unique] == [1, 3]
+        assert list(iuniquify(records, key="tags")) == unique
+        assert uniquify([frozenset([1]), {1}]) == [frozenset([1]), {1}]
+        assert uniquify([frozenset([1]), {1}, [2]]) == [
+            frozenset([1]),
+            {1},
+            [2],
+        ]
+
+    def test_orderable_unhashable_keys(self):
+        class Version(object):
+            __hash__ = None
+
+            def __init__(self, n):
+                self.n = n
+
+            def __eq__(self, other):
+                return self.n == other.n
+
+            def __ne__(self, other):
+                return self.n != other.n
+
+            def __lt__(self, other):
+                return self.n < other.n
+
+        versions = [Version(n) for n in [3, 1, 3, 2, 1]]
+        unique = uniquify(versions + [1, [1]])
+        assert unique == versions[:2] + versions[3:4] + [1, [1]]
+        assert unique[0] is versions[0]
+        assert unique[1] is versions[1]
+
+    def test_unorderable_unhashable_keys(self):
+        class Point(object):
+            __hash__ = None
+
+        with pytest.raises(TypeError):
+            uniquify([Point(), Point()])
+
     def test_cls(self):
         x = ["a", "a"]
         y = uniquify(x, cls=deque)